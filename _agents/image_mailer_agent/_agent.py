@@ -11,6 +11,7 @@ import traceback
 import re
 import html
 import threading
+import contextvars
 import queue
 import base64
 import urllib.parse
@@ -115,10 +116,10 @@ def direct_process_request(query):
     if not image_description:
         image_description = "一张小狗图片"
     
-    # 启动图片生成和邮件发送（后台处理）
+    # 启动图片生成和邮件发送（后台处理），带上本请求的上下文，生成调用按 agent 优先级排队
     generate_thread = threading.Thread(
-        target=process_image_and_email,
-        args=(image_description, recipient)
+        target=contextvars.copy_context().run,
+        args=(process_image_and_email, image_description, recipient)
     )
     generate_thread.daemon = True
     generate_thread.start()
@@ -1,7 +1,8 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from model._llms import model, ModelTimeoutError, ModelConnectionError
+from model._llms import ModelTimeoutError, ModelConnectionError
+from model._router import get_model
 from langchain.agents import AgentExecutor, create_openai_functions_agent
 import json
 import re
@@ -33,7 +34,7 @@ def agent_init():
         
         # 创建OpenAI Functions Agent
         agent = create_openai_functions_agent(
-            llm=model,
+            llm=get_model("agent"),
             tools=tools,
             prompt=functions_prompt
         )
@@ -1,7 +1,8 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from model._llms import model, ModelTimeoutError, ModelConnectionError
+from model._llms import ModelTimeoutError, ModelConnectionError
+from model._router import get_model
 # 移除原有的AgentExecutor导入
 from langchain.agents import create_openai_functions_agent
 import json
@@ -257,7 +258,7 @@ def agent_init():
         
         # 创建OpenAI Functions Agent
         agent = create_openai_functions_agent(
-            llm=model,
+            llm=get_model("agent"),
             tools=tools,
             prompt=functions_prompt
         )
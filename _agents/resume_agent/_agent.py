@@ -1,6 +1,6 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from model._llms import model
+from model._router import get_model
 from langchain.schema import SystemMessage, HumanMessage
 
 from _tools._pdf.read import read_pdf
@@ -103,7 +103,7 @@ def analyze_resume(resume_path):
         HumanMessage(content=f"请根据以下简历内容，生成结构化面试问题和标准答案：\n\n{resume_text}")
     ]
     
-    result = model(messages).content
+    result = get_model("generate")(messages).content
     print("LLM 输出：", result)
 
     questions, answers = parse_qa_from_result(result)
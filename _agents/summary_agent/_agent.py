@@ -3,7 +3,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 
 from langchain.schema import SystemMessage, HumanMessage
 from _agents.summary_agent._functions_prompt import SUMMARY_EVAL_PROMPT
-from model._llms import model
+from model._router import get_model
 import json
 import re
 
@@ -59,7 +59,7 @@ def generate_summary_and_score(questions, user_answers, resume_text, standard_an
         ]
 
         print("正在生成总结和评分...")
-        response = model(messages)
+        response = get_model("reasoning")(messages)
         
         # 保存原始响应内容
         raw_content = response.content
@@ -0,0 +1,95 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import argparse
+import time
+import numpy as np
+import faiss
+from _tools._rag._quantize import QuantizedVectorStore, build_quantized_index, ensure_raw_vectors
+
+# 量化存储基准测试：对比 float32 平面索引与 SQ8 / PQ 的内存占用、recall@k 以及精排带来的收益
+# 用法: python _benchmark/_quantize_bench.py --n 20000 --dim 1536 --k 5
+#      python _benchmark/_quantize_bench.py --store _tools/_rag/vector_store   # 使用真实知识库向量
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int = 0):
+    """生成带簇结构的单位向量，近似文本向量的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def store_vectors(store_path: str):
+    """读取知识库各目录的原始向量"""
+    parts = []
+    for name in sorted(os.listdir(store_path)):
+        store_dir = os.path.join(store_path, name)
+        if os.path.isdir(store_dir):
+            parts.append(np.load(ensure_raw_vectors(store_dir)))
+    return np.concatenate(parts).astype(np.float32)
+
+
+def recall_at_k(truth, found, k: int) -> float:
+    hits = sum(len(set(t[:k]) & set(f[:k])) for t, f in zip(truth, found))
+    return hits / (len(truth) * k)
+
+
+def run(vectors, queries, k: int, rerank_factors: list, pq_m: int):
+    n, dim = vectors.shape
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(vectors)
+    start = time.perf_counter()
+    _, truth = flat.search(queries, k)
+    flat_latency = (time.perf_counter() - start) / len(queries) * 1000
+    float_bytes = n * dim * 4
+
+    rows = [("flat", "-", float_bytes, 1.0, 1.0, flat_latency)]
+    for mode in ("sq8", "pq"):
+        index = build_quantized_index(dim, n, mode, pq_m)
+        index.train(vectors[::max(1, n // 20000)])
+        index.add(vectors)
+        code_bytes = index.sa_code_size() * n
+        for factor in rerank_factors:
+            store = QuantizedVectorStore(None, index, list(range(n)), [(0, vectors)], rerank_factor=factor)
+            found = []
+            start = time.perf_counter()
+            for q in queries:
+                found.append([doc for doc, _ in store.similarity_search_with_score_by_vector(q, k)])
+            latency = (time.perf_counter() - start) / len(queries) * 1000
+            rows.append((mode, factor, code_bytes, code_bytes / float_bytes,
+                         recall_at_k(truth, found, k), latency))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量化向量存储基准测试")
+    parser.add_argument("--n", type=int, default=20000, help="合成向量数量")
+    parser.add_argument("--dim", type=int, default=1536, help="向量维度（text-embedding-v2 为1536）")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--pq-m", type=int, default=64, help="PQ子空间数")
+    parser.add_argument("--rerank", type=int, nargs="+", default=[1, 4, 8], help="精排候选倍数，1表示不精排")
+    parser.add_argument("--store", type=str, default=None, help="使用真实向量存储目录代替合成数据")
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = store_vectors(args.store)
+    else:
+        vectors = synthetic_vectors(args.n, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    # 查询取自数据点加噪声，模拟与已有内容相近的问题
+    picks = rng.integers(0, len(vectors), size=args.queries)
+    queries = vectors[picks] + 0.05 * rng.normal(size=(args.queries, vectors.shape[1])).astype(np.float32)
+    queries = queries.astype(np.float32)
+
+    print(f"向量数: {len(vectors)}，维度: {vectors.shape[1]}，查询数: {len(queries)}，k={args.k}")
+    print(f"{'模式':<6}{'精排倍数':>8}{'内存(MB)':>12}{'占比':>8}{'recall@k':>10}{'延迟(ms)':>10}")
+    for mode, factor, nbytes, ratio, recall, latency in run(vectors, queries, args.k, args.rerank, args.pq_m):
+        print(f"{mode:<6}{str(factor):>8}{nbytes / 1024 / 1024:>12.2f}{ratio:>8.1%}{recall:>10.3f}{latency:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
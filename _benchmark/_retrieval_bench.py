@@ -0,0 +1,267 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 基准测试全程使用本地embedding，不会访问任何模型服务
+os.environ.setdefault("EMBEDDING_PROVIDER", "local")
+import argparse
+import hashlib
+import json
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from model._embeddings import HashingEmbeddings
+from _tools._rag._rag_all import split_text
+from _tools._rag._chunker import estimate_tokens
+from _tools._rag._quantize import QUANTIZE_MODES, load_quantized_store
+from _tools._vectorstore._backend import BACKENDS, create_backend
+
+# 离线检索基准测试：用固定语料和带标注的问题集，评估切片参数、索引类型和相似度阈值的效果
+# 用法: python _benchmark/_retrieval_bench.py --splitter char --chunk-size 100 --chunk-overlap 10 --index flat
+#      python _benchmark/_retrieval_bench.py --splitter both    # 对比字符切片与token切片的切片数、embedding开销和检索质量
+#      python _benchmark/_retrieval_bench.py --compare _benchmark/results/<另一次提交>.json
+#      python _benchmark/_retrieval_bench.py --backend sqlite    # 在相同数据上对比不同的向量存储后端
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCH_DIR, "fixtures", "corpus")
+QUERIES_FILE = os.path.join(BENCH_DIR, "fixtures", "queries.jsonl")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+# DashScopeEmbeddings 每次请求最多25条文本；text-embedding-v2 单价（元/千token）
+EMBEDDING_BATCH_SIZE = 25
+EMBEDDING_PRICE_PER_1K = 0.0007
+
+
+def load_corpus():
+    corpus = {}
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+            corpus[name] = f.read()
+    return corpus
+
+
+def load_queries():
+    with open(QUERIES_FILE, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def chunk_spans(text: str, chunks: list):
+    """定位每个切片在原文中的区间，用于判断切片是否覆盖了标注答案"""
+    spans, cursor = [], 0
+    for chunk in chunks:
+        start = text.find(chunk, max(0, cursor - len(chunk)))
+        if start < 0:
+            start = text.find(chunk)
+        spans.append((start, start + len(chunk)) if start >= 0 else None)
+        if start >= 0:
+            cursor = start + len(chunk)
+    return spans
+
+
+def is_relevant(metadata: dict, page_content: str, query: dict, corpus: dict) -> bool:
+    if metadata.get("source") != query["source"]:
+        return False
+    answer = query["answer"]
+    if answer in page_content:
+        return True
+    # 答案被切到两个切片之间时，覆盖答案一半以上即视为相关
+    span = metadata.get("span")
+    if not span:
+        return False
+    a_start = corpus[query["source"]].find(answer)
+    overlap = min(span[1], a_start + len(answer)) - max(span[0], a_start)
+    return overlap * 2 >= len(answer)
+
+
+def split_params(args, splitter: str) -> dict:
+    if splitter == "char":
+        return {"chunk_size": args.chunk_size, "chunk_overlap": args.chunk_overlap}
+    return {"chunk_tokens": args.chunk_tokens, "overlap_tokens": args.overlap_tokens,
+            "min_chunk_tokens": args.min_chunk_tokens}
+
+
+def build_index(corpus: dict, embedder, args, splitter: str, work_dir: str):
+    """与线上流程一致：每个文件切片后单独保存，再按索引类型加载合并"""
+    start = time.perf_counter()
+    chunk_count = 0
+    ingest = {"embedding_requests": 0, "embedding_tokens": 0}
+    store_dirs = []
+    for name, text in corpus.items():
+        chunks, _ = split_text(text, splitter, **split_params(args, splitter))
+        ingest["embedding_requests"] += -(-len(chunks) // EMBEDDING_BATCH_SIZE)
+        ingest["embedding_tokens"] += sum(estimate_tokens(c) for c in chunks)
+        metadatas = [{"source": name, "span": span} for span in chunk_spans(text, chunks)]
+        store = FAISS.from_texts(chunks, embedding=embedder, metadatas=metadatas)
+        store_dir = os.path.join(work_dir, hashlib.md5("".join(chunks).encode()).hexdigest())
+        store.save_local(store_dir)
+        store_dirs.append(store_dir)
+        chunk_count += len(chunks)
+
+    if args.backend in BACKENDS:
+        # 后端只保存在内存中，与线上一样逐个目录增量写入
+        combined = create_backend(args.backend, embedding=embedder)
+        for store_dir in store_dirs:
+            store = FAISS.load_local(store_dir, embedder, allow_dangerous_deserialization=True)
+            docs = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+            combined.upsert([f"{os.path.basename(store_dir)}/{i}" for i in range(len(docs))],
+                            [doc.page_content for doc in docs],
+                            store.index.reconstruct_n(0, store.index.ntotal),
+                            [doc.metadata for doc in docs])
+        index_bytes = combined.memory_bytes()
+    elif args.index in QUANTIZE_MODES:
+        combined = load_quantized_store(store_dirs, embedder, args.index, rerank_factor=args.rerank_factor)
+        index_bytes = combined.memory_usage()["code_bytes"]
+    else:
+        stores = [FAISS.load_local(d, embedder, allow_dangerous_deserialization=True) for d in store_dirs]
+        combined = stores[0]
+        for store in stores[1:]:
+            combined.merge_from(store)
+        index_bytes = combined.index.ntotal * combined.index.d * 4
+    ingest["embedding_cost"] = ingest["embedding_tokens"] / 1000 * EMBEDDING_PRICE_PER_1K
+    return combined, chunk_count, time.perf_counter() - start, index_bytes, ingest
+
+
+def evaluate(store, embedder, queries: list, corpus: dict, k_values: list, thresholds: list):
+    max_k = max(k_values)
+    ranks, latencies, top1 = [], [], []
+    for q in queries:
+        vector = embedder.embed_query(q["query"])
+        start = time.perf_counter()
+        hits = store.similarity_search_with_score_by_vector(vector, k=max_k)
+        latencies.append(time.perf_counter() - start)
+        rank = next((i + 1 for i, (doc, _) in enumerate(hits)
+                     if is_relevant(doc.metadata, doc.page_content, q, corpus)), None)
+        ranks.append(rank)
+        top1.append((rank == 1, hits[0][1] if hits else float("inf")))
+
+    latencies_ms = np.array(latencies) * 1000
+    report = {
+        "recall": {f"@{k}": sum(1 for r in ranks if r and r <= k) / len(queries) for k in k_values},
+        "mrr": sum(1.0 / r for r in ranks if r) / len(queries),
+        "search_latency_ms": {
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+        },
+        "threshold": {},
+    }
+    # 模拟 search_vector_store 的判定：top1 距离低于阈值才返回内容
+    for t in thresholds:
+        answered = [(ok, score) for ok, score in top1 if score < t]
+        report["threshold"][str(t)] = {
+            "answered_rate": len(answered) / len(queries),
+            "correct_rate": sum(1 for ok, _ in answered if ok) / len(queries),
+            "wrong_rate": sum(1 for ok, _ in answered if not ok) / len(queries),
+        }
+    return report
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "local"
+
+
+def print_report(result: dict, baseline: dict = None):
+    def line(name, value, base=None, fmt="{:.3f}"):
+        text = f"  {name:<24}{fmt.format(value)}"
+        if base is not None:
+            text += f"   (基线 {fmt.format(base)}, 变化 {value - base:+.3f})"
+        print(text)
+
+    b = baseline or {}
+    print(f"版本: {result['revision']}  参数: {result['params']}")
+    line("切片数", result["chunks"], b.get("chunks"), "{}")
+    line("embedding请求数", result["ingest"]["embedding_requests"], b.get("ingest", {}).get("embedding_requests"), "{}")
+    line("embedding token数", result["ingest"]["embedding_tokens"], b.get("ingest", {}).get("embedding_tokens"), "{}")
+    line("embedding费用(元)", result["ingest"]["embedding_cost"], b.get("ingest", {}).get("embedding_cost"), "{:.6f}")
+    line("建索引耗时(s)", result["build_time_s"], b.get("build_time_s"))
+    line("索引内存(KB)", result["index_bytes"] / 1024, b.get("index_bytes", 0) / 1024 if b else None)
+    line("峰值RSS(MB)", result["peak_rss_mb"], b.get("peak_rss_mb"))
+    for k, v in result["recall"].items():
+        line(f"recall{k}", v, b.get("recall", {}).get(k))
+    line("MRR", result["mrr"], b.get("mrr"))
+    line("检索p50(ms)", result["search_latency_ms"]["p50"], b.get("search_latency_ms", {}).get("p50"))
+    line("检索p99(ms)", result["search_latency_ms"]["p99"], b.get("search_latency_ms", {}).get("p99"))
+    for t, v in result["threshold"].items():
+        base = b.get("threshold", {}).get(t, {})
+        line(f"阈值{t} 正确返回率", v["correct_rate"], base.get("correct_rate"))
+        line(f"阈值{t} 错误返回率", v["wrong_rate"], base.get("wrong_rate"))
+
+
+def run(args, splitter: str, corpus: dict, queries: list) -> dict:
+    embedder = HashingEmbeddings(dim=args.dim)
+    work_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        store, chunks, build_time, index_bytes, ingest = build_index(corpus, embedder, args, splitter, work_dir)
+        report = evaluate(store, embedder, queries, corpus, args.k, args.thresholds)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "revision": git_revision(),
+        "params": {"splitter": splitter, **split_params(args, splitter), "index": args.index,
+                   "backend": args.backend, "dim": args.dim},
+        "queries": len(queries),
+        "chunks": chunks,
+        "ingest": ingest,
+        "build_time_s": build_time,
+        "index_bytes": index_bytes,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        **report,
+    }
+
+
+def save_result(result: dict, label: str):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out_path = os.path.join(RESULTS_DIR, f"{label}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {out_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线知识库检索基准测试")
+    parser.add_argument("--splitter", default="char", choices=("char", "token", "both"),
+                        help="both: 以字符切片为基线对比token切片")
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--chunk-overlap", type=int, default=10)
+    parser.add_argument("--chunk-tokens", type=int, default=256)
+    parser.add_argument("--overlap-tokens", type=int, default=32)
+    parser.add_argument("--min-chunk-tokens", type=int, default=64)
+    parser.add_argument("--index", default="flat", choices=("flat",) + QUANTIZE_MODES)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--backend", default="langchain", choices=("langchain",) + BACKENDS,
+                        help="faiss/sqlite 使用可插拔后端检索，忽略 --index")
+    parser.add_argument("--dim", type=int, default=512, help="替身embedding维度")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 1.0, 1.2])
+    parser.add_argument("--label", default=None, help="结果文件名，默认使用当前git提交")
+    parser.add_argument("--compare", default=None, help="与之前保存的结果文件对比")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    queries = load_queries()
+
+    if args.splitter == "both":
+        char_result = run(args, "char", corpus, queries)
+        token_result = run(args, "token", corpus, queries)
+        print_report(token_result, char_result)
+        label = args.label or token_result["revision"]
+        save_result(char_result, f"{label}_char")
+        save_result(token_result, f"{label}_token")
+        return
+
+    result = run(args, args.splitter, corpus, queries)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    save_result(result, args.label or result["revision"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import argparse
+import json
+import time
+import numpy as np
+from _token import _price
+from _tools._rag._chunker import estimate_tokens
+
+# token计数基准测试：对比每次调用都加载分词器（原实现）、复用分词器逐条计数、批量计数和估算的单次耗时
+# 用法: python _benchmark/_token_bench.py --rounds 200
+#      python _benchmark/_token_bench.py --reload-rounds 3    # 同时测量原来每次加载分词器的耗时
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERIES_FILE = os.path.join(BENCH_DIR, "fixtures", "queries.jsonl")
+
+
+def load_pairs():
+    """用基准问题集构造 (问题, 回答) 对，回答取标注答案所在的语料段落"""
+    corpus_dir = os.path.join(BENCH_DIR, "fixtures", "corpus")
+    with open(QUERIES_FILE, encoding="utf-8") as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+    pairs = []
+    for q in queries:
+        with open(os.path.join(corpus_dir, q["source"]), encoding="utf-8") as f:
+            text = f.read()
+        paragraph = next((p for p in text.split("\n\n") if q["answer"] in p), q["answer"])
+        pairs.append((q["query"], paragraph))
+    return pairs
+
+
+def measure(name: str, fn, pairs: list, rounds: int) -> dict:
+    latencies = []
+    for _ in range(rounds):
+        for question, answer in pairs:
+            start = time.perf_counter()
+            fn(question, answer)
+            latencies.append(time.perf_counter() - start)
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "name": name,
+        "calls": len(latencies),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "mean_ms": float(latencies_ms.mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="token计数基准测试")
+    parser.add_argument("--rounds", type=int, default=100, help="每种方式重复整个问题集的轮数")
+    parser.add_argument("--reload-rounds", type=int, default=0, help="原实现（每次加载分词器）的轮数，0为跳过")
+    args = parser.parse_args()
+
+    pairs = load_pairs()
+    rows = [measure("估算", lambda q, a: estimate_tokens(q) + estimate_tokens(a), pairs, args.rounds)]
+
+    start = time.perf_counter()
+    tokenizer = _price.get_tokenizer()
+    print(f"首次加载分词器耗时: {(time.perf_counter() - start) * 1000:.1f}ms"
+          + ("" if tokenizer is not None else "（不可用，以下结果均为估算）"))
+    if tokenizer is not None:
+        rows.append(measure("复用分词器逐条计数",
+                            lambda q, a: len(tokenizer.encode(q)) + len(tokenizer.encode(a)), pairs, args.rounds))
+    rows.append(measure("tokens()批量计数", _price.tokens, pairs, args.rounds))
+    if tokenizer is not None and args.reload_rounds:
+        from transformers import AutoTokenizer
+
+        def reload_each_call(q, a):
+            t = AutoTokenizer.from_pretrained(_price.TOKENIZER_NAME)
+            return len(t.encode(q)) + len(t.encode(a))
+        rows.append(measure("每次加载分词器(原实现)", reload_each_call, pairs[:5], args.reload_rounds))
+
+    if tokenizer is not None:
+        # 估算与真实分词结果的偏差
+        errors = [abs(estimate_tokens(q) + estimate_tokens(a) - _price.tokens(q, a)) / max(1, _price.tokens(q, a))
+                  for q, a in pairs]
+        print(f"估算相对误差: 平均 {np.mean(errors):.1%}，最大 {np.max(errors):.1%}")
+    for row in rows:
+        print(f"  {row['name']:<20}调用 {row['calls']:>6} 次  p50 {row['p50_ms']:.4f}ms  "
+              f"p99 {row['p99_ms']:.4f}ms  平均 {row['mean_ms']:.4f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,80 @@
-import os
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import hashlib
 import shutil
+import threading
 import time
 from functools import lru_cache
 from scipy.spatial.distance import cosine
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import DashScopeEmbeddings
+from model._embeddings import get_embedding
+from _tools._rag._migrate import EmbeddingMigration, read_stamp
+from _tools._rag._tune import apply_index_params, load_index_params, merge_order
+from _tools._vectorstore._backend import VECTOR_BACKEND, BACKENDS, create_backend, backend_path, sync_store_dirs
 
 cache_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),"cache_database"))
-embedding = DashScopeEmbeddings(
-    model="text-embedding-v2", 
-    dashscope_api_key=os.getenv("DASHSCOPE_API_KEY")
-)
+
+def _on_embedding_cutover(target):
+    # 迁移完成后切换到新模型，并丢弃内存中旧模型的向量存储
+    global embedding, _cached_combined_store, _backend_store
+    embedding = get_embedding(target["provider"], target["model"])
+    _cached_combined_store = None
+    _backend_store = None
+    get_combined_store.cache_clear()
+
+# 缓存目录记录了生成它的embedding模型，写入和查询使用当前生效的模型
+cache_migration = EmbeddingMigration(cache_path, "问答缓存", on_cutover=_on_embedding_cutover)
+embedding = cache_migration.active_embedding()
 
 # 全局变量用于存储合并后的向量存储
 _cached_combined_store = None
 _last_modified_time = 0
+# 使用可插拔后端时，新缓存直接增量写入后端，不再整体重新加载
+_backend_store = None
+_backend_lock = threading.Lock()
+
+def get_backend_store():
+    global _backend_store
+    with _backend_lock:
+        if _backend_store is None:
+            identity = cache_migration.active_identity()
+            backend = create_backend(VECTOR_BACKEND, backend_path(cache_path, VECTOR_BACKEND, identity), embedding)
+            os.makedirs(cache_path, exist_ok=True)
+            dirs = [d for d in os.listdir(cache_path)
+                    if os.path.isdir(os.path.join(cache_path, d)) and read_stamp(os.path.join(cache_path, d)) == identity]
+            sync_store_dirs(backend, cache_path, dirs, embedding)
+            _backend_store = backend
+        return _backend_store
 
 def cache_content(question: str, answer: str, price: float, tokens: int, illation: str) -> str:
+    # 持有迁移写锁，embedding模型切换不会发生在写入过程中
+    with cache_migration.write_lock:
+        return _cache_content(question, answer, price, tokens, illation)
+
+def _cache_content(question: str, answer: str, price: float, tokens: int, illation: str) -> str:
     # 将问题与答案保存到csv文件
     cache_csv(question, answer, price, tokens, illation)
     # 计算问题hash值
     hash_value = hashlib.md5(question.encode()).hexdigest()
-    # 创建FAISS向量存储，使用HNSW索引提高查询效率
+    # 创建FAISS向量存储，合并加载时追加到持久化的HNSW/IVF索引中
     vector_store = FAISS.from_texts(
         texts=[question],
         embedding=embedding,
-        metadatas=[{"answer": answer, "illation": illation}],
-        index_kwargs={"M": 16, "efConstruction": 200, "efSearch": 128, "hnsw": True}
+        metadatas=[{"answer": answer, "illation": illation}]
     )
     # 保存FAISS向量存储
     vector_store.save_local(f"{cache_path}/{hash_value}")
-    
+    cache_migration.stamp(f"{cache_path}/{hash_value}", vector_store.index.d)
+
+    if VECTOR_BACKEND in BACKENDS:
+        # 同一问题覆盖写入同一个id
+        backend = get_backend_store()
+        backend.upsert([f"{hash_value}/0"], [question], [vector_store.index.reconstruct(0)],
+                       [{"answer": answer, "illation": illation}])
+        # 不在每次写入后序列化整个索引，按写入条数或时间间隔合并快照
+        backend.maybe_snapshot()
+        return hash_value
+
     # 清除缓存，确保下次查询时重新加载
     get_combined_store.cache_clear()
     
@@ -68,16 +111,20 @@ def get_combined_store():
     vector_stores = []
     
     try:
-        for file in os.listdir(cache_path):
-            file_path = os.path.join(cache_path, file)
-            if os.path.isdir(file_path):
-                vector_stores.append(
-                    FAISS.load_local(
-                        file_path, 
-                        embedding, 
-                        allow_dangerous_deserialization=True
-                    )
+        # 跳过非当前embedding模型生成的缓存，它们无法与查询向量比较
+        identity = cache_migration.active_identity()
+        dirs = [file for file in os.listdir(cache_path)
+                if os.path.isdir(os.path.join(cache_path, file)) and read_stamp(os.path.join(cache_path, file)) == identity]
+        # 按持久化的调优索引中的顺序合并，新写入的缓存只追加到已构建的索引中，不再整体重建
+        dirs = merge_order(cache_path, dirs)
+        for file in dirs:
+            vector_stores.append(
+                FAISS.load_local(
+                    os.path.join(cache_path, file),
+                    embedding,
+                    allow_dangerous_deserialization=True
                 )
+            )
     
         # 如果没有任何FAISS向量存储，返回None
         if not vector_stores:
@@ -87,6 +134,8 @@ def get_combined_store():
         combined_store = vector_stores[0]
         for store in vector_stores[1:]:
             combined_store.merge_from(store)
+        # 使用 _tune.py 调优后保存的索引参数
+        apply_index_params(combined_store, load_index_params(cache_path), cache_path, dirs)
         
         # 更新全局缓存
         _cached_combined_store = combined_store
@@ -103,7 +152,7 @@ def get_combined_store():
 def get_content_from_cache(question: str, similarity_threshold: float = 0.85):
     # 获取合并后的FAISS向量存储
     start_time = time.time()
-    combined_store = get_combined_store()
+    combined_store = get_backend_store() if VECTOR_BACKEND in BACKENDS else get_combined_store()
     
     # 如果没有任何FAISS向量存储，返回None
     if not combined_store:
@@ -121,7 +170,15 @@ def get_content_from_cache(question: str, similarity_threshold: float = 0.85):
         end_time = time.time()
         print(f"缓存查询耗时: {end_time - start_time:.4f}秒，相似度: {similarity:.3f}")
         
-        if similarity >= similarity_threshold:
+        hit = similarity >= similarity_threshold
+        # embedding模型迁移期间同时查询新模型的缓存，统计两者命中的是否为同一答案
+        cache_migration.shadow_compare(
+            question,
+            doc.metadata.get("answer") if hit else None,
+            lambda shadow_doc, shadow_score: shadow_doc.metadata.get("answer") if 1 - shadow_score >= similarity_threshold else None
+        )
+
+        if hit:
             metadata = doc.metadata
             answer = metadata.get("answer")
             illation = metadata.get("illation")
@@ -151,6 +208,10 @@ def cache_csv(question: str, answer: str, price: float, tokens: int, illation: s
         f.write(f"{question},{answer},{price},{tokens},{illation}\n")
 
 def clear_cache():
+    with cache_migration.write_lock:
+        _clear_cache()
+
+def _clear_cache():
     # 删除所有FAISS向量存储
     if os.path.exists(cache_path):
         for file in os.listdir(cache_path):
@@ -166,6 +227,10 @@ def clear_cache():
     # 清除内存缓存
     global _cached_combined_store
     _cached_combined_store = None
+    if VECTOR_BACKEND in BACKENDS:
+        backend = get_backend_store()
+        backend.delete(list(backend.ids()))
+        backend.snapshot()
     get_combined_store.cache_clear()
     
     print("缓存已清空")
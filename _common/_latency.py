@@ -0,0 +1,48 @@
+import collections
+import threading
+import time
+from contextlib import contextmanager
+
+# 耗时统计：SQLite连接池、检查点、模型调度和请求合并共用，不依赖任何业务模块
+
+
+class LatencyStats:
+    """按操作名累计次数、耗时，并保留最近的样本用于计算分位数"""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._window = window
+        self._ops = {}
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            entry = self._ops.get(name)
+            if entry is None:
+                entry = self._ops[name] = {"count": 0, "total": 0.0, "max": 0.0,
+                                           "samples": collections.deque(maxlen=self._window)}
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["samples"].append(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        with self._lock:
+            ops = {name: (dict(entry), sorted(entry["samples"])) for name, entry in self._ops.items()}
+        result = {}
+        for name, (entry, samples) in ops.items():
+            result[name] = {
+                "count": entry["count"],
+                "avg_ms": entry["total"] / entry["count"] * 1000 if entry["count"] else 0.0,
+                "p50_ms": samples[len(samples) // 2] * 1000 if samples else 0.0,
+                "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000 if samples else 0.0,
+                "max_ms": entry["max"] * 1000,
+            }
+        return result
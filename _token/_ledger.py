@@ -0,0 +1,208 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+# 用量账本：每个请求结束后写一行（线程、接口、模型、token、费用、耗时、来源），供按天/线程/接口汇总
+# 写入先放进队列，由后台线程按批提交，请求线程不等待磁盘
+ledger_path = os.getenv("USAGE_LEDGER_PATH") or os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "usage.db"))
+LEDGER_BATCH_SIZE = int(os.getenv("USAGE_LEDGER_BATCH_SIZE", "100"))
+LEDGER_FLUSH_SECONDS = float(os.getenv("USAGE_LEDGER_FLUSH_SECONDS", "1.0"))
+
+COLUMNS = ("ts", "day", "request_id", "thread_id", "endpoint", "model", "prompt_tokens", "completion_tokens",
+           "tokens", "cost", "latency", "source", "status", "models", "ttft", "wait")
+# 建表之后新增的列，旧的账本文件启动时补上
+ADDED_COLUMNS = {"ttft": "REAL", "wait": "REAL"}
+# 汇总接口允许的分组维度
+GROUP_BY = {"day": "day", "thread": "thread_id", "endpoint": "endpoint", "model": "model", "source": "source"}
+
+
+class UsageLedger:
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, day TEXT NOT NULL, request_id TEXT, "
+                "thread_id TEXT, endpoint TEXT NOT NULL, model TEXT, prompt_tokens INTEGER DEFAULT 0, "
+                "completion_tokens INTEGER DEFAULT 0, tokens INTEGER DEFAULT 0, cost REAL DEFAULT 0, "
+                "latency REAL DEFAULT 0, source TEXT, status TEXT, models TEXT)"
+            )
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(usage)")}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE usage ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_day ON usage (day)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_thread ON usage (thread_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_endpoint ON usage (endpoint)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL 模式下汇总查询不会阻塞后台写入
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="usage-ledger", daemon=True)
+                self._thread.start()
+
+    def record(self, endpoint: str, usage: dict, latency: float, thread_id: str = None,
+               request_id: str = None, source: str = None, status: str = "completed", ttft: float = None):
+        """
+        记录一次请求的用量，usage 为 UsageTracker.summary() 的结果（或包含 price/tokens 的同类字典）
+        ttft 为流式接口发出第一个回答片段的耗时，非流式请求为空
+        usage 中的 wait 为合并请求中跟随者等待领头请求的时间（来源为 coalesced），其他请求为空
+        只入队，不阻塞调用方；写入失败只打印日志，不影响请求
+        """
+        usage = usage or {}
+        models = usage.get("models") or {}
+        now = time.time()
+        row = (
+            now,
+            time.strftime("%Y-%m-%d", time.localtime(now)),
+            request_id,
+            thread_id,
+            endpoint,
+            ",".join(sorted(models)),
+            int(usage.get("prompt_tokens", 0) or 0),
+            int(usage.get("completion_tokens", 0) or 0),
+            int(usage.get("tokens", 0) or 0),
+            float(usage.get("price", 0) or 0),
+            float(latency or 0),
+            source or usage.get("source"),
+            status or usage.get("status"),
+            json.dumps(models, ensure_ascii=False) if models else None,
+            float(ttft) if ttft is not None else None,
+            float(usage["wait"]) if usage.get("wait") is not None else None,
+        )
+        self._ensure_writer()
+        self._queue.put(row)
+
+    def _run(self):
+        conn = self._connect()
+        insert = f"INSERT INTO usage ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})"
+        while True:
+            # 阻塞等待第一条，再在刷新间隔内尽量凑满一批
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + LEDGER_FLUSH_SECONDS
+            while len(batch) < LEDGER_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                conn.executemany(insert, batch)
+                conn.commit()
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                print(f"用量账本写入失败，丢弃 {len(batch)} 条记录: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """等待已入队的记录全部写入，汇总查询前调用以包含刚结束的请求"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def aggregate(self, group_by: str = "day", since: str = None, until: str = None,
+                  thread_id: str = None, endpoint: str = None, limit: int = 100) -> list:
+        """
+        按维度汇总请求数、token、费用和耗时，按总费用降序
+        since / until 为 YYYY-MM-DD（含当天）
+        """
+        if group_by not in GROUP_BY:
+            raise ValueError(f"不支持的汇总维度: {group_by}，可选: {', '.join(GROUP_BY)}")
+        column = GROUP_BY[group_by]
+        conditions, params = [], []
+        for clause, value in (("day >= ?", since), ("day <= ?", until),
+                              ("thread_id = ?", thread_id), ("endpoint = ?", endpoint)):
+            if value:
+                conditions.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        self.flush()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {column}, COUNT(*), SUM(tokens), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost), "
+                f"AVG(latency), MAX(latency), SUM(CASE WHEN source = 'cache' THEN 1 ELSE 0 END), "
+                f"SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END), AVG(ttft), MAX(ttft), "
+                f"SUM(CASE WHEN source = 'coalesced' THEN 1 ELSE 0 END), AVG(wait), MAX(wait) "
+                f"FROM usage {where} GROUP BY {column} ORDER BY SUM(cost) DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{
+            group_by: row[0],
+            "requests": row[1],
+            "tokens": row[2] or 0,
+            "prompt_tokens": row[3] or 0,
+            "completion_tokens": row[4] or 0,
+            "cost": row[5] or 0.0,
+            "avg_latency": row[6] or 0.0,
+            "max_latency": row[7] or 0.0,
+            "cache_hit_rate": (row[8] or 0) / row[1] if row[1] else 0.0,
+            "errors": row[9] or 0,
+            # 只统计流式请求
+            "avg_ttft": row[10],
+            "max_ttft": row[11],
+            # 合并到进行中相同请求的次数，及其等待时间
+            "coalesced": row[12] or 0,
+            "avg_wait": row[13],
+            "max_wait": row[14],
+        } for row in rows]
+
+    def recent(self, limit: int = 50, thread_id: str = None) -> list:
+        self.flush()
+        conn = self._connect()
+        try:
+            where, params = ("WHERE thread_id = ?", [thread_id]) if thread_id else ("", [])
+            rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM usage {where} ORDER BY id DESC LIMIT ?",
+                                params + [limit]).fetchall()
+        finally:
+            conn.close()
+        records = []
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            record["models"] = json.loads(record["models"]) if record["models"] else {}
+            records.append(record)
+        return records
+
+    def stats(self) -> dict:
+        return {"path": self.path, "written": self.written, "dropped": self.dropped, "pending": self._queue.qsize()}
+
+
+ledger = UsageLedger(ledger_path)
+
+
+def record_request(endpoint: str, usage: dict, latency: float, **kwargs):
+    """记录一次请求的用量，账本异常时不影响请求本身"""
+    try:
+        ledger.record(endpoint, usage, latency, **kwargs)
+    except Exception as e:
+        print(f"记录用量失败: {e}")
@@ -1,12 +1,44 @@
-from transformers import AutoTokenizer
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import threading
+from _tools._rag._chunker import estimate_tokens
+
+# 计数所用的分词器；TOKEN_COUNTER=estimate 时不加载分词器，直接使用估算
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "Qwen/Qwen1.5-0.5B")
+TOKEN_COUNTER = os.getenv("TOKEN_COUNTER", "tokenizer").lower()
+
+# 进程内只加载一次分词器，加载失败后不再重试，改用估算
+_tokenizer = None
+_tokenizer_failed = False
+_tokenizer_lock = threading.Lock()
+
+def get_tokenizer():
+    global _tokenizer, _tokenizer_failed
+    if _tokenizer is None and not _tokenizer_failed and TOKEN_COUNTER != "estimate":
+        with _tokenizer_lock:
+            if _tokenizer is None and not _tokenizer_failed:
+                try:
+                    from transformers import AutoTokenizer
+                    _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+                except Exception as e:
+                    _tokenizer_failed = True
+                    print(f"加载分词器 {TOKENIZER_NAME} 失败，改用估算token数: {e}")
+    return _tokenizer
+
+# 批量计算token数，一次分词调用处理所有文本
+def count_tokens(texts: list) -> list:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return [estimate_tokens(text) for text in texts]
+    return [len(ids) for ids in tokenizer(list(texts))["input_ids"]]
+
+# 单条文本的token数，供知识库切片按真实分词器计算切片大小
+def count_text_tokens(text: str) -> int:
+    return count_tokens([text])[0]
 
 # 计算token
 def tokens(question:str, answer:str) -> int:
-    tokenizer = AutoTokenizer.from_pretrained("Qwen/Qwen1.5-0.5B")
-    question_tokens = tokenizer.encode(question)
-    answer_tokens = tokenizer.encode(answer)
-    total_tokens = len(question_tokens) + len(answer_tokens)
-    return total_tokens
+    return sum(count_tokens([question, answer]))
 
 # 价格计算
 def price(tokens:int):
@@ -0,0 +1,118 @@
+import contextvars
+import threading
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 各模型单价（元/千token）：(输入, 输出)，未列出的模型按0计价
+MODEL_PRICES = {
+    "qwen-turbo": (0.0003, 0.0006),
+    "qwen-plus": (0.0008, 0.002),
+    "qwen-max": (0.0024, 0.0096),
+    "qwen-vl-ocr": (0.005, 0.005),
+    "qwen-vl-ocr-latest": (0.005, 0.005),
+    "text-embedding-v2": (0.0007, 0),
+    "text-embedding-v3": (0.0005, 0),
+}
+
+
+def model_price(model_name: str, prompt_tokens: int, completion_tokens: int) -> float:
+    # 接口返回的模型名可能带版本后缀（如 qwen-plus-2025-01-25），按最长前缀匹配
+    matched = max((name for name in MODEL_PRICES if model_name.startswith(name)), key=len, default=None)
+    prompt_price, completion_price = MODEL_PRICES.get(matched, (0, 0))
+    return prompt_tokens / 1000 * prompt_price + completion_tokens / 1000 * completion_price
+
+
+class UsageTracker:
+    """
+    累计一次请求中所有模型调用的用量（按模型分别统计），数据来自模型返回的 usage
+    同一请求内的多个线程共享同一个 tracker，累加是线程安全的
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.models = {}
+
+    def add(self, model_name: str, prompt_tokens: int, completion_tokens: int, kind: str = "llm"):
+        with self._lock:
+            entry = self.models.setdefault(model_name, {
+                "kind": kind, "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "price": 0.0,
+            })
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["price"] += model_price(model_name, prompt_tokens, completion_tokens)
+
+    def summary(self) -> dict:
+        """返回与原 agent_tokens_price 兼容的 price / tokens 字段，以及分模型明细"""
+        with self._lock:
+            models = {name: dict(entry) for name, entry in self.models.items()}
+        prompt_tokens = sum(e["prompt_tokens"] for e in models.values())
+        completion_tokens = sum(e["completion_tokens"] for e in models.values())
+        return {
+            "price": sum(e["price"] for e in models.values()),
+            "tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "llm_calls": sum(e["calls"] for e in models.values()),
+            "models": models,
+        }
+
+
+_current_usage = contextvars.ContextVar("current_usage", default=None)
+
+
+def begin_usage() -> UsageTracker:
+    """
+    为当前请求开始统计用量；之后在同一上下文（以及复制了该上下文的线程）中的模型调用都会计入
+    FastAPI 每个请求运行在独立的上下文副本中，不同请求互不影响
+    """
+    tracker = UsageTracker()
+    _current_usage.set(tracker)
+    return tracker
+
+
+def current_usage():
+    return _current_usage.get()
+
+
+def record_usage(model_name: str, prompt_tokens: int, completion_tokens: int = 0, kind: str = "llm"):
+    """把一次模型调用的用量记到当前请求上，不在请求上下文中时忽略"""
+    tracker = _current_usage.get()
+    if tracker is not None:
+        tracker.add(model_name, prompt_tokens or 0, completion_tokens or 0, kind)
+
+
+def record_openai_usage(completion, kind: str = "llm"):
+    """记录 OpenAI 兼容接口返回的 completion.usage"""
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        record_usage(completion.model, usage.prompt_tokens, usage.completion_tokens, kind)
+
+
+def usage_from_result(response):
+    """从 LangChain 的 LLMResult 中读取 (模型名, 输入token, 输出token)"""
+    llm_output = response.llm_output or {}
+    model_name = llm_output.get("model_name", "unknown")
+    usage = llm_output.get("token_usage") or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    if prompt_tokens is None:
+        # 流式调用没有 llm_output，用量在消息的 usage_metadata 中
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                metadata = getattr(message, "usage_metadata", None) or {}
+                prompt_tokens += metadata.get("input_tokens", 0)
+                completion_tokens += metadata.get("output_tokens", 0)
+                model_name = (getattr(message, "response_metadata", None) or {}).get("model_name", model_name)
+    return model_name, prompt_tokens or 0, completion_tokens or 0
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """挂在 LangChain 模型上，每次调用结束时读取模型返回的token用量"""
+
+    def on_llm_end(self, response, **kwargs):
+        record_usage(*usage_from_result(response))
+
+
+usage_callback = UsageCallbackHandler()
@@ -2,6 +2,8 @@ import os
 from openai import OpenAI
 from langchain_core.tools import tool
 import base64
+from _token._usage import record_openai_usage
+from model._scheduler import llm_scheduler
 
 model = OpenAI(
     api_key=os.getenv("DASHSCOPE_API_KEY"),
@@ -22,26 +24,29 @@ def identify_invoice(image_url: str):
     返回:
     str: 包含发票关键信息的JSON字符串
     """
-    completion = model.chat.completions.create(
-    model="qwen-vl-ocr-latest",
-    messages=[
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpg;base64,{base64_encode(image_url)}"},
-                    # 输入图像的最小像素阈值，小于该值图像会按原比例放大，直到总像素大于min_pixels
-                    "min_pixels": 28 * 28 * 4,
-                    # 输入图像的最大像素阈值，超过该值图像会按原比例缩小，直到总像素低于max_pixels
-                    "max_pixels": 28 * 28 * 8192
-                },
-                {"type": "text",
-                 "text": "请提取图像中的发票关键信息。根据发票类型（增值税专用发票、普通发票、电子发票等），提取以下信息：发票代码、发票号码、开票日期、购买方名称、购买方纳税人识别号、销售方名称、销售方纳税人识别号、商品或服务名称、金额、税率、税额、价税合计等。请准确无误地提取上述关键信息，不要遗漏和捏造虚假信息。模糊或难以辨认的内容可以用英文问号?代替。返回数据格式以JSON方式输出，格式为：{'发票类型':'xxx', '发票代码':'xxx', '发票号码':'xxx', '开票日期':'xxx', '购买方名称':'xxx', '购买方纳税人识别号':'xxx', '销售方名称':'xxx', '销售方纳税人识别号':'xxx', '商品或服务名称':'xxx', '金额':'xxx', '税率':'xxx', '税额':'xxx', '价税合计':'xxx'}"},
-            ]
-        }
-    ])
+    # OCR 调用同样经过全局调度器排队（智能体请求为 agent 优先级）
+    with llm_scheduler.slot():
+        completion = model.chat.completions.create(
+        model="qwen-vl-ocr-latest",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:image/jpg;base64,{base64_encode(image_url)}"},
+                        # 输入图像的最小像素阈值，小于该值图像会按原比例放大，直到总像素大于min_pixels
+                        "min_pixels": 28 * 28 * 4,
+                        # 输入图像的最大像素阈值，超过该值图像会按原比例缩小，直到总像素低于max_pixels
+                        "max_pixels": 28 * 28 * 8192
+                    },
+                    {"type": "text",
+                     "text": "请提取图像中的发票关键信息。根据发票类型（增值税专用发票、普通发票、电子发票等），提取以下信息：发票代码、发票号码、开票日期、购买方名称、购买方纳税人识别号、销售方名称、销售方纳税人识别号、商品或服务名称、金额、税率、税额、价税合计等。请准确无误地提取上述关键信息，不要遗漏和捏造虚假信息。模糊或难以辨认的内容可以用英文问号?代替。返回数据格式以JSON方式输出，格式为：{'发票类型':'xxx', '发票代码':'xxx', '发票号码':'xxx', '开票日期':'xxx', '购买方名称':'xxx', '购买方纳税人识别号':'xxx', '销售方名称':'xxx', '销售方纳税人识别号':'xxx', '商品或服务名称':'xxx', '金额':'xxx', '税率':'xxx', '税额':'xxx', '价税合计':'xxx'}"},
+                ]
+            }
+        ])
 
+    record_openai_usage(completion, kind="ocr")
     return completion.choices[0].message.content
 
 if __name__ == "__main__":
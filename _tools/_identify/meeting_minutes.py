@@ -2,6 +2,8 @@ import os
 import base64
 from openai import OpenAI
 from langchain_core.tools import tool
+from _token._usage import record_openai_usage
+from model._scheduler import llm_scheduler
 
 # 创建 OpenAI 客户端（阿里云 DashScope 兼容接口）
 model = OpenAI(
@@ -26,33 +28,36 @@ def identify_meeting_minutes(image_url: str):
     返回:
     str: 包含关键信息的JSON字符串
     """
-    completion = model.chat.completions.create(
-        model="qwen-vl-ocr-latest",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpg;base64,{base64_encode(image_url)}"
+    # 申请全局模型调用名额后再识别
+    with llm_scheduler.slot():
+        completion = model.chat.completions.create(
+            model="qwen-vl-ocr-latest",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpg;base64,{base64_encode(image_url)}"
+                            },
+                            "min_pixels": 28 * 28 * 4,
+                            "max_pixels": 28 * 28 * 8192
                         },
-                        "min_pixels": 28 * 28 * 4,
-                        "max_pixels": 28 * 28 * 8192
-                    },
-                    {
-                        "type": "text",
-                        "text": (
-                            "请从会议纪要图像中准确提取以下关键信息：会议时间、会议地点、主持人、参会人员、记录人、会议议题、会议内容。"
-                            "不要遗漏信息，也不要捏造。若有模糊或遮挡的字可用英文问号?代替。"
-                            "请以标准JSON格式输出，格式为："
-                            "{'会议时间':'xxx', '会议地点':'xxx', '主持人':'xxx', '参会人员':'xxx', '记录人':'xxx', '会议议题':'xxx', '会议内容':'xxx'}"
-                        )
-                    }
-                ]
-            }
-        ]
-    )
+                        {
+                            "type": "text",
+                            "text": (
+                                "请从会议纪要图像中准确提取以下关键信息：会议时间、会议地点、主持人、参会人员、记录人、会议议题、会议内容。"
+                                "不要遗漏信息，也不要捏造。若有模糊或遮挡的字可用英文问号?代替。"
+                                "请以标准JSON格式输出，格式为："
+                                "{'会议时间':'xxx', '会议地点':'xxx', '主持人':'xxx', '参会人员':'xxx', '记录人':'xxx', '会议议题':'xxx', '会议内容':'xxx'}"
+                            )
+                        }
+                    ]
+                }
+            ]
+        )
+    record_openai_usage(completion, kind="ocr")
     return completion.choices[0].message.content
 
 # 测试调用
@@ -10,9 +10,11 @@ from typing import Optional, Dict, Any, Callable, List, Union
 import asyncio
 import threading
 import traceback
+import contextvars
 import base64
 import re
 from langchain_core.tools import tool
+from model._scheduler import llm_scheduler
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -256,13 +258,16 @@ def generate_image_in_thread(prompt: str, cache_key: str, callback: Callable = N
                     start_time = time.time()
                     logger.info(f"开始调用DashScope生成图片: {prompt[:30]}...")
                     
-                    rsp = ImageSynthesis.call(
-                        api_key=api_key,
-                        model="wanx-v1",
-                        prompt=prompt,
-                        n=1,
-                        size='1024*1024'
-                    )
+                    # 经过全局调度器排队，SDK 以状态码返回限流，需要手动标记
+                    with llm_scheduler.slot() as llm_call:
+                        rsp = ImageSynthesis.call(
+                            api_key=api_key,
+                            model="wanx-v1",
+                            prompt=prompt,
+                            n=1,
+                            size='1024*1024'
+                        )
+                        llm_call.throttled = rsp.status_code == 429
                     
                     elapsed_time = time.time() - start_time
                     logger.info(f"DashScope响应完成，耗时: {elapsed_time:.2f}秒")
@@ -319,7 +324,9 @@ def generate_image_in_thread(prompt: str, cache_key: str, callback: Callable = N
                         }
                     }
                     
-                    response = requests.post(url, headers=headers, json=payload, timeout=30)
+                    with llm_scheduler.slot() as llm_call:
+                        response = requests.post(url, headers=headers, json=payload, timeout=30)
+                        llm_call.throttled = response.status_code == 429
                     
                     if response.status_code == 200:
                         response_data = response.json()
@@ -395,8 +402,8 @@ def generate_image_in_thread(prompt: str, cache_key: str, callback: Callable = N
             # 释放信号量
             thread_semaphore.release()
             
-    # 创建并启动线程
-    generate_thread = threading.Thread(target=thread_worker)
+    # 创建并启动线程，复制当前上下文使生成调用按本请求的优先级和租户排队
+    generate_thread = threading.Thread(target=contextvars.copy_context().run, args=(thread_worker,))
     generate_thread.daemon = True
     generate_thread.start()
     
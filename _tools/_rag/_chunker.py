@@ -0,0 +1,116 @@
+import math
+import re
+
+# 句末标点（含中文引号、括号收尾），英文句号只在后面跟空白时才视为句末，避免切断小数
+_SENTENCE_END = re.compile(r'[。！？；!?;…]+[”’」』）)"]*|\.(?=\s)|\n')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_CJK = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+_NON_CJK_TOKEN = re.compile(r'[A-Za-z]+|\d+|[^\sA-Za-z\d\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算Qwen分词器的token数：常见汉字约0.7个token，英文单词按每4个字母1个token，数字和标点各算1个
+    """
+    cjk = len(_CJK.findall(text))
+    others = sum(max(1, math.ceil(len(t) / 4)) if t[0].isalpha() else 1 for t in _NON_CJK_TOKEN.findall(text))
+    return math.ceil(cjk * 0.7) + others
+
+
+def _split_spans(text: str, start: int, end: int, pattern) -> list:
+    """按分隔符把 text[start:end] 切成若干区间，分隔符保留在前一个区间末尾"""
+    spans, cursor = [], start
+    for m in pattern.finditer(text, start, end):
+        if m.end() > cursor:
+            spans.append((cursor, m.end()))
+            cursor = m.end()
+    if cursor < end:
+        spans.append((cursor, end))
+    return [(s, e) for s, e in spans if text[s:e].strip()]
+
+
+def _paragraph_spans(text: str) -> list:
+    spans, cursor = [], 0
+    for m in _PARAGRAPH_BREAK.finditer(text):
+        spans.append((cursor, m.start()))
+        cursor = m.end()
+    spans.append((cursor, len(text)))
+    return [(s, e) for s, e in spans if text[s:e].strip()]
+
+
+def _hard_split(text: str, start: int, end: int, tokens: int, chunk_tokens: int, count_tokens) -> list:
+    """单句超过预算时按字符等分"""
+    pieces = math.ceil(tokens / chunk_tokens)
+    step = math.ceil((end - start) / pieces)
+    units = []
+    for s in range(start, end, step):
+        e = min(end, s + step)
+        units.append((s, e, count_tokens(text[s:e])))
+    return units
+
+
+def _units(text: str, chunk_tokens: int, count_tokens) -> list:
+    """
+    生成切分单元，每个段落对应一组单元：
+    段落整体不超过预算时作为一个单元，否则拆成句子，超长句子再按字符拆分
+    """
+    paragraphs = []
+    for p_start, p_end in _paragraph_spans(text):
+        tokens = count_tokens(text[p_start:p_end])
+        if tokens <= chunk_tokens:
+            paragraphs.append([(p_start, p_end, tokens)])
+            continue
+        units = []
+        for s, e in _split_spans(text, p_start, p_end, _SENTENCE_END):
+            t = count_tokens(text[s:e])
+            units.extend(_hard_split(text, s, e, t, chunk_tokens, count_tokens) if t > chunk_tokens else [(s, e, t)])
+        paragraphs.append(units)
+    return paragraphs
+
+
+def _tail(units: list, overlap_tokens: int) -> list:
+    """取上一块末尾若干完整句子作为重叠部分"""
+    tail, total = [], 0
+    for unit in reversed(units):
+        if total + unit[2] > overlap_tokens:
+            break
+        tail.insert(0, unit)
+        total += unit[2]
+    return tail
+
+
+def token_text_splitter(text: str, chunk_tokens: int = 256, overlap_tokens: int = 32,
+                        min_chunk_tokens: int = 64, count_tokens=estimate_tokens) -> list:
+    """
+    按模型token数切片，尊重中文段落和句子边界：
+    1. 段落尽量完整放入一块，短于 min_chunk_tokens 的段落与后续段落合并
+    2. 段落内部只在句末切分，块之间重叠 overlap_tokens 以内的完整句子
+    3. 末尾过短的块并入前一块
+    返回的每个切片都是原文的连续子串
+    """
+    chunks, current, current_tokens = [], [], 0
+    for units in _units(text, chunk_tokens, count_tokens):
+        for i, unit in enumerate(units):
+            new_paragraph = i == 0
+            if current and ((new_paragraph and current_tokens >= min_chunk_tokens)
+                            or current_tokens + unit[2] > chunk_tokens):
+                chunks.append(current)
+                # 只有在段落内部切开时才保留重叠，段落之间语义本身已经完整
+                current = [] if new_paragraph else _tail(current, overlap_tokens)
+                if sum(u[2] for u in current) + unit[2] > chunk_tokens:
+                    current = []
+                current_tokens = sum(u[2] for u in current)
+            current.append(unit)
+            current_tokens += unit[2]
+    if current:
+        chunks.append(current)
+
+    # 末尾过短的块并入前一块
+    if len(chunks) > 1:
+        last_tokens = sum(u[2] for u in chunks[-1])
+        prev_tokens = sum(u[2] for u in chunks[-2])
+        if last_tokens < min_chunk_tokens and prev_tokens + last_tokens <= chunk_tokens:
+            chunks[-2] = chunks[-2] + [u for u in chunks[-1] if u[0] >= chunks[-2][-1][1]]
+            chunks.pop()
+
+    return [text[c[0][0]:c[-1][1]].strip() for c in chunks]
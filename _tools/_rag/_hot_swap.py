@@ -0,0 +1,90 @@
+import threading
+import time
+import traceback
+
+
+class HotSwapIndex:
+    """
+    双缓冲的索引持有者：
+    - 读者总是拿到一个完整的 (索引, 版本) 快照，重建期间继续使用旧快照
+    - 重建在后台线程进行，完成后一次引用赋值原子地切换到新快照
+    - 单飞保护：同一时刻最多只有一个重建在跑，重建期间到达的变更只会让它结束后再补跑一次
+    - 持有外部资源（分片进程、后端连接）的索引可传入 on_retire，切换后用它释放被替换的旧索引
+    """
+
+    def __init__(self, builder, name: str = "index", on_retire=None):
+        self._builder = builder
+        self.name = name
+        self._on_retire = on_retire
+        self._snapshot = (None, 0)
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._building = False
+        self._pending = False
+        self._target_version = 0
+        self._started = False
+        self.last_build_seconds = None
+
+    def snapshot(self, wait_timeout: float = None):
+        """返回当前 (索引, 版本)；首次加载尚未完成时最多等待 wait_timeout 秒"""
+        if not self._ready.is_set():
+            self._ready.wait(wait_timeout)
+        return self._snapshot
+
+    def ensure_started(self, version: int = 0):
+        """首次加载只触发一次，之后的调用不做任何事"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._target_version = max(self._target_version, version)
+            self._building = True
+        threading.Thread(target=self._run, name=f"{self.name}-rebuild", daemon=True).start()
+
+    def request_rebuild(self, version: int = None):
+        """请求以指定版本重建，正在重建时只做合并标记，不会并发启动第二个重建"""
+        with self._lock:
+            if version is not None:
+                self._target_version = max(self._target_version, version)
+            self._started = True
+            if self._building:
+                self._pending = True
+                return
+            self._building = True
+        threading.Thread(target=self._run, name=f"{self.name}-rebuild", daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                version = self._target_version
+                self._pending = False
+            start_time = time.time()
+            try:
+                store = self._builder()
+                # 引用赋值是原子的，读者要么看到旧快照，要么看到新快照
+                retired = self._snapshot[0]
+                self._snapshot = (store, version)
+                self.last_build_seconds = time.time() - start_time
+                print(f"{self.name} 已切换到版本 {version}，后台重建耗时: {self.last_build_seconds:.2f}秒")
+                if self._on_retire and retired is not None and retired is not store:
+                    self._on_retire(retired)
+            except Exception as e:
+                # 重建失败时保留旧快照继续服务
+                print(f"{self.name} 后台重建失败，继续使用版本 {self._snapshot[1]}: {e}")
+                traceback.print_exc()
+            finally:
+                self._ready.set()
+            with self._lock:
+                if not self._pending:
+                    self._building = False
+                    return
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self._ready.is_set(),
+                "version": self._snapshot[1],
+                "target_version": self._target_version,
+                "building": self._building,
+                "last_build_seconds": self.last_build_seconds,
+            }
@@ -0,0 +1,280 @@
+import os
+import json
+import random
+import shutil
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from langchain_community.vectorstores import FAISS
+from model._embeddings import EMBEDDING_PROVIDER, EMBEDDING_MODEL, get_embedding
+from _tools._rag._hot_swap import HotSwapIndex
+
+# 每个向量目录中记录embedding模型的文件；没有该文件的旧目录都是用 text-embedding-v2 生成的
+STAMP_FILE = "embedding.json"
+LEGACY_IDENTITY = {"provider": "dashscope", "model": "text-embedding-v2"}
+# 迁移时每次embedding请求的文本数
+MIGRATION_BATCH = int(os.getenv("EMBEDDING_MIGRATION_BATCH", "25"))
+# 迁移期间影子索引（新模型）的最短刷新间隔（秒）
+SHADOW_REFRESH = float(os.getenv("EMBEDDING_MIGRATION_SHADOW_REFRESH", "30"))
+# 迁移期间同时查询新索引的请求比例，新模型的查询向量也要计费，抽样少量请求即可估计一致率
+SHADOW_READ_RATE = float(os.getenv("EMBEDDING_MIGRATION_SHADOW_RATE", "0.05"))
+# 后台排队中的影子查询上限，超出时丢弃本次比较，不积压
+SHADOW_MAX_PENDING = int(os.getenv("EMBEDDING_MIGRATION_SHADOW_PENDING", "8"))
+
+
+def _write_json(file_path: str, data: dict):
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, file_path)
+
+
+def _read_json(file_path: str):
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_stamp(store_dir: str, identity: dict, dim: int, **extra):
+    _write_json(os.path.join(store_dir, STAMP_FILE), {**identity, "dim": dim, **extra})
+
+
+def read_stamp(store_dir: str) -> dict:
+    stamp = _read_json(os.path.join(store_dir, STAMP_FILE))
+    return {"provider": stamp["provider"], "model": stamp["model"]} if stamp else dict(LEGACY_IDENTITY)
+
+
+def _store_dirs(root: str) -> list:
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+
+
+class EmbeddingMigration:
+    """
+    向量存储的embedding模型管理与在线迁移：
+    - 当前生效的模型记录在 <root>_embedding.json，没有时按已有目录的标记推断，空存储使用配置的模型
+    - 迁移任务在后台把 root 下的目录逐个用新模型重新向量化到 <root>_next，进度写入 <root>_migration.json，重启后可续跑
+    - 迁移期间检索仍以旧索引为准，同时查询已迁移部分的新索引并统计两者是否一致（双读）
+    - 全部完成后在写锁内把 <root>_next 原子地换成 root，再切换生效模型
+    写入方（上传、删除、写缓存）需持有 write_lock，保证切换时没有写入落在旧目录
+    """
+
+    def __init__(self, root: str, name: str, on_cutover=None):
+        self.root = root
+        self.name = name
+        self.staging = root + "_next"
+        self.state_path = root + "_migration.json"
+        self.active_path = root + "_embedding.json"
+        self.on_cutover = on_cutover
+        self.write_lock = threading.RLock()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._shadow = HotSwapIndex(self._load_shadow, name=f"{name}迁移影子索引")
+        self._compare = {"compared": 0, "agreed": 0}
+        # 影子查询在后台线程执行，不增加请求的响应时间
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-shadow")
+        self._shadow_pending = 0
+        # 生效模型只在切换时改变，推断一次后缓存，避免每次判断都列目录读文件
+        self._identity = None
+
+    def _load_identity(self) -> dict:
+        active = _read_json(self.active_path)
+        if active:
+            return active
+        dirs = _store_dirs(self.root)
+        if dirs:
+            return read_stamp(os.path.join(self.root, dirs[0]))
+        return {"provider": EMBEDDING_PROVIDER, "model": EMBEDDING_MODEL}
+
+    def active_identity(self) -> dict:
+        identity = self._identity
+        if identity is None:
+            identity = self._identity = self._load_identity()
+        return dict(identity)
+
+    def active_embedding(self):
+        identity = self.active_identity()
+        return get_embedding(identity["provider"], identity["model"])
+
+    def stamp(self, store_dir: str, dim: int):
+        """保存新的向量目录后记录所用的embedding模型"""
+        write_stamp(store_dir, self.active_identity(), dim)
+
+    def matches_active(self, store_dir: str) -> bool:
+        return read_stamp(store_dir) == self.active_identity()
+
+    def _state(self) -> dict:
+        return _read_json(self.state_path) or {}
+
+    def status(self) -> dict:
+        state = self._state()
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+        return {
+            "active": self.active_identity(),
+            "running": running,
+            **state,
+            "dual_read": dict(self._compare),
+        }
+
+    def start(self, provider: str = None, model_name: str = None) -> dict:
+        """开始迁移到指定模型；已有迁移在运行时直接返回其状态"""
+        target = {"provider": (provider or EMBEDDING_PROVIDER).lower(), "model": model_name or EMBEDDING_MODEL}
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self._state()
+            if target == self.active_identity():
+                return {"status": "noop", "target": target}
+            state = self._state()
+            if state.get("status") != "running" or state.get("target") != target:
+                # 目标变了或上次已结束，丢弃旧的中间结果重新开始
+                shutil.rmtree(self.staging, ignore_errors=True)
+                state = {"status": "running", "target": target, "started_at": time.time(), "migrated": 0}
+                _write_json(self.state_path, state)
+            self._compare = {"compared": 0, "agreed": 0}
+            self._thread = threading.Thread(target=self._run, args=(target,), name=f"{self.name}-migration", daemon=True)
+            self._thread.start()
+            return state
+
+    def resume(self):
+        """服务重启后继续未完成的迁移"""
+        state = self._state()
+        if state.get("status") == "running":
+            self.start(state["target"]["provider"], state["target"]["model"])
+
+    @staticmethod
+    def _source_mtime(source: str) -> float:
+        return os.path.getmtime(os.path.join(source, "index.pkl"))
+
+    def _is_migrated(self, name: str) -> bool:
+        """有标记且源目录在迁移后没有被覆盖写入（同一问题的缓存会写回同名目录）"""
+        stamp = _read_json(os.path.join(self.staging, name, STAMP_FILE))
+        try:
+            return bool(stamp) and stamp.get("source_mtime") == self._source_mtime(os.path.join(self.root, name))
+        except FileNotFoundError:
+            return True
+
+    def _migrate_dir(self, name: str, target_embedding, target: dict):
+        source = os.path.join(self.root, name)
+        source_mtime = self._source_mtime(source)
+        store = FAISS.load_local(source, embeddings=target_embedding, allow_dangerous_deserialization=True)
+        docs = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+        texts = [doc.page_content for doc in docs]
+        vectors = []
+        for start in range(0, len(texts), MIGRATION_BATCH):
+            vectors.extend(target_embedding.embed_documents(texts[start:start + MIGRATION_BATCH]))
+        migrated = FAISS.from_embeddings(list(zip(texts, vectors)), embedding=target_embedding,
+                                         metadatas=[doc.metadata for doc in docs])
+        staged = os.path.join(self.staging, name)
+        migrated.save_local(staged)
+        # 标记最后写入，有标记的目录才算迁移完成
+        write_stamp(staged, target, len(vectors[0]) if vectors else 0, source_mtime=source_mtime)
+
+    def _sync(self, target_embedding, target: dict, state: dict) -> int:
+        """把 root 与 staging 对齐一次：迁移新出现的目录，删除源目录已不存在的迁移结果，返回本轮变更数"""
+        changed = 0
+        last_refresh = time.time()
+        source_dirs = set(_store_dirs(self.root))
+        for name in _store_dirs(self.staging):
+            if name not in source_dirs:
+                shutil.rmtree(os.path.join(self.staging, name), ignore_errors=True)
+                changed += 1
+        for name in sorted(source_dirs):
+            if self._is_migrated(name):
+                continue
+            try:
+                self._migrate_dir(name, target_embedding, target)
+            except FileNotFoundError:
+                # 迁移过程中源目录被删除，下一轮会清理
+                continue
+            changed += 1
+            state["migrated"] = len(_store_dirs(self.staging))
+            state["total"] = len(source_dirs)
+            _write_json(self.state_path, state)
+            if time.time() - last_refresh >= SHADOW_REFRESH:
+                self._shadow.request_rebuild()
+                last_refresh = time.time()
+        return changed
+
+    def _run(self, target: dict):
+        state = self._state()
+        try:
+            target_embedding = get_embedding(target["provider"], target["model"])
+            os.makedirs(self.staging, exist_ok=True)
+            start_time = time.time()
+            # 迁移期间仍有写入，反复对齐直到一轮没有变化
+            while self._sync(target_embedding, target, state):
+                self._shadow.request_rebuild()
+            with self.write_lock:
+                # 写锁内最后对齐一次，之后不会再有写入落在旧目录
+                self._sync(target_embedding, target, state)
+                retired = f"{self.root}_retired_{int(time.time())}"
+                os.makedirs(self.root, exist_ok=True)
+                os.replace(self.root, retired)
+                os.replace(self.staging, self.root)
+                _write_json(self.active_path, target)
+                self._identity = dict(target)
+                state.update({"status": "done", "finished_at": time.time(), "dual_read": dict(self._compare)})
+                _write_json(self.state_path, state)
+                if self.on_cutover:
+                    self.on_cutover(target)
+            shutil.rmtree(retired, ignore_errors=True)
+            # 释放影子索引
+            self._shadow.request_rebuild()
+            print(f"{self.name} 已迁移到 {target['provider']}/{target['model']}，耗时: {time.time() - start_time:.2f}秒")
+        except Exception as e:
+            # 迁移失败不影响旧索引继续服务，staging 中已完成的目录下次启动迁移时复用
+            print(f"{self.name} embedding迁移失败: {e}")
+            traceback.print_exc()
+            state.update({"status": "failed", "error": str(e)})
+            _write_json(self.state_path, state)
+
+    def _load_shadow(self):
+        state = self._state()
+        dirs = [d for d in _store_dirs(self.staging)
+                if os.path.exists(os.path.join(self.staging, d, STAMP_FILE))]
+        if state.get("status") != "running" or not dirs:
+            return None
+        target_embedding = get_embedding(state["target"]["provider"], state["target"]["model"])
+        stores = [FAISS.load_local(os.path.join(self.staging, d), embeddings=target_embedding,
+                                   allow_dangerous_deserialization=True) for d in dirs]
+        combined = stores[0]
+        for store in stores[1:]:
+            combined.merge_from(store)
+        return combined
+
+    def shadow_compare(self, query: str, primary, shadow_key):
+        """
+        迁移进行中时按 SHADOW_READ_RATE 抽样，在后台线程中查询新索引的已迁移部分（不等待影子索引加载），
+        用 shadow_key(doc, score) 把新索引的top1换算成与 primary 可比较的值并记录是否一致；立即返回
+        """
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+            if not running or random.random() >= SHADOW_READ_RATE or self._shadow_pending >= SHADOW_MAX_PENDING:
+                return
+            self._shadow_pending += 1
+        self._shadow.ensure_started()
+        self._shadow_executor.submit(self._shadow_compare, query, primary, shadow_key)
+
+    def _shadow_compare(self, query: str, primary, shadow_key):
+        try:
+            store, _ = self._shadow.snapshot(wait_timeout=0)
+            if store is None:
+                return
+            results = store.similarity_search_with_score(query, k=1)
+            if results:
+                self.record_comparison(primary, shadow_key(*results[0]))
+        except Exception as e:
+            print(f"{self.name} 影子查询出错: {e}")
+        finally:
+            with self._lock:
+                self._shadow_pending -= 1
+
+    def record_comparison(self, primary_text, shadow_text):
+        """记录新旧索引的top1是否一致，作为切换前的质量参考"""
+        with self._lock:
+            self._compare["compared"] += 1
+            self._compare["agreed"] += int(primary_text == shadow_text)
@@ -0,0 +1,150 @@
+import os
+import pickle
+import time
+import numpy as np
+import faiss
+
+# 支持的量化模式：sq8 为8位标量量化（每维1字节），pq 为乘积量化（每个向量 m 字节）
+QUANTIZE_MODES = ("sq8", "pq")
+# 原始float32向量在磁盘上的文件名，用于精排
+RAW_VECTORS_FILE = "vectors.npy"
+# 训练量化器时最多采样的向量数
+TRAIN_SAMPLE_SIZE = 20000
+
+
+def ensure_raw_vectors(store_dir: str) -> str:
+    """
+    确保向量目录下存在原始向量文件 vectors.npy
+    旧目录只有 index.faiss，首次使用时从平面索引中导出一次
+    """
+    raw_path = os.path.join(store_dir, RAW_VECTORS_FILE)
+    if not os.path.exists(raw_path):
+        index = faiss.read_index(os.path.join(store_dir, "index.faiss"))
+        vectors = index.reconstruct_n(0, index.ntotal).astype(np.float32)
+        np.save(raw_path, vectors)
+        del index, vectors
+    return raw_path
+
+
+def save_raw_vectors(store_dir: str, vectors) -> str:
+    """保存原始float32向量，供量化检索后精排使用"""
+    raw_path = os.path.join(store_dir, RAW_VECTORS_FILE)
+    np.save(raw_path, np.asarray(vectors, dtype=np.float32))
+    return raw_path
+
+
+def _pq_params(dim: int, ntotal: int, pq_m: int):
+    # 子空间数必须整除向量维度
+    m = pq_m
+    while m > 1 and dim % m != 0:
+        m -= 1
+    # 每个子空间需要至少 2^nbits 个训练样本
+    nbits = 8
+    while nbits > 4 and ntotal < (1 << nbits):
+        nbits -= 1
+    return m, nbits
+
+
+def build_quantized_index(dim: int, ntotal: int, mode: str, pq_m: int = 64):
+    """根据模式创建量化索引，样本太少无法训练PQ时退回SQ8"""
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"不支持的量化模式: {mode}")
+    if mode == "pq":
+        m, nbits = _pq_params(dim, ntotal, pq_m)
+        if ntotal >= (1 << nbits):
+            return faiss.IndexPQ(dim, m, nbits, faiss.METRIC_L2)
+        print(f"向量数量({ntotal})不足以训练PQ，改用SQ8")
+    return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+
+
+class QuantizedVectorStore:
+    """
+    内存中只保存量化编码的向量存储
+    检索时先用量化索引取出 k * rerank_factor 个候选，再从磁盘上的原始向量（内存映射）精确计算L2距离重排
+    对外提供与 LangChain FAISS 相同的 similarity_search_with_score 接口
+    """
+
+    def __init__(self, embedding, index, docs, segments, rerank_factor: int = 4):
+        self.embedding = embedding
+        self.index = index
+        # docs[i] 为全局id i 对应的 Document
+        self.docs = docs
+        # segments: [(起始全局id, 内存映射的原始向量)]
+        self.segments = segments
+        self._segment_starts = np.array([start for start, _ in segments], dtype=np.int64)
+        self.rerank_factor = max(1, rerank_factor)
+
+    def _raw_vectors(self, ids):
+        # 按全局id从各个分段中取出原始向量
+        seg_idx = np.searchsorted(self._segment_starts, ids, side="right") - 1
+        rows = []
+        for gid, s in zip(ids, seg_idx):
+            start, vectors = self.segments[s]
+            rows.append(vectors[gid - start])
+        return np.asarray(rows, dtype=np.float32)
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4):
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        _, ids = self.index.search(query, k * self.rerank_factor)
+        candidates = ids[0][ids[0] >= 0]
+        if len(candidates) == 0:
+            return []
+        # 使用原始向量精确重排，距离与平面索引一致（L2平方）
+        raw = self._raw_vectors(candidates)
+        distances = ((raw - query) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:k]
+        return [(self.docs[candidates[i]], float(distances[i])) for i in order]
+
+    def similarity_search_with_score(self, query: str, k: int = 4):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def memory_usage(self) -> dict:
+        """量化编码占用与同等float32平面索引占用的对比（字节）"""
+        ntotal = self.index.ntotal
+        code_bytes = self.index.sa_code_size() * ntotal
+        float_bytes = self.index.d * 4 * ntotal
+        return {"ntotal": ntotal, "code_bytes": code_bytes, "float32_bytes": float_bytes,
+                "ratio": code_bytes / float_bytes if float_bytes else 0}
+
+
+def load_quantized_store(store_dirs: list, embedding, mode: str, rerank_factor: int = 4, pq_m: int = 64):
+    """
+    从多个向量目录构建一个合并后的量化向量存储
+    原始向量以内存映射方式打开，不会整体读入内存
+    """
+    start_time = time.time()
+    docs = []
+    segments = []
+    ntotal = 0
+    for store_dir in store_dirs:
+        raw_path = ensure_raw_vectors(store_dir)
+        vectors = np.load(raw_path, mmap_mode="r")
+        with open(os.path.join(store_dir, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        for i in range(len(vectors)):
+            docs.append(docstore.search(index_to_docstore_id[i]))
+        segments.append((ntotal, vectors))
+        ntotal += len(vectors)
+
+    if ntotal == 0:
+        return None
+
+    dim = segments[0][1].shape[1]
+    index = build_quantized_index(dim, ntotal, mode, pq_m)
+
+    # 从各分段均匀采样训练量化器
+    sample_every = max(1, ntotal // TRAIN_SAMPLE_SIZE)
+    sample = np.concatenate([np.asarray(v[::sample_every], dtype=np.float32) for _, v in segments])
+    index.train(sample)
+    del sample
+
+    # 分批添加，避免一次性把全部原始向量读入内存
+    for _, vectors in segments:
+        for i in range(0, len(vectors), 4096):
+            index.add(np.asarray(vectors[i:i + 4096], dtype=np.float32))
+
+    store = QuantizedVectorStore(embedding, index, docs, segments, rerank_factor)
+    usage = store.memory_usage()
+    print(f"构建{mode}量化索引完成，向量数: {ntotal}，编码占用: {usage['code_bytes']}字节 "
+          f"(float32为{usage['float32_bytes']}字节)，耗时: {time.time() - start_time:.2f}秒")
+    return store
@@ -0,0 +1,101 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# 查询缓存容量
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))
+
+
+class LRUCache:
+    """线程安全的LRU缓存"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0,
+            }
+
+
+def normalize_query(text: str) -> str:
+    """规范化查询：去除首尾空白与结尾标点、合并空白、统一小写，使几乎相同的问题命中同一缓存项"""
+    text = re.sub(r"\s+", " ", text.strip()).lower()
+    return text.rstrip("?？!！。.，, ")
+
+
+# (embedding模型, 查询文本) -> 向量（与索引版本无关）
+# 键中带模型名：模型切换时进行中的请求写回的旧模型向量不会被新模型的查询取到
+embedding_cache = LRUCache(QUERY_CACHE_SIZE)
+# (查询文本, 索引版本) -> 检索结果，索引版本变化后旧结果自然失效
+result_cache = LRUCache(QUERY_CACHE_SIZE)
+
+
+def _model_key(embedding) -> str:
+    return getattr(embedding, "model_name", None) or type(embedding).__name__
+
+
+def embed_query_cached(embedding, text: str):
+    key = (_model_key(embedding), normalize_query(text))
+    vector = embedding_cache.get(key)
+    if vector is None:
+        vector = embedding.embed_query(text)
+        embedding_cache.put(key, vector)
+    return vector
+
+
+def embed_queries_cached(embedding, texts: list) -> list:
+    """批量获取查询向量，未命中的查询合并为一次embedding调用"""
+    model = _model_key(embedding)
+    keys = [(model, normalize_query(t)) for t in texts]
+    vectors = [embedding_cache.get(k) for k in keys]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        # 查询向量需按 query 类型计算，提供方支持时合并为一次请求
+        embed_queries = getattr(embedding, "embed_queries", None)
+        if embed_queries is not None:
+            new_vectors = embed_queries(missing_texts)
+        else:
+            new_vectors = [embedding.embed_query(t) for t in missing_texts]
+        for i, vector in zip(missing, new_vectors):
+            vectors[i] = vector
+            embedding_cache.put(keys[i], vector)
+    return vectors
+
+
+def query_cache_stats() -> dict:
+    return {"embedding": embedding_cache.stats(), "result": result_cache.stats()}
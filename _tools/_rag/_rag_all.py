@@ -1,23 +1,88 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from langchain.tools import tool
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings.dashscope import DashScopeEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-import os
 import hashlib
+import json
 import shutil
+import threading
 import time
-from functools import lru_cache
+from _tools._rag._hot_swap import HotSwapIndex
+from model._embeddings import get_embedding
+from _tools._rag._migrate import EmbeddingMigration, read_stamp
+from _tools._rag._tune import apply_index_params, load_index_params, merge_order
+from _tools._vectorstore._backend import VECTOR_BACKEND, BACKENDS, create_backend, release_backend, backend_path, sync_store_dirs
+from _tools._vectorstore._base import VectorStoreBackend
+from _tools._rag._chunker import token_text_splitter
+from _token._price import count_text_tokens
+from _tools._rag._quantize import QUANTIZE_MODES, load_quantized_store
+from _tools._rag._shard import ShardedVectorStore, start_sharded_store
+from _tools._rag._query_cache import embed_query_cached, embed_queries_cached, normalize_query, result_cache, embedding_cache
 
 save_file_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),"files"))
-embedding = DashScopeEmbeddings(model="text-embedding-v2", dashscope_api_key=os.getenv("DASHSCOPE_API_KEY"))
+path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),"vector_store"))
+
+def _on_embedding_cutover(target):
+    """
+    迁移完成后切换到新模型：旧模型的检索结果全部失效，并重建索引
+    查询使用索引快照中记录的模型，新模型随重建后的索引一起发布，切换前的请求仍用旧模型查旧索引
+    """
+    global embedding
+    embedding = get_embedding(target["provider"], target["model"])
+    embedding_cache.clear()
+    result_cache.clear()
+    bump_index_version()
+
+# 每个向量目录都记录了生成它的embedding模型，新目录和检索使用当前生效的模型
+kb_migration = EmbeddingMigration(path, "知识库", on_cutover=_on_embedding_cutover)
+embedding = kb_migration.active_embedding()
+
+# 量化存储模式：为空时使用float32平面索引，可选 sq8 / pq，检索时用磁盘上的原始向量精排
+QUANTIZE_MODE = os.getenv("RAG_QUANTIZE", "").lower()
+RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+# 分片数：大于1时把向量目录分配到多个工作进程中并行检索
+SHARD_COUNT = int(os.getenv("RAG_SHARDS", "0"))
+# 启动后首次加载尚未完成时，检索请求最多等待的秒数
+PRELOAD_WAIT = float(os.getenv("RAG_PRELOAD_WAIT", "60"))
+# 分片模式下被新索引替换的旧分片进程延迟关闭的秒数，切换前已取到旧快照的检索仍可完成
+RETIRE_DELAY = float(os.getenv("RAG_RETIRE_DELAY", "30"))
+# 默认切片方式：token 按模型token数并尊重中文句段边界，char 为原来的按字符递归切分
+DEFAULT_SPLITTER = os.getenv("RAG_SPLITTER", "token").lower()
+DEFAULT_SPLIT_PARAMS = {
+    "token": {
+        "chunk_tokens": int(os.getenv("RAG_CHUNK_TOKENS", "256")),
+        "overlap_tokens": int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "32")),
+        "min_chunk_tokens": int(os.getenv("RAG_MIN_CHUNK_TOKENS", "64")),
+    },
+    "char": {"chunk_size": 100, "chunk_overlap": 10},
+}
 
 # 全局变量初始化
-_combined_store = None
-_last_modified_time = 0
+# 索引版本：每次上传或删除后递增，检索结果缓存以此为键的一部分
+_index_version = 0
+_version_lock = threading.Lock()
+
+def bump_index_version():
+    """向量目录发生变化：版本递增并在后台重建索引，重建完成前检索继续使用旧索引"""
+    global _index_version
+    with _version_lock:
+        _index_version += 1
+        version = _index_version
+    knowledge_index.request_rebuild(version)
+    return version
+
+def get_index_version():
+    return _index_version
 
 # 将上传的文件保存到本地
 def save_file(file, description=None):
     file_location = os.path.join(save_file_path, file.filename)
+    if os.path.exists(file_location) and file.filename not in load_manifest():
+        # 清单之前上传的同名文件：覆盖前按旧内容推算其向量目录并记入清单，重新向量化时才能复用和清理
+        legacy_dirs = [d for d in _legacy_vector_dirs(file_location) if os.path.isdir(f"{path}/{d}")]
+        if legacy_dirs:
+            update_manifest(file.filename, {"vector_dir": legacy_dirs[0], "legacy": True})
     with open(file_location, "wb") as f:
         f.write(file.file.read())  
     
@@ -49,133 +114,290 @@ def text_splitter(text, chunk_size=100, chunk_overlap=10):
     texts = text_splitter.split_text(text)
     return texts
 
-path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),"vector_store"))
-# 使用hash值保存向量文件
-def save_vector_store(text):
+# 按指定方式切片，未传入的参数使用默认值
+def split_text(text, splitter=None, **params):
+    splitter = (splitter or DEFAULT_SPLITTER).lower()
+    if splitter not in DEFAULT_SPLIT_PARAMS:
+        raise ValueError(f"不支持的切片方式: {splitter}")
+    merged = {**DEFAULT_SPLIT_PARAMS[splitter], **{k: v for k, v in params.items() if v is not None}}
+    if splitter == "token":
+        # 用对话计费共用的分词器计算切片大小（进程内只加载一次，加载失败时退回估算）
+        return token_text_splitter(text, count_tokens=count_text_tokens, **merged), {"splitter": splitter, **merged}
+    return text_splitter(text, **merged), {"splitter": splitter, **merged}
+
+# 文件清单：记录每个文件对应的向量目录和切片参数，删除时不必再用默认参数重新切片推算目录
+manifest_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),"manifest.json"))
+_manifest_lock = threading.Lock()
+
+def load_manifest():
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def update_manifest(file_name, entry=None):
+    """写入或删除（entry为None）一个文件的清单项，先写临时文件再替换，避免写坏清单"""
+    with _manifest_lock:
+        manifest = load_manifest()
+        if entry is None:
+            manifest.pop(file_name, None)
+        else:
+            manifest[file_name] = entry
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+def _chunk_hash(text):
+    return hashlib.md5(text.encode()).hexdigest()
+
+# 按旧的默认字符切片推算清单之前上传的文件对应的向量目录名
+def _legacy_vector_dirs(file_path):
+    texts = text_splitter(read_file(file_path))
+    hash_value = hashlib.md5("".join(texts).encode()).hexdigest()
+    return [hash_value, f"{hash_value}_hnsw"]
+
+def _reusable_vectors(vector_dir):
+    """读取旧向量目录中每个切片的向量，以切片内容哈希为键；其他embedding模型生成的向量不能复用"""
+    if not vector_dir or not os.path.isdir(f"{path}/{vector_dir}"):
+        return {}
+    if not kb_migration.matches_active(f"{path}/{vector_dir}"):
+        return {}
+    store = FAISS.load_local(f"{path}/{vector_dir}",
+                             embeddings=embedding,
+                             allow_dangerous_deserialization=True)
+    vectors = {}
+    for i, doc_id in store.index_to_docstore_id.items():
+        doc = store.docstore.search(doc_id)
+        vectors[_chunk_hash(doc.page_content)] = store.index.reconstruct(int(i)).tolist()
+    return vectors
+
+def embed_chunks(texts, previous_dir=None):
+    """
+    计算切片向量：旧版本中内容未变的切片直接复用向量，只为新增或修改过的切片调用embedding
+    返回 (向量列表, 实际embedding的切片数)
+    """
+    reusable = _reusable_vectors(previous_dir)
+    vectors = [reusable.get(_chunk_hash(t)) for t in texts]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        for i, vector in zip(missing, embedding.embed_documents([texts[i] for i in missing])):
+            vectors[i] = vector
+    return vectors, len(missing)
+
+def _vector_store_from(texts, metadatas=None, vectors=None):
+    if vectors is None:
+        vectors = embedding.embed_documents(texts)
+    return FAISS.from_embeddings(list(zip(texts, vectors)), embedding=embedding, metadatas=metadatas)
+
+# 使用hash值保存向量文件，vectors 为已算好的切片向量（可选）
+def save_vector_store(text, metadatas=None, vectors=None):
     # 将内容进行wordEmbedding向量化
-    _vector = FAISS.from_texts(
-        text, 
-        embedding=embedding,
-        # 使用更高效的索引方式
-        index_kwargs={"nlist": 5, "nprobe": 2}  # IVF索引参数
-    )
-                               
+    _vector = _vector_store_from(text, metadatas, vectors)
+
     text = "".join(text)
     hash_value = hashlib.md5(text.encode()).hexdigest()
     print(hash_value)
     _vector.save_local(f"{path}/{hash_value}")
+    kb_migration.stamp(f"{path}/{hash_value}", _vector.index.d)
+    bump_index_version()
+    return hash_value
 
 # 使用HNSW索引保存向量文件 - 比标准FAISS更快的检索速度
-def save_vector_store_hnsw(text):
+def save_vector_store_hnsw(text, metadatas=None, vectors=None):
     # 将内容进行wordEmbedding向量化
-    _vector = FAISS.from_texts(
-        text, 
-        embedding=embedding,
-        # 使用HNSW索引以加快检索
-        index_kwargs={"M": 16, "efConstruction": 200, "efSearch": 128, "hnsw": True}
-    )
-                               
+    _vector = _vector_store_from(text, metadatas, vectors)
+
     text = "".join(text)
     hash_value = hashlib.md5(text.encode()).hexdigest()
     print(f"使用HNSW索引保存: {hash_value}")
     _vector.save_local(f"{path}/{hash_value}_hnsw")
+    kb_migration.stamp(f"{path}/{hash_value}_hnsw", _vector.index.d)
+    bump_index_version()
+    return f"{hash_value}_hnsw"
 
-# 使用LRU缓存加速加载过程
-@lru_cache(maxsize=1)  # 最多缓存1个结果
-def load_vector_store():
-    # 缓存失效检查 - 如果向量存储目录有变化，则清除缓存
-    global _last_modified_time, _combined_store
-    current_modified_time = 0
-    if os.path.exists(path):
-        for root, dirs, files in os.walk(path):
-            for name in files:
-                file_path = os.path.join(root, name)
-                current_modified_time = max(current_modified_time, os.path.getmtime(file_path))
-    
-    # 检查是否需要重新加载
-    try:
-        if '_last_modified_time' in globals() and _last_modified_time == current_modified_time:
-            print("使用缓存的向量存储")
-            return _combined_store
-    except:
-        pass
-    
-    # 更新最后修改时间
-    _last_modified_time = current_modified_time
-    
-    vector_list = []
+def _remove_vector_dir(vector_dir):
+    full_path = f"{path}/{vector_dir}"
+    if os.path.exists(full_path):
+        shutil.rmtree(full_path)
+        print(f"已删除向量文件夹：{full_path}")
+    else:
+        print(f"未找到向量数据：{full_path}")
+
+# 切片并保存一个已上传的文件，记录到文件清单
+# 同名文件重新上传时按切片内容比对旧版本，只embedding变化的切片，并替换掉旧的向量目录
+def index_file(file_name, use_hnsw=True, splitter=None, **split_params):
+    # 持有迁移写锁：embedding模型切换不会发生在向量化过程中
+    with kb_migration.write_lock:
+        return _index_file(file_name, use_hnsw, splitter, **split_params)
+
+def _index_file(file_name, use_hnsw=True, splitter=None, **split_params):
+    text = read_file(os.path.join(save_file_path, file_name))
+    texts, params = split_text(text, splitter, **split_params)
+    if not texts:
+        print(f"文件内容为空，跳过向量化：{file_name}")
+        return None
+    previous_dir = (load_manifest().get(file_name) or {}).get("vector_dir")
+    entry = {"chunks": len(texts), **params}
+
+    content_hash = hashlib.md5("".join(texts).encode()).hexdigest()
+    vector_dir = f"{content_hash}_hnsw" if use_hnsw else content_hash
+    if vector_dir == previous_dir and os.path.isdir(f"{path}/{vector_dir}"):
+        update_manifest(file_name, {"vector_dir": vector_dir, **entry})
+        print(f"文件 {file_name} 切片内容未变化，无需重新向量化")
+        return vector_dir
+
+    vectors, embedded = embed_chunks(texts, previous_dir)
+    metadatas = [{"source": file_name} for _ in texts]
+    # 先保存新目录并更新清单，再删除旧目录：中途失败时清单仍指向一个完整的目录，不会两个版本都丢失
+    if use_hnsw:
+        vector_dir = save_vector_store_hnsw(texts, metadatas, vectors)
+    else:
+        vector_dir = save_vector_store(texts, metadatas, vectors)
+    update_manifest(file_name, {"vector_dir": vector_dir, **entry})
+    if previous_dir and previous_dir != vector_dir:
+        _remove_vector_dir(previous_dir)
+        # 保存时触发的重建可能同时看到新旧两个目录，删除后再请求一次，合并到同一轮重建中
+        bump_index_version()
+    print(f"文件 {file_name} 切分为 {len(texts)} 个切片，重新embedding {embedded} 个，"
+          f"复用 {len(texts) - embedded} 个，参数: {params}")
+    return vector_dir
+
+# 从磁盘构建完整的检索索引，只在后台重建线程中调用
+# 返回 (索引, 构建索引所用的embedding)，两者作为同一个快照发布
+def _build_vector_store():
+    # 写锁内读取：模型标识和embedding来自同一次切换
+    with kb_migration.write_lock:
+        identity = kb_migration.active_identity()
+        active = embedding
+    store = _load_vector_store(identity, active)
+    if kb_migration.active_identity() != identity:
+        # 构建期间完成了迁移切换，目录可能已替换为新模型的向量；放弃本次结果，切换触发的重建会补上
+        _release_store(store)
+        raise RuntimeError("构建期间embedding模型已切换")
+    return store, active
+
+def _release_store(store, delay: float = 0.0):
+    """释放没有发布或已被替换的索引：分片进程延迟关闭，后端取消退出时的快照；普通FAISS索引交给垃圾回收"""
+    if isinstance(store, ShardedVectorStore):
+        store.close_later(delay)
+    elif isinstance(store, VectorStoreBackend):
+        release_backend(store)
+
+def _retire_snapshot(built):
+    store, _ = built
+    _release_store(store, RETIRE_DELAY)
+
+def _load_vector_store(identity, embedding):
     # 确保向量存储目录存在
     if not os.path.exists(path):
         os.makedirs(path)
         print(f"创建向量存储目录: {path}")
         return None
-        
-    # 获取向量文件列表
-    try:
-        start_time = time.time()
-        files = os.listdir(path)
-        if not files:
-            print("向量存储目录为空")
-            return None
-            
-        for file in files:
-            text_load = FAISS.load_local(f"{path}/{file}",
-                                    embeddings=embedding,
-                                    allow_dangerous_deserialization=True)
-            vector_list.append(text_load)
-            
-        # 合并向量
-        if vector_list:
-            combined_store = vector_list[0]
-            for store in vector_list[1:]:
-                combined_store.merge_from(store)
-            
-            # 存储到全局变量中供缓存使用
-            _combined_store = combined_store
-            
-            end_time = time.time()
-            print(f"加载向量存储完成，耗时: {end_time - start_time:.2f}秒")
-            return combined_store
-        else:
-            return None
-    except Exception as e:
-        print(f"加载向量存储时出错: {e}")
+
+    start_time = time.time()
+    files = [file for file in os.listdir(path) if os.path.isdir(f"{path}/{file}")]
+    # 与当前embedding模型不一致的目录（模型切换后未迁移）无法与查询向量比较，跳过
+    mismatched = [file for file in files if read_stamp(f"{path}/{file}") != identity]
+    if mismatched:
+        print(f"跳过 {len(mismatched)} 个非当前embedding模型生成的向量目录: {mismatched}")
+        files = [file for file in files if file not in mismatched]
+    if not files:
+        print("向量存储目录为空")
         return None
 
-# 删除文件和向量
-def delete_file_and_vector(file_name):
-    # 读取文件内容（自动处理编码）
-    file_path = os.path.join(save_file_path, file_name)
-    text = read_file(file_path)
+    # 可插拔后端：每次重建从上次同步后的持久化快照创建新实例，只同步新增和删除的目录
+    # 已发布的实例不会被修改，切换前的检索看到的始终是完整的旧版本，旧实例在切换后释放
+    if VECTOR_BACKEND in BACKENDS:
+        backend = create_backend(VECTOR_BACKEND, backend_path(path, VECTOR_BACKEND, identity), embedding)
+        sync_store_dirs(backend, path, files, embedding)
+        backend.preload()
+        return backend
 
-    # 分割文本，与保存时保持一致
-    texts = text_splitter(text)
+    # 分片模式：每次重建启动一组新的分片进程加载上面筛选出的目录，全部就绪后才发布
+    # 不在已发布的分片上原地重新加载，重建期间检索不会被阻塞，也不会看到加载了一半的分片
+    if SHARD_COUNT > 1:
+        return start_sharded_store(path, files, SHARD_COUNT, embedding, QUANTIZE_MODE, RERANK_FACTOR)
 
-    # 拼接后生成 hash
-    text_joined = "".join(texts)
-    hash_value = hashlib.md5(text_joined.encode()).hexdigest()
-    vector_dir = f"{path}/{hash_value}"
+    # 量化模式：内存中只保留量化编码，原始向量留在磁盘上用于精排
+    if QUANTIZE_MODE in QUANTIZE_MODES:
+        return load_quantized_store(
+            [f"{path}/{file}" for file in files],
+            embedding,
+            QUANTIZE_MODE,
+            rerank_factor=RERANK_FACTOR
+        )
 
-    # 删除向量文件夹
-    if os.path.exists(vector_dir):
-        shutil.rmtree(vector_dir)
-        print(f"已删除向量文件夹：{vector_dir}")
+    # 按持久化的调优索引中的顺序合并，已构建的HNSW/IVF索引可以直接复用
+    files = merge_order(path, files)
+    vector_list = []
+    for file in files:
+        text_load = FAISS.load_local(f"{path}/{file}",
+                                embeddings=embedding,
+                                allow_dangerous_deserialization=True)
+        vector_list.append(text_load)
+
+    # 合并向量
+    combined_store = vector_list[0]
+    for store in vector_list[1:]:
+        combined_store.merge_from(store)
+    # 使用 _tune.py 调优后保存的HNSW/IVF参数，没有调优过时保持平面索引
+    apply_index_params(combined_store, load_index_params(path), path, files)
+
+    end_time = time.time()
+    print(f"加载向量存储完成，耗时: {end_time - start_time:.2f}秒")
+    return combined_store
+
+# 知识库索引：启动时后台预加载，变更后后台重建并原子切换
+knowledge_index = HotSwapIndex(_build_vector_store, name="知识库索引", on_retire=_retire_snapshot)
+
+def preload_vector_store():
+    """服务启动时调用，在后台加载知识库索引，不阻塞启动"""
+    knowledge_index.ensure_started(_index_version)
+
+def get_vector_store_snapshot():
+    """
+    返回 (当前索引, 索引版本, 查询用的embedding)，首次加载未完成时会等待，并发请求不会重复加载
+    查询向量必须用快照中的embedding计算，模型切换时才不会用新模型去查旧索引
+    """
+    preload_vector_store()
+    built, version = knowledge_index.snapshot(PRELOAD_WAIT)
+    if built is None:
+        # 首次加载尚未完成
+        return None, version, embedding
+    store, active = built
+    return store, version, active
+
+def load_vector_store():
+    return get_vector_store_snapshot()[0]
+
+# 删除文件和向量
+def delete_file_and_vector(file_name):
+    with kb_migration.write_lock:
+        _delete_file_and_vector(file_name)
+
+def _delete_file_and_vector(file_name):
+    file_path = os.path.join(save_file_path, file_name)
+    entry = load_manifest().get(file_name)
+    if entry:
+        # 清单中记录了上传时实际使用的向量目录
+        vector_dirs = [entry["vector_dir"]]
     else:
-        print(f"未找到向量数据：{vector_dir}")
+        # 旧文件没有清单项：按原来的默认字符切片重新推算目录
+        vector_dirs = _legacy_vector_dirs(file_path)
 
-    # 也删除可能存在的HNSW索引版本
-    hnsw_vector_dir = f"{path}/{hash_value}_hnsw"
-    if os.path.exists(hnsw_vector_dir):
-        shutil.rmtree(hnsw_vector_dir)
-        print(f"已删除HNSW向量文件夹：{hnsw_vector_dir}")
+    # 删除向量文件夹
+    for vector_dir in vector_dirs:
+        _remove_vector_dir(vector_dir)
 
     # 删除原始文件
     if os.path.exists(file_path):
         os.remove(file_path)
         print(f"已删除文件：{file_path}")
+    update_manifest(file_name, None)
     
-    # 清除缓存
-    load_vector_store.cache_clear()
+    # 索引版本变化，检索结果缓存随之失效
+    bump_index_version()
 
 @tool
 def search_vector_store(input_text: str) -> str:
@@ -184,11 +406,20 @@ def search_vector_store(input_text: str) -> str:
     """
     try:
         start_time = time.time()
-        combined_store = load_vector_store()
+        # 结果缓存以实际检索所用快照的版本为键，重建切换后旧结果自然失效
+        combined_store, version, query_embedding = get_vector_store_snapshot()
+        # 相同问题在索引未变化时直接返回缓存结果，不再重新embedding和检索
+        cache_key = (normalize_query(input_text), version)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            print(f"检索结果缓存命中，耗时: {time.time() - start_time:.4f}秒")
+            return cached
+
         if combined_store is None:
             return "知识库为空，请先上传文件。"
             
-        res = combined_store.similarity_search_with_score(input_text, k=5)
+        vector = embed_query_cached(query_embedding, input_text)
+        res = combined_store.similarity_search_with_score_by_vector(vector, k=5)
         
         top_doc, score = res[0]
         
@@ -196,9 +427,13 @@ def search_vector_store(input_text: str) -> str:
         print(f"搜索耗时: {end_time - start_time:.4f}秒")
 
         if score < 0.7:
-            return top_doc.page_content
-
-        return "知识库中未找到相关信息，建议尝试联网搜索。"
+            result = top_doc.page_content
+        else:
+            result = "知识库中未找到相关信息，建议尝试联网搜索。"
+        # embedding模型迁移期间同时查询新索引，统计新旧模型的top1是否一致
+        kb_migration.shadow_compare(input_text, top_doc.page_content, lambda doc, score: doc.page_content)
+        result_cache.put(cache_key, result)
+        return result
     except Exception as e:
         print(f"搜索知识库时出错: {e}")
         return "搜索知识库时出错，请尝试联网搜索或稍后再试。"
@@ -210,18 +445,31 @@ def batch_search_vector_store(input_texts: list) -> list:
     """
     try:
         start_time = time.time()
-        combined_store = load_vector_store()
+        combined_store, version, query_embedding = get_vector_store_snapshot()
+        keys = [(normalize_query(t), version) for t in input_texts]
+        results = [result_cache.get(key) for key in keys]
+        pending = [i for i, r in enumerate(results) if r is None]
+        if not pending:
+            print(f"批量检索{len(input_texts)}个问题全部命中缓存")
+            return results
+
         if combined_store is None:
             return ["知识库为空，请先上传文件。"] * len(input_texts)
-        
-        results = []
-        for input_text in input_texts:
-            res = combined_store.similarity_search_with_score(input_text, k=5)
-            top_doc, score = res[0]
-            if score < 0.7:
-                results.append(top_doc.page_content)
+
+        # 只为未命中缓存的问题计算向量，且合并为一次embedding调用
+        vectors = embed_queries_cached(query_embedding, [input_texts[i] for i in pending])
+        # 分片存储支持一次性批量检索，每个分片只往返一次
+        if hasattr(combined_store, "batch_similarity_search_with_score_by_vector"):
+            all_res = combined_store.batch_similarity_search_with_score_by_vector(vectors, k=5)
+        else:
+            all_res = [combined_store.similarity_search_with_score_by_vector(v, k=5) for v in vectors]
+
+        for i, res in zip(pending, all_res):
+            if res and res[0][1] < 0.7:
+                results[i] = res[0][0].page_content
             else:
-                results.append("知识库中未找到相关信息，建议尝试联网搜索。")
+                results[i] = "知识库中未找到相关信息，建议尝试联网搜索。"
+            result_cache.put(keys[i], results[i])
                 
         end_time = time.time()
         print(f"批量搜索{len(input_texts)}个问题，总耗时: {end_time - start_time:.4f}秒")
@@ -231,6 +479,29 @@ def batch_search_vector_store(input_texts: list) -> list:
         print(f"批量搜索知识库时出错: {e}")
         return ["搜索知识库时出错，请尝试联网搜索或稍后再试。"] * len(input_texts)
 
+# 知识库索引的加载状态
+def index_status():
+    return knowledge_index.status()
+
+def _published_store():
+    """当前发布的索引，首次加载未完成时为None，不等待"""
+    built, _ = knowledge_index.snapshot(0)
+    return built[0] if built else None
+
+# 可插拔后端的规模与各操作耗时（当前发布的实例）
+def backend_stats():
+    store = _published_store()
+    if not isinstance(store, VectorStoreBackend):
+        return {"backend": VECTOR_BACKEND}
+    return store.stats()
+
+# 分片检索的各分片耗时统计（当前发布的分片集合，重建后重新计数）
+def shard_stats():
+    store = _published_store()
+    if not isinstance(store, ShardedVectorStore):
+        return {"enabled": SHARD_COUNT > 1, "shards": {}}
+    return {"enabled": True, "shards": store.stats()}
+
 # 测试各部分方法
 if __name__ == "__main__":
     # text = read_file("D:/chatbot/_tools/_rag/2.txt")
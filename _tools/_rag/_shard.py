@@ -0,0 +1,208 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import atexit
+import hashlib
+import heapq
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from _tools._rag._quantize import QUANTIZE_MODES, load_quantized_store
+
+
+def shard_of(name: str, shard_count: int) -> int:
+    """根据向量目录名稳定地分配分片，目录增删不会影响其他目录的归属"""
+    return int(hashlib.md5(name.encode()).hexdigest(), 16) % shard_count
+
+
+def _load_shard(store_path: str, dir_names: list, shard_id: int, shard_count: int, quantize_mode: str, rerank_factor: int):
+    """dir_names 为主进程筛选后的目录（当前embedding模型生成的），分片只加载其中属于自己的部分"""
+    dirs = [
+        os.path.join(store_path, name) for name in sorted(dir_names)
+        if shard_of(name, shard_count) == shard_id and os.path.isdir(os.path.join(store_path, name))
+    ]
+    if not dirs:
+        return None
+    # 查询向量由主进程计算，分片进程不需要embedding
+    if quantize_mode in QUANTIZE_MODES:
+        return load_quantized_store(dirs, None, quantize_mode, rerank_factor=rerank_factor)
+    stores = [FAISS.load_local(d, None, allow_dangerous_deserialization=True) for d in dirs]
+    combined = stores[0]
+    for store in stores[1:]:
+        combined.merge_from(store)
+    return combined
+
+
+def _shard_worker(conn, store_path: str, dir_names: list, shard_id: int, shard_count: int, quantize_mode: str, rerank_factor: int):
+    """分片进程：加载属于本分片的向量目录，循环处理主进程发来的检索请求"""
+    store = _load_shard(store_path, dir_names, shard_id, shard_count, quantize_mode, rerank_factor)
+    # 加载完成后通知主进程，分片集合全部就绪后才发布
+    conn.send(("ok", store.index.ntotal if store else 0))
+    while True:
+        try:
+            op, payload = conn.recv()
+        except EOFError:
+            break
+        try:
+            if op == "search":
+                vectors, k = payload
+                start_time = time.perf_counter()
+                results = []
+                for vector in vectors:
+                    hits = store.similarity_search_with_score_by_vector(vector, k=k) if store else []
+                    results.append([(doc.page_content, doc.metadata, float(score)) for doc, score in hits])
+                conn.send(("ok", (results, time.perf_counter() - start_time)))
+            elif op == "reload":
+                store = _load_shard(store_path, payload, shard_id, shard_count, quantize_mode, rerank_factor)
+                conn.send(("ok", store.index.ntotal if store else 0))
+            elif op == "stop":
+                conn.send(("ok", None))
+                break
+        except Exception as e:
+            conn.send(("error", str(e)))
+    conn.close()
+
+
+class ProcessShardClient:
+    """
+    与单个分片通信的客户端，分片运行在本机的独立进程中
+    以后跨节点部署时，只需提供具有相同 search / reload / close 方法的远程客户端
+    """
+
+    def __init__(self, store_path: str, dir_names: list, shard_id: int, shard_count: int, quantize_mode: str = "", rerank_factor: int = 4):
+        self.shard_id = shard_id
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(
+            target=_shard_worker,
+            args=(child_conn, store_path, list(dir_names), shard_id, shard_count, quantize_mode, rerank_factor),
+            daemon=True,
+        )
+        self._process.start()
+        # 一条管道同一时刻只能有一个请求在途
+        self._lock = threading.Lock()
+
+    def wait_ready(self) -> int:
+        """等待分片进程加载完成，返回本分片的向量数"""
+        with self._lock:
+            status, result = self._conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"分片{self.shard_id}加载失败: {result}")
+        return result
+
+    def _call(self, op, payload=None):
+        with self._lock:
+            self._conn.send((op, payload))
+            status, result = self._conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"分片{self.shard_id}执行{op}失败: {result}")
+        return result
+
+    def search(self, vectors: list, k: int):
+        """返回 (每个查询的 [(page_content, metadata, score)], 分片内检索耗时秒)"""
+        return self._call("search", (vectors, k))
+
+    def reload(self, dir_names: list) -> int:
+        return self._call("reload", list(dir_names))
+
+    def close(self):
+        try:
+            self._call("stop")
+        except Exception:
+            pass
+        self._process.join(timeout=5)
+
+
+class ShardedVectorStore:
+    """
+    分片向量存储：查询向量只计算一次，广播到所有分片并行检索，再合并各分片的 top-k
+    对外提供与 LangChain FAISS 相同的 similarity_search_with_score 接口
+    """
+
+    def __init__(self, clients: list, embedding):
+        self.clients = clients
+        self.embedding = embedding
+        self._executor = ThreadPoolExecutor(max_workers=len(clients), thread_name_prefix="rag-shard")
+        self._stats_lock = threading.Lock()
+        self._stats = {c.shard_id: {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0} for c in clients}
+
+    def _record(self, shard_id: int, elapsed: float):
+        with self._stats_lock:
+            stat = self._stats[shard_id]
+            stat["count"] += 1
+            stat["total"] += elapsed
+            stat["last"] = elapsed
+            stat["max"] = max(stat["max"], elapsed)
+
+    def _scatter(self, vectors: list, k: int):
+        futures = [self._executor.submit(c.search, vectors, k) for c in self.clients]
+        merged = [[] for _ in vectors]
+        latencies = {}
+        for client, future in zip(self.clients, futures):
+            results, elapsed = future.result()
+            self._record(client.shard_id, elapsed)
+            latencies[client.shard_id] = elapsed
+            for i, hits in enumerate(results):
+                merged[i].extend(hits)
+        print("分片检索耗时: " + ", ".join(f"分片{s}={t * 1000:.1f}ms" for s, t in latencies.items()))
+        return [
+            [(Document(page_content=text, metadata=meta), score)
+             for text, meta, score in heapq.nsmallest(k, hits, key=lambda h: h[2])]
+            for hits in merged
+        ]
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4):
+        return self._scatter([list(embedding)], k)[0]
+
+    def similarity_search_with_score(self, query: str, k: int = 4):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def batch_similarity_search_with_score_by_vector(self, vectors: list, k: int = 4):
+        """批量检索：每个分片只往返一次"""
+        return self._scatter([list(v) for v in vectors], k)
+
+    def reload(self, dir_names: list):
+        counts = list(self._executor.map(lambda c: c.reload(dir_names), self.clients))
+        print(f"分片重新加载完成，各分片向量数: {counts}")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                shard_id: {
+                    "count": s["count"],
+                    "avg_ms": s["total"] / s["count"] * 1000 if s["count"] else 0,
+                    "max_ms": s["max"] * 1000,
+                    "last_ms": s["last"] * 1000,
+                }
+                for shard_id, s in self._stats.items()
+            }
+
+    def close(self):
+        atexit.unregister(self.close)
+        for client in self.clients:
+            client.close()
+        self._executor.shutdown(wait=False)
+
+    def close_later(self, delay: float):
+        """被新的分片集合替换后延迟关闭，切换前已取到本存储的检索仍可完成"""
+        timer = threading.Timer(delay, self.close)
+        timer.daemon = True
+        timer.start()
+
+
+def start_sharded_store(store_path: str, dir_names: list, shard_count: int, embedding, quantize_mode: str = "", rerank_factor: int = 4):
+    clients = [
+        ProcessShardClient(store_path, dir_names, shard_id, shard_count, quantize_mode, rerank_factor)
+        for shard_id in range(shard_count)
+    ]
+    store = ShardedVectorStore(clients, embedding)
+    atexit.register(store.close)
+    try:
+        counts = [client.wait_ready() for client in clients]
+    except Exception:
+        store.close()
+        raise
+    print(f"已启动{shard_count}个知识库分片进程，各分片向量数: {counts}")
+    return store
@@ -0,0 +1,154 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from langchain.tools import tool
+from langchain.schema import SystemMessage, HumanMessage
+from model._router import get_model
+from _tools._rag._chunker import token_text_splitter, estimate_tokens
+from _tools._rag._rag_all import read_file, save_file_path
+
+# 文档总结：map 阶段并发总结各组切片，reduce 阶段合并部分总结，结果按文档内容哈希缓存
+# 每组切片送给模型的token预算，以及同时进行的模型调用数
+SUMMARY_GROUP_TOKENS = int(os.getenv("SUMMARY_GROUP_TOKENS", "3000"))
+SUMMARY_MAX_WORKERS = int(os.getenv("SUMMARY_MAX_WORKERS", "4"))
+# 合并的最大层数，超过后把剩余的部分总结一次性合并
+SUMMARY_MAX_LEVELS = int(os.getenv("SUMMARY_MAX_LEVELS", "4"))
+summary_cache_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "summaries"))
+
+MAP_PROMPT = "你是一个文档总结助手。请用简洁的中文总结下面这部分文档的要点，保留关键事实、数字和结论，不要添加原文没有的信息。"
+REDUCE_PROMPT = "你是一个文档总结助手。下面是同一份文档各部分的总结，请把它们合并成一份结构清晰、没有重复的完整总结，保留关键事实、数字和结论。"
+
+_executor = ThreadPoolExecutor(max_workers=SUMMARY_MAX_WORKERS, thread_name_prefix="summary")
+# 同一文档同时只总结一次，其余请求等待结果
+_doc_locks = {}
+_doc_locks_lock = threading.Lock()
+
+
+def _summarize(system_prompt: str, text: str) -> str:
+    response = get_model("summarize").invoke([SystemMessage(content=system_prompt), HumanMessage(content=text)])
+    return response.content.strip()
+
+
+def _parallel(system_prompt: str, texts: list) -> list:
+    # 在调用方的上下文中执行，模型用量计入发起总结的请求
+    futures = [_executor.submit(contextvars.copy_context().run, _summarize, system_prompt, text) for text in texts]
+    return [future.result() for future in futures]
+
+
+def _group(texts: list, budget: int, min_size: int = 1) -> list:
+    """
+    把相邻文本拼成不超过token预算的组，单段超出预算时单独成组
+    min_size 为每组至少包含的文本数（超出预算也要凑够），合并阶段取 2，保证每层组数至少减半
+    """
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if len(current) >= min_size and current_tokens + tokens > budget:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        # 最后不足 min_size 的部分并入上一组
+        if groups and len(current) < min_size:
+            groups[-1].extend(current)
+        else:
+            groups.append(current)
+    return ["\n\n".join(group) for group in groups]
+
+
+def map_reduce_summary(text: str) -> dict:
+    """
+    1. 按token预算切分全文，各组并发总结（最多 SUMMARY_MAX_WORKERS 个并发调用）
+    2. 部分总结合起来仍超出预算时，再分组并发合并（每组至少两段，组数逐层减半），直到只剩一组
+       或达到 SUMMARY_MAX_LEVELS 层
+    3. 最后一次调用生成完整总结
+    耗时约为 (总组数 / 并发数 + 合并层数) 次模型调用
+    """
+    start_time = time.time()
+    chunks = token_text_splitter(text, chunk_tokens=SUMMARY_GROUP_TOKENS, overlap_tokens=0,
+                                 min_chunk_tokens=SUMMARY_GROUP_TOKENS // 4)
+    if len(chunks) <= 1:
+        return {"summary": _summarize(MAP_PROMPT, text), "chunks": len(chunks), "llm_calls": 1,
+                "seconds": time.time() - start_time}
+
+    llm_calls = len(chunks)
+    partials = _parallel(MAP_PROMPT, chunks)
+    groups = _group(partials, SUMMARY_GROUP_TOKENS, min_size=2)
+    levels = 0
+    while len(groups) > 1 and levels < SUMMARY_MAX_LEVELS:
+        llm_calls += len(groups)
+        partials = _parallel(REDUCE_PROMPT, groups)
+        groups = _group(partials, SUMMARY_GROUP_TOKENS, min_size=2)
+        levels += 1
+    summary = _summarize(REDUCE_PROMPT, "\n\n".join(groups))
+    llm_calls += 1
+    return {"summary": summary, "chunks": len(chunks), "llm_calls": llm_calls, "seconds": time.time() - start_time}
+
+
+def _doc_lock(content_hash: str):
+    with _doc_locks_lock:
+        return _doc_locks.setdefault(content_hash, threading.Lock())
+
+
+def is_knowledge_file(file_name: str) -> bool:
+    """文件名必须与知识库目录中的某个文件完全一致，拒绝 ../ 等路径"""
+    return os.path.exists(save_file_path) and file_name in os.listdir(save_file_path)
+
+
+def summarize_file(file_name: str) -> dict:
+    """总结知识库中的一个文件，相同内容的文件直接返回缓存的总结"""
+    if not is_knowledge_file(file_name):
+        raise ValueError(f"知识库中没有文件: {file_name}")
+    text = read_file(os.path.join(save_file_path, file_name))
+    content_hash = hashlib.md5(text.encode()).hexdigest()
+    cache_file = os.path.join(summary_cache_path, f"{content_hash}.json")
+    lock = _doc_lock(content_hash)
+    try:
+        with lock:
+            if os.path.exists(cache_file):
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    return {**json.load(f), "cached": True}
+            result = {"file_name": file_name, "content_hash": content_hash, **map_reduce_summary(text)}
+            os.makedirs(summary_cache_path, exist_ok=True)
+            tmp_path = cache_file + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, cache_file)
+    finally:
+        # 总结已写入缓存（或失败），之后的请求不再需要这把锁；仍在等待的请求持有旧锁，拿到后直接读缓存
+        with _doc_locks_lock:
+            if _doc_locks.get(content_hash) is lock:
+                del _doc_locks[content_hash]
+    print(f"文件 {file_name} 总结完成: {result['chunks']} 组，{result['llm_calls']} 次模型调用，耗时 {result['seconds']:.2f}秒")
+    return {**result, "cached": False}
+
+
+def _match_file(name: str):
+    """按文件名匹配知识库文件，允许省略扩展名或只给出部分文件名"""
+    files = os.listdir(save_file_path) if os.path.exists(save_file_path) else []
+    name = name.strip().strip("\"'《》")
+    if name in files:
+        return name, files
+    matches = [f for f in files if name and (name in f or os.path.splitext(f)[0] in name)]
+    return (matches[0] if len(matches) == 1 else None), files
+
+
+@tool
+def summarize_knowledge_file(file_name: str) -> str:
+    """
+    总结知识库中某个已上传文件的全文内容，输入为文件名。需要概括整份文档时使用，检索单个知识点请使用知识库搜索工具。
+    """
+    try:
+        matched, files = _match_file(file_name)
+        if matched is None:
+            return f"知识库中没有唯一匹配“{file_name}”的文件，可选文件: {', '.join(files) or '无'}"
+        return summarize_file(matched)["summary"]
+    except Exception as e:
+        print(f"总结文件时出错: {e}")
+        return "总结文件时出错，请稍后再试。"
@@ -0,0 +1,316 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import argparse
+import json
+import math
+import time
+import numpy as np
+import faiss
+
+# ANN索引参数自动调优：以平面索引的精确结果为基准，离线扫描HNSW(M/efSearch)和IVF(nlist/nprobe)，
+# 记录召回率-延迟-内存前沿，并把满足召回目标且最快的参数保存在向量库旁边，加载索引时自动使用
+# 按参数构建好的索引也持久化在向量库旁边，重新加载时直接读取，只把新增目录的向量追加进去
+# 用法: python _tools/_rag/_tune.py --target kb --recall 0.95
+#      python _tools/_rag/_tune.py --target cache --recall 0.98 --queries queries.jsonl
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TARGETS = {
+    "kb": os.path.join(ROOT_DIR, "_tools", "_rag", "vector_store"),
+    "cache": os.path.join(ROOT_DIR, "_cache", "cache_database"),
+}
+FLAT_PARAMS = {"type": "flat"}
+HNSW_M = (8, 16, 32, 48)
+HNSW_EF_SEARCH = (16, 32, 64, 128, 256)
+HNSW_EF_CONSTRUCTION = 200
+IVF_NPROBE = (1, 2, 4, 8, 16, 32, 64)
+# IVF每个聚类中心至少需要的训练样本数
+IVF_MIN_POINTS_PER_CENTROID = 39
+
+
+def params_path(root: str) -> str:
+    return root + "_index_params.json"
+
+
+def frontier_path(root: str) -> str:
+    return root + "_tuning.json"
+
+
+def tuned_index_path(root: str) -> str:
+    return root + "_tuned.index"
+
+
+def tuned_state_path(root: str) -> str:
+    return root + "_tuned.json"
+
+
+def load_index_params(root: str) -> dict:
+    """读取调优后保存的索引参数，没有调优过时使用平面索引"""
+    file_path = params_path(root)
+    if not os.path.exists(file_path):
+        return dict(FLAT_PARAMS)
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _read_json(file_path: str):
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(file_path: str, data):
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, file_path)
+
+
+def build_ann_index(vectors, params: dict):
+    """按参数构建索引并加入向量；向量数不足以训练IVF时退回平面索引"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    kind = params.get("type", "flat")
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["M"])
+        index.hnsw.efConstruction = params.get("efConstruction", HNSW_EF_CONSTRUCTION)
+        index.add(vectors)
+        index.hnsw.efSearch = params["efSearch"]
+        return index
+    if kind == "ivf" and n >= params["nlist"] * IVF_MIN_POINTS_PER_CENTROID:
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], faiss.METRIC_L2)
+        index.train(vectors)
+        index.add(vectors)
+        index.nprobe = params["nprobe"]
+        return index
+    if kind == "ivf":
+        print(f"向量数量({n})不足以训练 nlist={params['nlist']} 的IVF索引，改用平面索引")
+    index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    return index
+
+
+def _dir_fingerprints(root: str, dir_names: list) -> list:
+    """目录名加索引文件的修改时间：同名目录被重新生成（如模型迁移）后不会误用旧向量"""
+    return [[name, os.path.getmtime(os.path.join(root, name, "index.faiss"))] for name in dir_names]
+
+
+def merge_order(root: str, dir_names: list) -> list:
+    """
+    合并向量目录的顺序：已在持久化索引中的目录保持原顺序排在前面，新目录按名称追加在后
+    这样持久化索引中的向量顺序仍与合并结果一致，只需追加新目录的向量
+    """
+    state = _read_json(tuned_state_path(root)) or {}
+    wanted = set(dir_names)
+    known = [name for name, _ in state.get("dirs", []) if name in wanted]
+    return known + sorted(wanted - set(known))
+
+
+def _load_tuned_index(root: str, params: dict, fingerprints: list):
+    """持久化索引与当前参数一致、且其目录是当前目录的前缀时返回 (索引, 已包含的向量数)，否则返回 None"""
+    state = _read_json(tuned_state_path(root))
+    if not state or state.get("params") != params or not os.path.exists(tuned_index_path(root)):
+        return None
+    if state.get("fallback"):
+        # 上次向量太少退回了平面索引，重新构建，向量足够时改用IVF
+        return None
+    if fingerprints[:len(state["dirs"])] != state["dirs"]:
+        # 有目录被删除或重新生成，向量顺序已对不上
+        return None
+    index = faiss.read_index(tuned_index_path(root))
+    if index.ntotal != state["ntotal"]:
+        return None
+    return index, state["ntotal"]
+
+
+def _save_tuned_index(root: str, params: dict, fingerprints: list, index, fallback: bool = False):
+    tmp_path = tuned_index_path(root) + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, tuned_index_path(root))
+    _write_json(tuned_state_path(root), {"params": params, "dirs": fingerprints, "ntotal": int(index.ntotal),
+                                         "fallback": fallback})
+
+
+def apply_index_params(store, params: dict, root: str = None, dir_names: list = None):
+    """
+    把合并后的 LangChain FAISS 存储的平面索引换成调优后的ANN索引
+    新索引按相同顺序加入向量，index_to_docstore_id 不变
+    传入 root 和按 merge_order 排好的 dir_names 时，索引持久化在向量库旁边：
+    之后的加载直接读取已构建的索引，只追加新目录的向量，有目录删除或参数变化时才整体重建
+    """
+    if store is None or params.get("type", "flat") == "flat" or store.index.ntotal == 0:
+        return store
+    start_time = time.time()
+    fingerprints = _dir_fingerprints(root, dir_names) if root and dir_names else None
+    loaded = _load_tuned_index(root, params, fingerprints) if fingerprints else None
+    if loaded is not None and loaded[1] <= store.index.ntotal:
+        index, built = loaded
+        added = store.index.ntotal - built
+        if added:
+            index.add(store.index.reconstruct_n(built, added))
+            _save_tuned_index(root, params, fingerprints, index)
+        store.index = index
+        print(f"已加载调优后的索引，追加 {added} 个向量，耗时: {time.time() - start_time:.2f}秒")
+        return store
+    vectors = store.index.reconstruct_n(0, store.index.ntotal)
+    store.index = build_ann_index(vectors, params)
+    if fingerprints:
+        fallback = params.get("type") == "ivf" and len(vectors) < params["nlist"] * IVF_MIN_POINTS_PER_CENTROID
+        _save_tuned_index(root, params, fingerprints, store.index, fallback)
+    print(f"已按调优参数 {params} 构建索引，耗时: {time.time() - start_time:.2f}秒")
+    return store
+
+
+def _memory_bytes(index) -> int:
+    return int(faiss.serialize_index(index).size)
+
+
+def _measure(index, queries, truth, k: int) -> dict:
+    latencies, hits = [], 0
+    for q, t in zip(queries, truth):
+        start = time.perf_counter()
+        _, found = index.search(q.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(t) & set(found[0]))
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "recall": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def _ivf_nlists(n: int) -> list:
+    base = max(1, int(math.sqrt(n)))
+    nlists = sorted({max(1, base // 2), base, base * 2, base * 4})
+    return [nlist for nlist in nlists if n >= nlist * IVF_MIN_POINTS_PER_CENTROID]
+
+
+def sweep(vectors, queries, k: int) -> list:
+    """扫描候选参数，返回每组参数的召回率、延迟和内存"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(vectors))
+    flat = build_ann_index(vectors, FLAT_PARAMS)
+    _, truth = flat.search(queries, k)
+    rows = [{"params": dict(FLAT_PARAMS), **_measure(flat, queries, truth, k), "memory_bytes": _memory_bytes(flat)}]
+
+    for m in HNSW_M:
+        index = build_ann_index(vectors, {"type": "hnsw", "M": m, "efSearch": HNSW_EF_SEARCH[0]})
+        memory = _memory_bytes(index)
+        for ef in HNSW_EF_SEARCH:
+            index.hnsw.efSearch = max(ef, k)
+            params = {"type": "hnsw", "M": m, "efConstruction": HNSW_EF_CONSTRUCTION, "efSearch": max(ef, k)}
+            rows.append({"params": params, **_measure(index, queries, truth, k), "memory_bytes": memory})
+
+    for nlist in _ivf_nlists(len(vectors)):
+        index = build_ann_index(vectors, {"type": "ivf", "nlist": nlist, "nprobe": 1})
+        memory = _memory_bytes(index)
+        for nprobe in IVF_NPROBE:
+            if nprobe > nlist:
+                break
+            index.nprobe = nprobe
+            params = {"type": "ivf", "nlist": nlist, "nprobe": nprobe}
+            rows.append({"params": params, **_measure(index, queries, truth, k), "memory_bytes": memory})
+    return rows
+
+
+def pareto_frontier(rows: list) -> list:
+    """召回率越高、p99延迟越低、内存越小越好，去掉被其他参数全面超过的组合"""
+    def dominated(a, b):
+        better_or_equal = (b["recall"] >= a["recall"] and b["p99_ms"] <= a["p99_ms"]
+                           and b["memory_bytes"] <= a["memory_bytes"])
+        strictly_better = (b["recall"] > a["recall"] or b["p99_ms"] < a["p99_ms"]
+                           or b["memory_bytes"] < a["memory_bytes"])
+        return better_or_equal and strictly_better
+    frontier = [a for a in rows if not any(dominated(a, b) for b in rows)]
+    return sorted(frontier, key=lambda r: r["p99_ms"])
+
+
+def choose(rows: list, recall_target: float) -> dict:
+    """满足召回目标的组合中选p99延迟最低的，延迟相同时选内存小的；都达不到时用平面索引"""
+    candidates = [r for r in rows if r["recall"] >= recall_target]
+    if not candidates:
+        return next(r for r in rows if r["params"]["type"] == "flat")
+    return min(candidates, key=lambda r: (r["p99_ms"], r["memory_bytes"]))
+
+
+def load_store_vectors(root: str, migration):
+    """读取向量库中当前embedding模型生成的所有向量"""
+    from langchain_community.vectorstores import FAISS
+    embedding = migration.active_embedding()
+    parts = []
+    for name in sorted(os.listdir(root)):
+        store_dir = os.path.join(root, name)
+        if os.path.isdir(store_dir) and migration.matches_active(store_dir):
+            store = FAISS.load_local(store_dir, embedding, allow_dangerous_deserialization=True)
+            parts.append(store.index.reconstruct_n(0, store.index.ntotal))
+    if not parts:
+        raise ValueError(f"向量库为空: {root}")
+    return np.concatenate(parts).astype(np.float32), embedding
+
+
+def sample_queries(vectors, size: int, noise: float, seed: int = 0):
+    """没有问题集时，以带噪声的库内向量近似真实查询"""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), size=min(size, len(vectors)), replace=False)]
+    queries = picked + noise * rng.normal(size=picked.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries.astype(np.float32)
+
+
+def tune(root: str, queries, vectors, recall_target: float, k: int) -> dict:
+    """扫描参数、保存前沿和选中的参数，返回选中的参数"""
+    rows = sweep(vectors, queries, k)
+    chosen = choose(rows, recall_target)
+    _write_json(frontier_path(root), {
+        "tuned_at": time.time(),
+        "vectors": int(len(vectors)),
+        "queries": int(len(queries)),
+        "k": k,
+        "recall_target": recall_target,
+        "frontier": pareto_frontier(rows),
+        "all": rows,
+    })
+    params = {**chosen["params"], "recall": chosen["recall"], "p99_ms": chosen["p99_ms"],
+              "memory_bytes": chosen["memory_bytes"], "vectors": int(len(vectors))}
+    _write_json(params_path(root), params)
+    return params
+
+
+def main():
+    from _tools._rag._migrate import EmbeddingMigration
+
+    parser = argparse.ArgumentParser(description="ANN索引参数自动调优")
+    parser.add_argument("--target", default="kb", choices=tuple(TARGETS), help="kb: 知识库；cache: 问答缓存")
+    parser.add_argument("--recall", type=float, default=0.95, help="recall@k 目标")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", default=None, help="问题集jsonl，每行包含 query 字段；不传时用库内向量加噪声采样")
+    parser.add_argument("--sample", type=int, default=200, help="未提供问题集时采样的查询数")
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    root = TARGETS[args.target]
+    vectors, embedding = load_store_vectors(root, EmbeddingMigration(root, args.target))
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            texts = [json.loads(line)["query"] for line in f if line.strip()]
+        embed_queries = getattr(embedding, "embed_queries", None)
+        vectors_of_queries = embed_queries(texts) if embed_queries else [embedding.embed_query(t) for t in texts]
+        queries = np.array(vectors_of_queries, dtype=np.float32)
+    else:
+        queries = sample_queries(vectors, args.sample, args.noise)
+
+    params = tune(root, queries, vectors, args.recall, args.k)
+    with open(frontier_path(root), encoding="utf-8") as f:
+        frontier = json.load(f)["frontier"]
+    print(f"向量数: {len(vectors)}  查询数: {len(queries)}  recall@{args.k} 目标: {args.recall}")
+    for row in frontier:
+        print(f"  {json.dumps(row['params'], ensure_ascii=False):<70}recall={row['recall']:.3f}  "
+              f"p50={row['p50_ms']:.3f}ms  p99={row['p99_ms']:.3f}ms  内存={row['memory_bytes'] / 1024:.0f}KB")
+    print(f"选中参数已保存到 {params_path(root)}: {params}")
+
+
+if __name__ == "__main__":
+    main()
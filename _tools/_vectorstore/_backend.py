@@ -0,0 +1,74 @@
+import atexit
+import os
+import time
+
+# 检索后端：langchain 为原来的合并 LangChain FAISS 存储（支持调优参数、量化和分片）；
+# faiss 为原生FAISS增量索引；sqlite 为嵌入式SQLite存储
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "langchain").lower()
+BACKENDS = ("faiss", "sqlite")
+
+
+def create_backend(name: str, path: str = None, embedding=None):
+    """按名称创建后端，path 为持久化位置（faiss 为目录，sqlite 为数据库文件），为空时只在内存中"""
+    if name == "faiss":
+        from _tools._vectorstore._faiss_backend import FaissBackend
+        backend = FaissBackend(path, embedding)
+    elif name == "sqlite":
+        from _tools._vectorstore._sqlite_backend import SQLiteBackend
+        backend = SQLiteBackend(path or ":memory:", embedding)
+    else:
+        raise ValueError(f"不支持的向量存储后端: {name}，可选: {', '.join(BACKENDS)}")
+    # 逐条写入只按条数或间隔快照，退出时把剩余的写入落盘
+    atexit.register(backend.flush)
+    return backend
+
+
+def release_backend(backend):
+    """不再使用的后端实例：写入剩余的快照并取消退出时的快照，实例随之可以被回收"""
+    backend.flush()
+    atexit.unregister(backend.flush)
+
+
+def backend_path(root: str, name: str, identity: dict) -> str:
+    """后端持久化位置放在向量库旁边，按embedding模型区分，切换模型后不会读到旧向量"""
+    suffix = f"{identity['provider']}_{identity['model']}".replace("/", "_")
+    return f"{root}_{name}_{suffix}" + (".db" if name == "sqlite" else "")
+
+
+def _load_store_dir(store_dir: str, embedding):
+    from langchain_community.vectorstores import FAISS
+    store = FAISS.load_local(store_dir, embeddings=embedding, allow_dangerous_deserialization=True)
+    docs = [store.docstore.search(store.index_to_docstore_id[i]) for i in range(store.index.ntotal)]
+    vectors = store.index.reconstruct_n(0, store.index.ntotal)
+    return docs, vectors
+
+
+def sync_store_dirs(backend, root: str, dir_names: list, embedding) -> dict:
+    """
+    让后端与磁盘上的向量目录保持一致：每条向量的id为 "<目录名>/<序号>"
+    只载入新增目录的向量、删除已不存在目录的向量，未变化的目录不重复读取
+    """
+    start_time = time.time()
+    existing = {}
+    for key in backend.ids():
+        existing.setdefault(key.rsplit("/", 1)[0], []).append(key)
+    wanted = set(dir_names)
+
+    removed = [key for name, keys in existing.items() if name not in wanted for key in keys]
+    if removed:
+        backend.delete(removed)
+    added = 0
+    for name in dir_names:
+        if name in existing:
+            continue
+        docs, vectors = _load_store_dir(os.path.join(root, name), embedding)
+        backend.upsert([f"{name}/{i}" for i in range(len(docs))],
+                       [doc.page_content for doc in docs],
+                       vectors,
+                       [doc.metadata for doc in docs])
+        added += len(docs)
+    if added or removed:
+        backend.snapshot()
+    summary = {"added": added, "removed": len(removed), "seconds": time.time() - start_time}
+    print(f"{backend.name} 后端同步完成: {summary}")
+    return summary
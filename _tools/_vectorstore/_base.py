@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# 增量写入后的快照时机：累计写入条数达到阈值，或距上次快照超过间隔秒数（在下一次写入时检查），进程退出时补写
+# 快照落后时不会丢数据：重启后 sync_store_dirs 会按磁盘上的向量目录补齐
+VECTOR_SNAPSHOT_EVERY = int(os.getenv("VECTOR_SNAPSHOT_EVERY", "100"))
+VECTOR_SNAPSHOT_INTERVAL = float(os.getenv("VECTOR_SNAPSHOT_INTERVAL", "60"))
+
+
+class VectorStoreBackend(ABC):
+    """
+    向量存储后端的最小接口：upsert / delete / search / batch_search / snapshot / stats
+    - 每条向量由调用方给定的字符串 id 标识，重复 upsert 同一 id 会覆盖旧向量
+    - search 返回 [(Document, L2距离)]，距离越小越相似，与 LangChain FAISS 一致
+    - snapshot 把当前状态一致地写到指定路径（默认为后端自身的持久化位置），重启时可直接加载
+    - maybe_snapshot 供逐条写入的调用方使用，按写入条数或时间间隔合并快照
+    同时提供 LangChain 向量存储的检索方法名，现有检索代码不需要区分后端
+    """
+
+    name = "base"
+
+    def __init__(self, embedding=None):
+        self.embedding = embedding
+        self._stats_lock = threading.Lock()
+        self._op_stats = {}
+        self._unsaved = 0
+        self._last_snapshot = time.monotonic()
+
+    @abstractmethod
+    def upsert(self, ids: list, texts: list, vectors: list, metadatas: list = None):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: list) -> int:
+        ...
+
+    @abstractmethod
+    def search(self, vector, k: int = 4) -> list:
+        ...
+
+    def batch_search(self, vectors: list, k: int = 4) -> list:
+        return [self.search(vector, k) for vector in vectors]
+
+    @abstractmethod
+    def snapshot(self, target_path: str = None):
+        ...
+
+    def preload(self):
+        """发布前把检索需要的数据载入内存，之后的检索不再读取持久化文件；数据本来就在内存中的后端不需要实现"""
+        pass
+
+    @abstractmethod
+    def ids(self) -> set:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def memory_bytes(self) -> int:
+        ...
+
+    def maybe_snapshot(self, writes: int = 1) -> bool:
+        """记录 writes 条未快照的写入，达到条数阈值或时间间隔时才真正快照"""
+        with self._stats_lock:
+            self._unsaved += writes
+            due = (self._unsaved >= VECTOR_SNAPSHOT_EVERY
+                   or time.monotonic() - self._last_snapshot >= VECTOR_SNAPSHOT_INTERVAL)
+        if due:
+            self.flush()
+        return due
+
+    def flush(self):
+        """有未快照的写入时立即快照，进程退出时调用"""
+        with self._stats_lock:
+            if not self._unsaved:
+                return
+            self._unsaved = 0
+            self._last_snapshot = time.monotonic()
+        self.snapshot()
+
+    def _record(self, op: str, start_time: float, items: int = 1):
+        elapsed = time.perf_counter() - start_time
+        with self._stats_lock:
+            stats = self._op_stats.setdefault(op, {"calls": 0, "items": 0, "total_ms": 0.0})
+            stats["calls"] += 1
+            stats["items"] += items
+            stats["total_ms"] += elapsed * 1000
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            ops = {
+                op: {**s, "avg_ms": s["total_ms"] / s["calls"] if s["calls"] else 0}
+                for op, s in self._op_stats.items()
+            }
+        return {"backend": self.name, "count": self.count(), "memory_bytes": self.memory_bytes(), "ops": ops}
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4):
+        return self.search(embedding, k)
+
+    def batch_similarity_search_with_score_by_vector(self, vectors: list, k: int = 4):
+        return self.batch_search(vectors, k)
+
+    def similarity_search_with_score(self, query: str, k: int = 4):
+        return self.search(self.embedding.embed_query(query), k)
@@ -0,0 +1,120 @@
+import os
+import pickle
+import threading
+import time
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from _tools._vectorstore._base import VectorStoreBackend
+
+# 索引和元数据写在同一个文件里，替换是原子的
+SNAPSHOT_FILE = "faiss_backend.pkl"
+
+
+class FaissBackend(VectorStoreBackend):
+    """
+    原生FAISS后端：IndexIDMap2 包装平面L2索引，每次写入分配递增的整数id
+    覆盖或删除只需 remove_ids，不必像 LangChain FAISS 那样整体重建或合并
+    """
+
+    name = "faiss"
+
+    def __init__(self, path: str = None, embedding=None):
+        super().__init__(embedding)
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = None
+        # 字符串id -> 整数id，整数id -> Document
+        self._id_map = {}
+        self._docs = {}
+        self._next_id = 0
+        if path and os.path.exists(os.path.join(path, SNAPSHOT_FILE)):
+            self._load(path)
+
+    def _load(self, path: str):
+        with open(os.path.join(path, SNAPSHOT_FILE), "rb") as f:
+            index_bytes, self._id_map, self._docs, self._next_id = pickle.load(f)
+        self._index = faiss.deserialize_index(index_bytes)
+
+    def _ensure_index(self, dim: int):
+        if self._index is None:
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+    def upsert(self, ids: list, texts: list, vectors: list, metadatas: list = None):
+        if not ids:
+            return
+        start_time = time.perf_counter()
+        metadatas = metadatas or [{} for _ in ids]
+        matrix = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._ensure_index(matrix.shape[1])
+            replaced = [self._id_map.pop(key) for key in ids if key in self._id_map]
+            if replaced:
+                self._index.remove_ids(np.asarray(replaced, dtype=np.int64))
+                for int_id in replaced:
+                    self._docs.pop(int_id, None)
+            int_ids = np.arange(self._next_id, self._next_id + len(ids), dtype=np.int64)
+            self._next_id += len(ids)
+            self._index.add_with_ids(matrix, int_ids)
+            for key, int_id, text, metadata in zip(ids, int_ids.tolist(), texts, metadatas):
+                self._id_map[key] = int_id
+                self._docs[int_id] = Document(page_content=text, metadata={**metadata, "id": key})
+        self._record("upsert", start_time, len(ids))
+
+    def delete(self, ids: list) -> int:
+        start_time = time.perf_counter()
+        with self._lock:
+            removed = [self._id_map.pop(key) for key in ids if key in self._id_map]
+            if removed:
+                self._index.remove_ids(np.asarray(removed, dtype=np.int64))
+                for int_id in removed:
+                    self._docs.pop(int_id, None)
+        self._record("delete", start_time, len(removed))
+        return len(removed)
+
+    def batch_search(self, vectors: list, k: int = 4) -> list:
+        start_time = time.perf_counter()
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return [[] for _ in vectors]
+            distances, int_ids = self._index.search(np.asarray(vectors, dtype=np.float32), k)
+            results = [
+                [(self._docs[i], float(d)) for d, i in zip(row_d, row_i) if i != -1]
+                for row_d, row_i in zip(distances, int_ids)
+            ]
+        self._record("search", start_time, len(vectors))
+        return results
+
+    def search(self, vector, k: int = 4) -> list:
+        return self.batch_search([vector], k)[0]
+
+    def snapshot(self, target_path: str = None):
+        """写入索引和元数据：先写临时文件再替换，加载时不会读到写了一半的文件"""
+        target_path = target_path or self.path
+        if not target_path:
+            return
+        start_time = time.perf_counter()
+        os.makedirs(target_path, exist_ok=True)
+        snapshot_file = os.path.join(target_path, SNAPSHOT_FILE)
+        with self._lock:
+            if self._index is None:
+                return
+            state = (faiss.serialize_index(self._index), dict(self._id_map), dict(self._docs), self._next_id)
+        with open(snapshot_file + ".tmp", "wb") as f:
+            pickle.dump(state, f)
+        os.replace(snapshot_file + ".tmp", snapshot_file)
+        self._record("snapshot", start_time)
+
+    def ids(self) -> set:
+        with self._lock:
+            return set(self._id_map)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._index.ntotal if self._index is not None else 0
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            if self._index is None:
+                return 0
+            return self._index.ntotal * self._index.d * 4 + self._index.ntotal * 8
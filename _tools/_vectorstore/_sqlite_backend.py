@@ -0,0 +1,157 @@
+import json
+import sqlite3
+import threading
+import time
+import numpy as np
+from langchain_core.documents import Document
+from _tools._vectorstore._base import VectorStoreBackend
+
+
+class SQLiteBackend(VectorStoreBackend):
+    """
+    嵌入式SQLite后端：向量以float32二进制存在表中，写入即持久化，不依赖FAISS
+    检索时对全部向量做精确L2计算；向量矩阵只在首次检索时从表中载入一次，之后的写入和删除直接增量更新内存中的矩阵，不再整表重新载入
+    适合数据量不大、希望单文件部署和事务写入的场景
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = ":memory:", embedding=None):
+        super().__init__(embedding)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        # 内存中的检索矩阵：第 i 行对应 _keys[i] / _rows[i]，_positions 为 id -> 行号
+        self._loaded = False
+        self._matrix = None
+        self._rows = []
+        self._keys = []
+        self._positions = {}
+
+    def upsert(self, ids: list, texts: list, vectors: list, metadatas: list = None):
+        if not ids:
+            return
+        start_time = time.perf_counter()
+        metadatas = metadatas or [{} for _ in ids]
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        rows = [
+            (key, text, json.dumps(metadata, ensure_ascii=False), vector.tobytes())
+            for key, text, metadata, vector in zip(ids, texts, metadatas, matrix)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO vectors (id, text, metadata, vector) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+            if self._loaded:
+                self._apply_upsert(ids, texts, matrix, metadatas)
+        self._record("upsert", start_time, len(ids))
+
+    def _apply_upsert(self, ids: list, texts: list, matrix, metadatas: list):
+        """
+        已存在的id覆盖对应行，新id先在矩阵末尾追加空行再写入
+        检索在锁外使用取到的矩阵和文档列表，这里总是换成新对象再修改，不改动检索正在用的那一份
+        """
+        new_keys = [key for key in dict.fromkeys(ids) if key not in self._positions]
+        self._rows = list(self._rows)
+        if new_keys:
+            grow = np.zeros((len(new_keys), matrix.shape[1]), dtype=np.float32)
+            self._matrix = grow if self._matrix is None else np.vstack([self._matrix, grow])
+            for key in new_keys:
+                self._positions[key] = len(self._keys)
+                self._keys.append(key)
+                self._rows.append(None)
+        else:
+            self._matrix = self._matrix.copy()
+        for key, text, vector, metadata in zip(ids, texts, matrix, metadatas):
+            position = self._positions[key]
+            self._matrix[position] = vector
+            self._rows[position] = Document(page_content=text, metadata={**metadata, "id": key})
+
+    def _apply_delete(self, ids: list):
+        removed = {self._positions[key] for key in ids if key in self._positions}
+        if not removed:
+            return
+        keep = [i for i in range(len(self._keys)) if i not in removed]
+        self._matrix = self._matrix[keep] if keep else None
+        self._keys = [self._keys[i] for i in keep]
+        self._rows = [self._rows[i] for i in keep]
+        self._positions = {key: i for i, key in enumerate(self._keys)}
+
+    def delete(self, ids: list) -> int:
+        start_time = time.perf_counter()
+        with self._lock:
+            removed = 0
+            for key in ids:
+                removed += self._conn.execute("DELETE FROM vectors WHERE id = ?", (key,)).rowcount
+            self._conn.commit()
+            if self._loaded:
+                self._apply_delete(ids)
+        self._record("delete", start_time, removed)
+        return removed
+
+    def _load_matrix(self):
+        rows = self._conn.execute("SELECT id, text, metadata, vector FROM vectors").fetchall()
+        self._keys = [row[0] for row in rows]
+        self._positions = {key: i for i, key in enumerate(self._keys)}
+        self._rows = [Document(page_content=text, metadata={**json.loads(metadata), "id": key})
+                      for key, text, metadata, _ in rows]
+        self._matrix = np.vstack([np.frombuffer(row[3], dtype=np.float32) for row in rows]) if rows else None
+        self._loaded = True
+
+    def preload(self):
+        with self._lock:
+            if not self._loaded:
+                self._load_matrix()
+
+    def batch_search(self, vectors: list, k: int = 4) -> list:
+        start_time = time.perf_counter()
+        with self._lock:
+            if not self._loaded:
+                self._load_matrix()
+            matrix, docs = self._matrix, self._rows
+        if matrix is None:
+            return [[] for _ in vectors]
+        queries = np.asarray(vectors, dtype=np.float32)
+        # ||x - q||^2 = ||x||^2 - 2 x·q + ||q||^2
+        distances = (np.sum(matrix ** 2, axis=1)[None, :] - 2 * queries @ matrix.T
+                     + np.sum(queries ** 2, axis=1)[:, None])
+        k = min(k, len(docs))
+        results = []
+        for row in distances:
+            top = np.argpartition(row, k - 1)[:k]
+            top = top[np.argsort(row[top])]
+            results.append([(docs[i], float(max(row[i], 0.0))) for i in top])
+        self._record("search", start_time, len(vectors))
+        return results
+
+    def search(self, vector, k: int = 4) -> list:
+        return self.batch_search([vector], k)[0]
+
+    def snapshot(self, target_path: str = None):
+        """用SQLite在线备份接口复制一份一致的数据库文件；写入本身已持久化，目标为自身时不做任何事"""
+        if target_path is None or target_path == self.path:
+            return
+        start_time = time.perf_counter()
+        with self._lock:
+            target = sqlite3.connect(target_path)
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+        self._record("snapshot", start_time)
+
+    def ids(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM vectors")}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def memory_bytes(self) -> int:
+        matrix = self._matrix
+        return int(matrix.nbytes) if matrix is not None else 0
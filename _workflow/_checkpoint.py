@@ -0,0 +1,505 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncio
+import collections
+import threading
+import time
+from contextlib import contextmanager
+from langgraph.checkpoint.base import CheckpointTuple
+from langgraph.checkpoint.sqlite import SqliteSaver
+from _common._latency import LatencyStats
+
+# 检查点的增量存储与保留策略
+# 每轮对话的状态是完整的 messages 列表，原来每个检查点都保存一份完整列表，单个线程的存储随轮数平方增长
+# 这里每个线程只有最新的检查点保存完整状态；写入新检查点时，把父检查点的 messages 改写成
+# “子检查点 messages 的前 N 条”这样的引用，历史检查点读取时沿子检查点链还原
+DELTA_KEY = "__delta_of__"
+# 每个线程保留最近的检查点数，超过的连同写入记录一起删除
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "20"))
+# 超过该天数没有新检查点的线程整体删除，0为不过期
+CHECKPOINT_TTL_DAYS = float(os.getenv("CHECKPOINT_TTL_DAYS", "30"))
+# 后台整理间隔（秒）：执行保留策略、把旧数据改写为增量，删除的数据足够多时 VACUUM
+CHECKPOINT_COMPACT_SECONDS = float(os.getenv("CHECKPOINT_COMPACT_SECONDS", "3600"))
+CHECKPOINT_VACUUM_MIN_ROWS = int(os.getenv("CHECKPOINT_VACUUM_MIN_ROWS", "1000"))
+# 内存中缓存最新状态的活跃线程数，0为关闭
+HOT_STATE_SIZE = int(os.getenv("HOT_STATE_SIZE", "256"))
+
+try:
+    from langgraph.checkpoint.base import get_checkpoint_metadata
+except ImportError:
+    # 较早版本的 langgraph 直接保存传入的 metadata
+    def get_checkpoint_metadata(config, metadata):
+        return metadata
+
+
+def _messages_of(checkpoint: dict):
+    values = checkpoint.get("channel_values") or {}
+    messages = values.get("messages")
+    return messages if isinstance(messages, list) else None
+
+
+def _is_delta(checkpoint: dict) -> bool:
+    messages = (checkpoint.get("channel_values") or {}).get("messages")
+    return isinstance(messages, dict) and DELTA_KEY in messages
+
+
+def _is_prefix(prefix: list, messages: list) -> bool:
+    return len(prefix) <= len(messages) and all(a is b or a == b for a, b in zip(prefix, messages))
+
+
+def _copy_tuple(checkpoint_tuple):
+    """返回缓存条目的浅拷贝，调用方修改 channel_values 等字典不会改到缓存"""
+    checkpoint = checkpoint_tuple.checkpoint
+    copied = {
+        **checkpoint,
+        "channel_values": dict(checkpoint.get("channel_values") or {}),
+        "channel_versions": dict(checkpoint.get("channel_versions") or {}),
+        "versions_seen": {key: dict(value) for key, value in (checkpoint.get("versions_seen") or {}).items()},
+    }
+    return checkpoint_tuple._replace(checkpoint=copied, pending_writes=list(checkpoint_tuple.pending_writes or []))
+
+
+class HotStateCache:
+    """
+    活跃线程最新检查点的LRU缓存，键为 (thread_id, checkpoint_ns)
+    写入检查点时同时更新缓存（写穿），数据库始终是完整的；被淘汰或从未缓存的线程从数据库读取
+    只在单进程内有效：多个进程写同一个线程时需关闭（HOT_STATE_SIZE=0）
+    """
+
+    def __init__(self, size: int = HOT_STATE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, checkpoint_id: str = None):
+        """返回缓存的最新检查点；指定 checkpoint_id 时只有它恰好是最新检查点才命中"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (checkpoint_id and entry.config["configurable"]["checkpoint_id"] != checkpoint_id):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def peek(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, checkpoint_tuple):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = checkpoint_tuple
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key, checkpoint_id: str = None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (checkpoint_id is None or entry.config["configurable"]["checkpoint_id"] == checkpoint_id):
+                del self._entries[key]
+
+    def discard_thread(self, thread_id: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == thread_id]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._entries), "capacity": self.size, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0, "evictions": self.evictions}
+
+
+class DeltaSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver 的增量存储版本，接口与 SqliteSaver 相同
+    - 最新检查点保存完整状态，读取最新状态不需要任何还原
+    - 父检查点的 messages 是子检查点的前缀时，改写为 {"__delta_of__": 子检查点id, "length": 前缀长度}
+    - 被改写的检查点记录在 checkpoint_deltas 表中，不需要反序列化即可区分完整检查点和增量检查点
+    - thread_activity 表记录每个线程最后一次写入的时间，用于过期删除
+    传入连接池时，每次读写从池中借用连接，不同请求线程的检查点读写不再在同一个连接和锁上排队
+    活跃线程的最新检查点缓存在内存中（HotStateCache），每轮开始读取状态时不必查询和反序列化
+    """
+
+    def __init__(self, conn, pool=None, **kwargs):
+        self.pool = pool
+        super().__init__(conn, **kwargs)
+        self._setup_lock = threading.Lock()
+        # 检查点各操作的耗时
+        self.latency = pool.latency if pool is not None else LatencyStats()
+        # 活跃线程的最新检查点，同时用于判断下一个检查点能否把它改写为增量，不必再从数据库读取
+        self.hot = HotStateCache()
+        self._maintenance = None
+        self.maintenance_stats = {"runs": 0, "last_run": None, "last_seconds": 0.0, "expired_threads": 0,
+                                  "pruned_checkpoints": 0, "pruned_writes": 0, "compacted": 0, "vacuums": 0}
+
+    @property
+    def conn(self):
+        # 使用连接池时返回当前线程借用的连接，父类中直接访问 self.conn 的代码也会用到它
+        if self.pool is not None:
+            current = self.pool.current()
+            if current is not None:
+                return current
+        return self._conn
+
+    @conn.setter
+    def conn(self, value):
+        self._conn = value
+
+    @contextmanager
+    def cursor(self, transaction: bool = True):
+        if self.pool is None:
+            with super().cursor(transaction) as cur:
+                yield cur
+            return
+        with self.pool.connection() as conn:
+            self.setup()
+            cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                if transaction:
+                    conn.commit()
+                cur.close()
+
+    def setup(self):
+        if self.is_setup:
+            return
+        with self._setup_lock:
+            if self.is_setup:
+                return
+            self._setup_tables()
+
+    def _setup_tables(self):
+        super().setup()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoint_deltas (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL DEFAULT '',
+                checkpoint_id TEXT NOT NULL,
+                child_id TEXT NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+            );
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+    # ---------- 写入 ----------
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self.latency.timer("put"):
+            return self._put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, *args, **kwargs):
+        with self.latency.timer("put_writes"):
+            super().put_writes(config, writes, task_id, *args, **kwargs)
+        # 最新检查点有了中间写入（运行中断或出错时才会留下），缓存条目作废，下次从数据库读取完整的 pending_writes
+        configurable = config["configurable"]
+        self.hot.discard((str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")),
+                         configurable.get("checkpoint_id"))
+
+    def _put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        messages = _messages_of(checkpoint)
+        key = (thread_id, checkpoint_ns)
+        last = self.hot.peek(key)
+        self.hot.put(key, CheckpointTuple(
+            result,
+            checkpoint,
+            get_checkpoint_metadata(config, metadata),
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+            if parent_id else None,
+            [],
+        ))
+        try:
+            if parent_id and messages is not None:
+                if last is not None and last.config["configurable"]["checkpoint_id"] == parent_id:
+                    parent = last.checkpoint
+                else:
+                    # 父检查点不在内存中（重启后或已被淘汰），从数据库读取一次
+                    parent = self._load_checkpoint(thread_id, checkpoint_ns, parent_id)
+                self._encode_parent(thread_id, checkpoint_ns, parent_id, parent, checkpoint["id"], messages)
+            with self.cursor() as cur:
+                cur.execute("INSERT OR REPLACE INTO thread_activity (thread_id, updated_at) VALUES (?, ?)",
+                            (thread_id, time.time()))
+        except Exception as e:
+            # 增量改写失败不影响本次写入，父检查点保持完整状态
+            print(f"检查点增量改写失败（线程 {thread_id}）: {e}")
+        return result
+
+    def _encode_parent(self, thread_id, checkpoint_ns, parent_id, parent, child_id, child_messages) -> bool:
+        """父检查点的 messages 是子检查点的前缀时，把父检查点改写为增量"""
+        if parent is None or _is_delta(parent):
+            return False
+        parent_messages = _messages_of(parent)
+        if parent_messages is None or not _is_prefix(parent_messages, child_messages):
+            return False
+        encoded = {**parent, "channel_values": {**parent["channel_values"],
+                                                "messages": {DELTA_KEY: child_id, "length": len(parent_messages)}}}
+        type_, blob = self.serde.dumps_typed(encoded)
+        with self.cursor() as cur:
+            cur.execute(
+                "UPDATE checkpoints SET type = ?, checkpoint = ? WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (type_, blob, thread_id, checkpoint_ns, parent_id),
+            )
+            cur.execute(
+                "INSERT OR REPLACE INTO checkpoint_deltas (thread_id, checkpoint_ns, checkpoint_id, child_id) VALUES (?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, parent_id, child_id),
+            )
+        return True
+
+    # ---------- 读取 ----------
+
+    def _load_checkpoint(self, thread_id, checkpoint_ns, checkpoint_id):
+        with self.cursor(transaction=False) as cur:
+            row = cur.execute(
+                "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchone()
+        return self.serde.loads_typed(row) if row else None
+
+    def _resolve(self, thread_id, checkpoint_ns, checkpoint):
+        """沿子检查点链找到完整的 messages，截取前缀还原增量检查点"""
+        if not _is_delta(checkpoint):
+            return checkpoint
+        length = checkpoint["channel_values"]["messages"]["length"]
+        current = checkpoint
+        while _is_delta(current):
+            child_id = current["channel_values"]["messages"][DELTA_KEY]
+            current = self._load_checkpoint(thread_id, checkpoint_ns, child_id)
+            if current is None:
+                # 子检查点已被删除（保留策略只删除旧检查点，正常不会出现）
+                print(f"检查点 {child_id} 不存在，无法还原线程 {thread_id} 的历史消息")
+                return {**checkpoint, "channel_values": {**checkpoint["channel_values"], "messages": []}}
+        messages = current["channel_values"]["messages"][:length]
+        return {**checkpoint, "channel_values": {**checkpoint["channel_values"], "messages": messages}}
+
+    def _resolve_tuple(self, checkpoint_tuple):
+        if checkpoint_tuple is None or not _is_delta(checkpoint_tuple.checkpoint):
+            return checkpoint_tuple
+        configurable = checkpoint_tuple.config["configurable"]
+        checkpoint = self._resolve(str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""),
+                                   checkpoint_tuple.checkpoint)
+        return checkpoint_tuple._replace(checkpoint=checkpoint)
+
+    def get_tuple(self, config):
+        configurable = config["configurable"]
+        key = (str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""))
+        checkpoint_id = configurable.get("checkpoint_id")
+        cached = self.hot.get(key, checkpoint_id)
+        if cached is not None:
+            return _copy_tuple(cached)
+        return self._get_tuple_uncached(config)
+
+    def _get_tuple_uncached(self, config):
+        configurable = config["configurable"]
+        key = (str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""))
+        checkpoint_id = configurable.get("checkpoint_id")
+        with self.latency.timer("get_tuple"):
+            result = self._resolve_tuple(super().get_tuple(config))
+        if result is not None and not checkpoint_id:
+            self.hot.put(key, result)
+            return _copy_tuple(result)
+        return result
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        # 父类的 list 在遍历期间持有连接锁，先取出全部结果再还原，避免还原时重复加锁
+        with self.latency.timer("list"):
+            items = list(super().list(config, filter=filter, before=before, limit=limit))
+        for item in items:
+            yield self._resolve_tuple(item)
+
+    # ---------- 异步接口 ----------
+    # SqliteSaver 的异步方法直接抛出 NotImplementedError，app.ainvoke 需要它们
+    # sqlite3 没有异步驱动，这里把同步实现放到线程池执行；连接池让多个线程的读写可以并发
+    # 命中内存缓存的读取直接返回，不切换线程
+
+    async def aget_tuple(self, config):
+        configurable = config["configurable"]
+        key = (str(configurable["thread_id"]), configurable.get("checkpoint_ns", ""))
+        cached = self.hot.get(key, configurable.get("checkpoint_id"))
+        if cached is not None:
+            return _copy_tuple(cached)
+        return await asyncio.to_thread(self._get_tuple_uncached, config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, *args, **kwargs):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, *args, **kwargs)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ---------- 删除与保留策略 ----------
+
+    def delete_thread(self, thread_id):
+        thread_id = str(thread_id)
+        with self.cursor() as cur:
+            for table in ("checkpoints", "writes", "checkpoint_deltas", "thread_activity"):
+                cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        self.hot.discard_thread(thread_id)
+
+    def _expire_threads(self) -> int:
+        if CHECKPOINT_TTL_DAYS <= 0:
+            return 0
+        with self.cursor() as cur:
+            # 没有活动记录的旧线程从现在开始计时
+            cur.execute(
+                "INSERT OR IGNORE INTO thread_activity (thread_id, updated_at) "
+                "SELECT DISTINCT thread_id, ? FROM checkpoints", (time.time(),))
+            expired = [row[0] for row in cur.execute(
+                "SELECT thread_id FROM thread_activity WHERE updated_at < ?",
+                (time.time() - CHECKPOINT_TTL_DAYS * 86400,)).fetchall()]
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+        return len(expired)
+
+    def _prune_thread(self, thread_id) -> tuple:
+        """
+        只保留线程最近的 CHECKPOINT_KEEP_LAST 个检查点；保留的检查点中已有子检查点的，
+        其写入记录（上一步的中间写入，子检查点已包含其结果）也一并删除
+        删除只发生在链的旧端，保留下来的增量检查点仍能沿子检查点链还原
+        """
+        with self.cursor() as cur:
+            rows = cur.execute(
+                "SELECT checkpoint_ns, checkpoint_id FROM checkpoints WHERE thread_id = ? "
+                "ORDER BY checkpoint_ns, checkpoint_id DESC", (thread_id,)).fetchall()
+            by_ns = {}
+            for checkpoint_ns, checkpoint_id in rows:
+                by_ns.setdefault(checkpoint_ns, []).append(checkpoint_id)
+            pruned_checkpoints = pruned_writes = 0
+            for checkpoint_ns, ids in by_ns.items():
+                for checkpoint_id in ids[CHECKPOINT_KEEP_LAST:]:
+                    for table in ("checkpoints", "writes", "checkpoint_deltas"):
+                        count = cur.execute(
+                            f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                            (thread_id, checkpoint_ns, checkpoint_id)).rowcount
+                        if table == "checkpoints":
+                            pruned_checkpoints += count
+                        elif table == "writes":
+                            pruned_writes += count
+                pruned_writes += cur.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id IN "
+                    "(SELECT checkpoint_id FROM checkpoint_deltas WHERE thread_id = ? AND checkpoint_ns = ?)",
+                    (thread_id, checkpoint_ns, thread_id, checkpoint_ns)).rowcount
+        return pruned_checkpoints, pruned_writes
+
+    def _compact_thread(self, thread_id) -> int:
+        """把升级前写入的完整检查点改写为增量：按时间从新到旧两两比较"""
+        with self.cursor(transaction=False) as cur:
+            rows = cur.execute(
+                "SELECT checkpoint_ns, checkpoint_id FROM checkpoints c WHERE thread_id = ? AND NOT EXISTS "
+                "(SELECT 1 FROM checkpoint_deltas d WHERE d.thread_id = c.thread_id AND "
+                "d.checkpoint_ns = c.checkpoint_ns AND d.checkpoint_id = c.checkpoint_id) "
+                "ORDER BY checkpoint_ns, checkpoint_id DESC", (thread_id,)).fetchall()
+        compacted = 0
+        child = None
+        for checkpoint_ns, checkpoint_id in rows:
+            checkpoint = self._load_checkpoint(thread_id, checkpoint_ns, checkpoint_id)
+            if child is not None and child[0] == checkpoint_ns:
+                child_messages = _messages_of(child[2])
+                if child_messages is not None and self._encode_parent(
+                        thread_id, checkpoint_ns, checkpoint_id, checkpoint, child[1], child_messages):
+                    compacted += 1
+            child = (checkpoint_ns, checkpoint_id, checkpoint)
+        return compacted
+
+    def run_maintenance(self) -> dict:
+        """执行一次保留策略和整理，返回本次的统计"""
+        start_time = time.time()
+        expired = self._expire_threads()
+        with self.cursor(transaction=False) as cur:
+            threads = [row[0] for row in cur.execute(
+                "SELECT thread_id FROM checkpoints GROUP BY thread_id").fetchall()]
+            # 有多个完整检查点的线程才需要改写
+            full_threads = {row[0] for row in cur.execute(
+                "SELECT thread_id FROM checkpoints c WHERE NOT EXISTS (SELECT 1 FROM checkpoint_deltas d WHERE "
+                "d.thread_id = c.thread_id AND d.checkpoint_ns = c.checkpoint_ns AND d.checkpoint_id = c.checkpoint_id) "
+                "GROUP BY thread_id, checkpoint_ns HAVING COUNT(*) > 1").fetchall()}
+        pruned_checkpoints = pruned_writes = compacted = 0
+        for thread_id in threads:
+            checkpoints, writes = self._prune_thread(thread_id)
+            pruned_checkpoints += checkpoints
+            pruned_writes += writes
+            if thread_id in full_threads:
+                compacted += self._compact_thread(thread_id)
+        vacuumed = False
+        if expired or pruned_checkpoints + pruned_writes + compacted >= CHECKPOINT_VACUUM_MIN_ROWS:
+            with self.cursor() as cur:
+                self.conn.commit()
+                cur.execute("VACUUM")
+            vacuumed = True
+        summary = {"expired_threads": expired, "pruned_checkpoints": pruned_checkpoints,
+                   "pruned_writes": pruned_writes, "compacted": compacted, "vacuumed": vacuumed,
+                   "seconds": time.time() - start_time}
+        stats = self.maintenance_stats
+        stats["runs"] += 1
+        stats["last_run"] = time.time()
+        stats["last_seconds"] = summary["seconds"]
+        for key in ("expired_threads", "pruned_checkpoints", "pruned_writes", "compacted"):
+            stats[key] += summary[key]
+        stats["vacuums"] += int(vacuumed)
+        print(f"检查点整理完成: {summary}")
+        return summary
+
+    def _maintenance_loop(self):
+        while True:
+            try:
+                self.run_maintenance()
+            except Exception as e:
+                print(f"检查点整理失败: {e}")
+            time.sleep(CHECKPOINT_COMPACT_SECONDS)
+
+    def start_maintenance(self):
+        """启动后台整理线程（进程内只启动一次）"""
+        if self._maintenance is None and CHECKPOINT_COMPACT_SECONDS > 0:
+            self._maintenance = threading.Thread(target=self._maintenance_loop, name="checkpoint-maintenance",
+                                                 daemon=True)
+            self._maintenance.start()
+
+    def storage_stats(self) -> dict:
+        with self.cursor(transaction=False) as cur:
+            checkpoints, size = cur.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(checkpoint)), 0) FROM checkpoints").fetchone()
+            deltas = cur.execute("SELECT COUNT(*) FROM checkpoint_deltas").fetchone()[0]
+            writes, writes_size = cur.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()
+            threads = cur.execute("SELECT COUNT(DISTINCT thread_id) FROM checkpoints").fetchone()[0]
+            page_count = cur.execute("PRAGMA page_count").fetchone()[0]
+            page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "delta_checkpoints": deltas,
+            "full_checkpoints": checkpoints - deltas,
+            "checkpoint_bytes": size,
+            "writes": writes,
+            "writes_bytes": writes_size,
+            "file_bytes": page_count * page_size,
+            "policy": {"keep_last": CHECKPOINT_KEEP_LAST, "ttl_days": CHECKPOINT_TTL_DAYS,
+                       "compact_seconds": CHECKPOINT_COMPACT_SECONDS},
+            "maintenance": dict(self.maintenance_stats),
+            "latency": self.latency.summary(),
+            "pool": self.pool.stats() if self.pool is not None else None,
+            "hot_state": self.hot.stats(),
+        }
@@ -1,37 +1,29 @@
-import os, sqlite3
-from langgraph.checkpoint.sqlite import SqliteSaver
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from _workflow._checkpoint import DeltaSqliteSaver
+from _workflow._sqlite_pool import SQLitePool
 database_path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),"checkpoints.db"))
 class Database:
     _instance = None
-    conn = sqlite3.connect(database_path, check_same_thread=False)
-    memory = SqliteSaver(conn)
-    
+    # 连接池（WAL）：并发的对话请求各自借用连接读写检查点，conn 为池的主连接
+    pool = SQLitePool(database_path)
+    conn = pool.primary
+    # 增量存储的检查点：每个线程只有最新检查点保存完整消息列表，旧检查点按保留策略定期清理
+    memory = DeltaSqliteSaver(conn, pool=pool)
+
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super(Database, cls).__new__(cls, *args, **kwargs)
         return cls.memory
-    
+
     @classmethod
     def delete_thread(cls, thread_id):
-        """删除指定线程ID的所有记忆数据"""
-        cursor = cls.conn.cursor()
-        try:
-            # 删除checkpoints表中的线程数据
-            cursor.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
-            # 删除checkpoint_writes表中的线程数据
-            cursor.execute("DELETE FROM checkpoint_writes WHERE thread_id = ?", (thread_id,))
-            # 删除checkpoint_blobs表中的线程数据（如果存在）
-            cursor.execute("DELETE FROM checkpoint_blobs WHERE thread_id = ?", (thread_id,))
-            cls.conn.commit()
-            return True
-        except Exception as e:
-            cls.conn.rollback()
-            raise e
-        finally:
-            cursor.close()
+        """删除指定线程ID的所有记忆数据（检查点、中间写入和增量记录）"""
+        cls.memory.delete_thread(thread_id)
+        return True
 
 checkpointer = Database()
-    
+
 
 
 
@@ -0,0 +1,120 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import logging
+from langchain_core.messages import HumanMessage, SystemMessage
+from _token._price import count_tokens
+from model._router import get_model
+
+# 对话历史管理：最近的若干轮原文保留，更早的消息增量合并进一段滚动总结，总结和已总结的消息数保存在检查点状态中
+# 每轮送给智能体的历史（总结 + 原文）不超过token预算，长对话的提示长度、延迟和费用不再随轮数增长
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# 总结长度上限（token）：提示中按常见汉字约0.7个token折算成字数告诉模型，同时作为输出的 max_tokens 硬上限
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "500"))
+
+SUMMARY_PROMPT = (
+    "你是一个对话记录助手。下面给出已有的对话总结和之后新增的若干条对话，请把新增内容合并进总结，"
+    "保留用户的身份、偏好、提出过的问题和已经给出的关键结论，删去寒暄和重复内容。"
+    f"只输出更新后的总结，不超过{int(HISTORY_SUMMARY_TOKENS / 0.7)}字。"
+)
+
+logger = logging.getLogger('workflow')
+
+
+def _format(message) -> str:
+    return f"Human: {message.content}" if isinstance(message, HumanMessage) else f"Assistant: {message.content}"
+
+
+def _recent_start(lines: list, counts: list, floor: int = 0) -> int:
+    """从最后一条往前保留原文，直到超出轮数或token预算（最多到 floor，之前的已在总结中），返回保留部分的起始下标"""
+    start, used = len(lines), 0
+    for i in range(len(lines) - 1, floor - 1, -1):
+        if len(lines) - i > HISTORY_MAX_TURNS * 2 or used + counts[i] > HISTORY_TOKEN_BUDGET:
+            break
+        used += counts[i]
+        start = i
+    return start
+
+
+def _summary_messages(summary: str, lines: list) -> list:
+    content = f"已有总结：\n{summary or '（无）'}\n\n新增对话：\n" + "\n".join(lines)
+    return [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=content)]
+
+
+def _summary_model():
+    return get_model("history_summary").bind(max_tokens=HISTORY_SUMMARY_TOKENS)
+
+
+def update_summary(summary: str, lines: list) -> str:
+    """把新移出原文窗口的消息合并进已有总结（一次快速模型调用）"""
+    return _summary_model().invoke(_summary_messages(summary, lines)).content.strip()
+
+
+async def aupdate_summary(summary: str, lines: list) -> str:
+    return (await _summary_model().ainvoke(_summary_messages(summary, lines))).content.strip()
+
+
+def _plan(messages: list, summarized: int):
+    """
+    计算本轮的原文窗口和需要合并进总结的批次
+    通常每轮只有一两条消息移出窗口；没有总结过的旧线程按预算分批合并，避免单次总结超长
+    已合并进总结的消息不再格式化和计数，每轮的开销只取决于未总结的部分
+    """
+    history = messages[:-1]
+    summarized = min(summarized, len(history))
+    pending = [_format(msg) for msg in history[summarized:]]
+    lines = [""] * summarized + pending
+    counts = [0] * summarized + (count_tokens(pending) if pending else [])
+    start = _recent_start(lines, counts, summarized)
+    batches = []
+    begin = summarized
+    while begin < start:
+        end, used = begin, 0
+        while end < start and (end == begin or used + counts[end] <= HISTORY_TOKEN_BUDGET * 2):
+            used += counts[end]
+            end += 1
+        batches.append((begin, end))
+        begin = end
+    return lines, start, batches
+
+
+def _render(messages: list, lines: list, start: int, summary: str) -> str:
+    parts = []
+    if summary:
+        parts.append(f"Conversation summary:\n{summary}")
+    if start < len(lines):
+        parts.append("Previous conversation:\n" + "\n".join(lines[start:]))
+    current_query = messages[-1].content
+    return "\n\n".join(parts + [f"Current question: {current_query}"]) if parts else current_query
+
+
+def build_context(messages: list, summary: str = "", summarized: int = 0):
+    """
+    根据线程的全部消息构造本轮提示，最后一条为当前问题
+    返回 (提示文本, 新的总结, 新的已总结消息数)，后两者写回检查点状态
+    总结失败时保留原总结，未合并的消息下一轮再试
+    """
+    lines, start, batches = _plan(messages, summarized)
+    for begin, end in batches:
+        try:
+            summary = update_summary(summary, lines[begin:end])
+            logger.info(f"对话总结已更新：合并 {end - begin} 条消息，总结长度 {len(summary)}")
+            summarized = end
+        except Exception as e:
+            logger.warning(f"更新对话总结失败，本轮仅使用已有总结和最近的对话: {str(e)}")
+            break
+    return _render(messages, lines, start, summary), summary, summarized
+
+
+async def abuild_context(messages: list, summary: str = "", summarized: int = 0):
+    """build_context 的异步版本，总结调用不阻塞事件循环"""
+    lines, start, batches = _plan(messages, summarized)
+    for begin, end in batches:
+        try:
+            summary = await aupdate_summary(summary, lines[begin:end])
+            logger.info(f"对话总结已更新：合并 {end - begin} 条消息，总结长度 {len(summary)}")
+            summarized = end
+        except Exception as e:
+            logger.warning(f"更新对话总结失败，本轮仅使用已有总结和最近的对话: {str(e)}")
+            break
+    return _render(messages, lines, start, summary), summary, summarized
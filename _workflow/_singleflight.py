@@ -0,0 +1,116 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncio
+import threading
+import time
+from _common._latency import LatencyStats
+
+# 合并进行中的相同请求：同一问题（同一联网/推理模式）正在处理时，后到的请求等待第一个请求的结果，不再各自调用模型和搜索
+# 回答依赖对话历史，只有还没有历史消息的线程参与合并（由调用方判断）
+# 只在本进程内合并，多个 worker 进程之间互不感知
+COALESCE_ENABLED = os.getenv("CHAT_COALESCE", "1") != "0"
+
+
+class LeaderAborted(Exception):
+    """领头请求没有产生结果就退出（如客户端断开），跟随的请求需要自己处理"""
+    pass
+
+
+def coalesce_key(query: str, enable_web: bool, enable_illation: bool) -> str:
+    """归一化问题（合并空白、忽略大小写）加上模式作为合并的键"""
+    normalized = " ".join((query or "").split()).casefold()
+    return f"{int(bool(enable_web))}{int(bool(enable_illation))}:{normalized}"
+
+
+class SingleFlight:
+    """
+    按键合并进行中的异步调用，第一个请求为领头，其余为跟随
+    领头的结果原样交给所有跟随者；跟随者的等待时间单独统计
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.aborted = 0
+        self.waits = LatencyStats()
+
+    def join(self, key: str):
+        """键上有进行中的请求时返回其 future（调用方作为跟随者等待），否则返回 None"""
+        if not COALESCE_ENABLED:
+            return None
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.followers += 1
+            return flight
+
+    def lead(self, key: str):
+        """登记为领头请求，返回的 future 需要用 finish 结束；key 为 None 时不登记，不会有请求跟随"""
+        future = asyncio.get_running_loop().create_future()
+        if key is None:
+            return future
+        with self._lock:
+            self.leaders += 1
+            if COALESCE_ENABLED:
+                self._flights.setdefault(key, future)
+        return future
+
+    def finish(self, key: str, future, result=None, error: BaseException = None):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+        if future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            self.aborted += 1
+            future.set_exception(error if isinstance(error, Exception) else LeaderAborted(str(error)))
+            # 没有跟随者时也标记异常已取出，避免事件循环打印 "exception was never retrieved"
+            future.exception()
+
+    async def follow(self, future):
+        """等待领头请求的结果，返回 (结果, 等待秒数)；领头失败时抛出其异常"""
+        start = time.perf_counter()
+        try:
+            # shield：跟随者被取消时不影响领头请求的 future
+            return await asyncio.shield(future), time.perf_counter() - start
+        finally:
+            self.waits.add("follower_wait", time.perf_counter() - start)
+
+    async def run(self, key: str, func):
+        """
+        合并执行 func()（返回协程）：返回 (结果, 等待秒数)，领头请求的等待秒数为 None
+        领头请求失败或被取消时，跟随者各自执行 func()
+        """
+        flight = self.join(key)
+        if flight is not None:
+            try:
+                return await self.follow(flight)
+            except Exception:
+                return await func(), None
+        future = self.lead(key)
+        try:
+            result = await func()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result, None
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._flights)
+        return {
+            "enabled": COALESCE_ENABLED,
+            "in_flight": in_flight,
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "aborted": self.aborted,
+            "wait": self.waits.summary().get("follower_wait", {}),
+        }
+
+
+chat_flights = SingleFlight()
@@ -0,0 +1,104 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from _common._latency import LatencyStats
+
+# SQLite连接池：WAL模式下读写可以并发，多个请求线程各自借用一个连接，不再在同一个连接上排队
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+# 等待写锁的上限（毫秒），超时抛出 database is locked，不会无限阻塞请求
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# 每个连接的页缓存（KB）
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "16384"))
+# 借用连接的等待上限（秒）
+SQLITE_POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # WAL 下 NORMAL 只在检查点时 fsync，掉电最多丢失最近的事务，不会损坏数据库
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    f"PRAGMA cache_size=-{SQLITE_CACHE_KB}",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class SQLitePoolTimeout(TimeoutError):
+    """等待连接池归还连接超时"""
+    pass
+
+
+class SQLitePool:
+    """
+    固定大小的SQLite连接池，连接在首次需要时创建，全部设置 WAL、busy_timeout 等参数
+    同一线程嵌套借用时返回同一个连接，避免同一线程占用两个连接后互相等待
+    """
+
+    def __init__(self, path: str, size: int = SQLITE_POOL_SIZE):
+        self.path = path
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._create_lock = threading.Lock()
+        self._local = threading.local()
+        self.latency = LatencyStats()
+        self.waits = 0
+        # 主连接：供需要一个固定连接的旧代码使用，不参与借用
+        self.primary = self._connect()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._create_lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        # 连接已全部借出，等待归还
+        self.waits += 1
+        with self.latency.timer("pool_wait"):
+            try:
+                return self._idle.get(timeout=SQLITE_POOL_TIMEOUT)
+            except queue.Empty:
+                raise SQLitePoolTimeout(
+                    f"SQLite连接池已耗尽，等待 {SQLITE_POOL_TIMEOUT:g}s 后仍没有空闲连接（{self.path}，共{self.size}个连接）") from None
+
+    @contextmanager
+    def connection(self):
+        current = getattr(self._local, "conn", None)
+        if current is not None:
+            yield current
+            return
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def current(self):
+        """当前线程借用中的连接，没有时为 None"""
+        return getattr(self._local, "conn", None)
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "size": self.size,
+            "created": self._created,
+            "idle": self._idle.qsize(),
+            "waits": self.waits,
+            "busy_timeout_ms": SQLITE_BUSY_TIMEOUT_MS,
+            "latency": self.latency.summary(),
+        }
@@ -2,10 +2,16 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from langgraph.graph import START, END, MessagesState, StateGraph
 from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
 from _workflow._database import checkpointer
-from _agents.basic_agent._agent import get_answer_and_illation
+from _agents.basic_agent._agent import get_answer_and_illation, aget_answer_and_illation, format_observation
 from _cache._cache_handle import get_content_from_cache, cache_content
-from _token._price import cache_tokens_price, agent_tokens_price
+from _token._usage import begin_usage
+from model._router import classify_chat_task
+from _workflow._history import build_context, abuild_context
+from _workflow._singleflight import chat_flights, coalesce_key, LeaderAborted
+import asyncio
+import functools
 import logging
 import time
 import traceback
@@ -22,103 +28,145 @@ logging.basicConfig(
 )
 logger = logging.getLogger('workflow')
 
-# 增加重试机制的装饰器
+# 增加重试机制的装饰器（同时支持普通函数和协程函数）
 def with_retry(max_retries=3, initial_delay=1, backoff_factor=2):
     def decorator(func):
+        def on_failure(e, retries):
+            logger.warning(f"操作失败，进行重试 ({retries}/{max_retries}): {str(e)}")
+
+        def give_up(last_exception):
+            # 如果所有重试都失败，记录错误并返回错误信息
+            logger.error(f"所有重试都失败: {str(last_exception)}")
+            logger.error(traceback.format_exc())
+            raise last_exception
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                delay = initial_delay
+                last_exception = None
+                for retries in range(1, max_retries + 1):
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        last_exception = e
+                        on_failure(e, retries)
+                        if retries < max_retries:
+                            await asyncio.sleep(delay)
+                            delay *= backoff_factor
+                give_up(last_exception)
+            return async_wrapper
+
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            retries = 0
             delay = initial_delay
             last_exception = None
-            
-            while retries < max_retries:
+            for retries in range(1, max_retries + 1):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
                     last_exception = e
-                    logger.warning(f"操作失败，进行重试 ({retries+1}/{max_retries}): {str(e)}")
-                    retries += 1
+                    on_failure(e, retries)
                     if retries < max_retries:
                         time.sleep(delay)
                         delay *= backoff_factor
-            
-            # 如果所有重试都失败，记录错误并返回错误信息
-            logger.error(f"所有重试都失败: {str(last_exception)}")
-            logger.error(traceback.format_exc())
-            raise last_exception
+            give_up(last_exception)
             
         return wrapper
     return decorator
 
+# 对话状态：消息列表之外，保存较早消息的滚动总结和已合并进总结的消息数
+class ChatState(MessagesState):
+    summary: str
+    summarized: int
+
+# 读取本轮的联网、推理设置，并按当前问题选择模型：简短寒暄用快速模型，其余用默认模型
+def _agent_settings(state: ChatState, config: dict):
+    current_query = state["messages"][-1].content
+    web_state = config["configurable"].get("web_state", False) if config else False
+    illation_state = config["configurable"].get("illation_state", False) if config else False  
+    logger.info(f"联网状态：{web_state}")
+    logger.info(f"推理状态：{illation_state}")
+    task = classify_chat_task(current_query)
+    logger.info(f"模型路由：{task}")
+    return web_state, illation_state, task
+
+# 把agent的回答加入消息流，并写回新的历史总结
+def _agent_reply(state: ChatState, answer, illation, start_time: float, summary: str, summarized: int):
+    # 记录执行时间
+    execution_time = time.time() - start_time
+    logger.info(f"Agent执行完成，耗时: {execution_time:.2f}秒")
+    
+    if illation:
+        logger.info(f"推理完成，答案长度: {len(answer) if answer else 0}")
+        
+    # 检查响应是否为空
+    if not answer or not answer.strip():
+        logger.warning("Agent返回了空响应")
+        answer = "抱歉，我无法为您的问题生成有效答案。请尝试重新表述您的问题或稍后再试。"
+
+    # 创建包含状态信息的元数据
+    metadata = {
+        "status": "completed",
+        "execution_time": execution_time,
+        "has_illation": illation is not None,
+        "timestamp": time.time()
+    }
+
+    # 添加 AI 回复到消息流，并附加元数据
+    result_message = AIMessage(content=answer, illation=illation, additional_kwargs={"metadata": metadata})
+    return {"messages": state["messages"] + [result_message], "summary": summary, "summarized": summarized}
+
+def _agent_error(state: ChatState, e: Exception, start_time: float):
+    # 记录错误执行时间
+    execution_time = time.time() - start_time
+    logger.error(f"调用Agent节点发生错误: {str(e)}")
+    logger.error(traceback.format_exc())
+    
+    # 创建错误状态元数据
+    error_metadata = {
+        "status": "error",
+        "execution_time": execution_time,
+        "error_type": type(e).__name__,
+        "timestamp": time.time()
+    }
+    
+    # 返回错误消息，避免工作流崩溃
+    error_message = f"抱歉，系统处理您的请求时遇到了问题。错误详情: {str(e)[:100]}..."
+    return {"messages": state["messages"] + [AIMessage(content=error_message, additional_kwargs={"metadata": error_metadata})]}
+
 # 节点：调用 agent
-def call_agent(state: MessagesState, config: dict):
+def call_agent(state: ChatState, config: dict):
     start_time = time.time()
     try:
-        # 构建带上下文的提示
-        messages = state["messages"]
-        history = "\n".join([
-            f"Human: {msg.content}" if isinstance(msg, HumanMessage) else f"Assistant: {msg.content}"
-            for msg in messages[:-1]
-        ])
-        
-        # 将历史记录和当前问题组合
-        current_query = messages[-1].content
-        query_with_context = f"Previous conversation:\n{history}\n\nCurrent question: {current_query}" if history else current_query
-
-        # 获取联网状态
-        web_state = config["configurable"].get("web_state", False) if config else False
-        illation_state = config["configurable"].get("illation_state", False) if config else False  
-        logger.info(f"联网状态：{web_state}")
-        logger.info(f"推理状态：{illation_state}")
+        # 构建带上下文的提示：较早的消息只以总结形式出现，最近几轮保留原文，总长度受token预算限制
+        query_with_context, summary, summarized = build_context(
+            state["messages"], state.get("summary", ""), state.get("summarized", 0))
+        web_state, illation_state, task = _agent_settings(state, config)
 
         # 使用agent处理（不使用其内部记忆）
-        answer, illation = get_answer_and_illation(query_with_context, web_state, illation_state)
-        
-        # 记录执行时间
-        execution_time = time.time() - start_time
-        logger.info(f"Agent执行完成，耗时: {execution_time:.2f}秒")
-        
-        if illation:
-            logger.info(f"推理完成，答案长度: {len(answer) if answer else 0}")
-            
-        # 检查响应是否为空
-        if not answer or not answer.strip():
-            logger.warning("Agent返回了空响应")
-            answer = "抱歉，我无法为您的问题生成有效答案。请尝试重新表述您的问题或稍后再试。"
-
-        # 创建包含状态信息的元数据
-        metadata = {
-            "status": "completed",
-            "execution_time": execution_time,
-            "has_illation": illation is not None,
-            "timestamp": time.time()
-        }
-
-        # 添加 AI 回复到消息流，并附加元数据
-        result_message = AIMessage(content=answer, illation=illation, additional_kwargs={"metadata": metadata})
-        return {"messages": state["messages"] + [result_message]}
-        
+        answer, illation = get_answer_and_illation(query_with_context, web_state, illation_state, task)
+        return _agent_reply(state, answer, illation, start_time, summary, summarized)
     except Exception as e:
-        # 记录错误执行时间
-        execution_time = time.time() - start_time
-        logger.error(f"调用Agent节点发生错误: {str(e)}")
-        logger.error(traceback.format_exc())
-        
-        # 创建错误状态元数据
-        error_metadata = {
-            "status": "error",
-            "execution_time": execution_time,
-            "error_type": type(e).__name__,
-            "timestamp": time.time()
-        }
-        
-        # 返回错误消息，避免工作流崩溃
-        error_message = f"抱歉，系统处理您的请求时遇到了问题。错误详情: {str(e)[:100]}..."
-        return {"messages": state["messages"] + [AIMessage(content=error_message, additional_kwargs={"metadata": error_metadata})]}
+        return _agent_error(state, e, start_time)
+
+# 节点的异步版本：app.ainvoke 时使用，模型调用期间让出事件循环
+async def acall_agent(state: ChatState, config: dict):
+    start_time = time.time()
+    try:
+        query_with_context, summary, summarized = await abuild_context(
+            state["messages"], state.get("summary", ""), state.get("summarized", 0))
+        web_state, illation_state, task = _agent_settings(state, config)
+        answer, illation = await aget_answer_and_illation(query_with_context, web_state, illation_state, task)
+        return _agent_reply(state, answer, illation, start_time, summary, summarized)
+    except Exception as e:
+        return _agent_error(state, e, start_time)
 
 # 构建 LangGraph
 try:
-    workflow = StateGraph(state_schema=MessagesState)
-    workflow.add_node("agent", call_agent)
+    workflow = StateGraph(state_schema=ChatState)
+    # 同一个节点同时提供同步和异步实现：chat() 走 invoke，achat() 走 ainvoke
+    workflow.add_node("agent", RunnableLambda(call_agent, acall_agent, name="agent"))
     workflow.add_edge(START, "agent")
     workflow.add_edge("agent", END)
 
@@ -129,12 +177,55 @@ except Exception as e:
     logger.critical(f"工作流初始化失败: {str(e)}")
     logger.critical(traceback.format_exc())
     # 创建一个简单的后备工作流
-    workflow = StateGraph(state_schema=MessagesState)
+    workflow = StateGraph(state_schema=ChatState)
     workflow.add_node("fallback", lambda state: {"messages": state["messages"] + [AIMessage(content="系统初始化失败，请联系管理员。")]})
     workflow.add_edge(START, "fallback")
     workflow.add_edge("fallback", END)
     app = workflow.compile()
 
+# 缓存命中时的返回值：只有查询缓存的embedding调用
+def _cache_response(cached_answer, cache_illation, usage, start_time: float, enable_illation: bool):
+    logger.info("[缓存命中]")
+    cache_price = usage.summary()
+    cache_price["status"] = "completed"
+    cache_price["source"] = "cache"
+    cache_price["time"] = time.time() - start_time
+    
+    # 只有在启用推理的情况下才返回推理过程
+    return cached_answer, cache_price, cache_illation if enable_illation else None
+
+# 从工作流结果中取出回答；返回 (回答, 价格, 推理过程, 是否写入缓存)
+def _agent_response(res, usage, start_time: float, enable_illation: bool):
+    # 确保获取到最后一条消息
+    if res and "messages" in res and len(res["messages"]) > 0:
+        last_message = res["messages"][-1]
+        
+        if isinstance(last_message, AIMessage):
+            agent_answer = last_message.content
+            agent_price = usage.summary()
+            agent_price["status"] = "completed"
+            agent_price["source"] = "agent"
+            agent_price["time"] = time.time() - start_time
+            
+            # 获取推理过程
+            agent_illation = getattr(last_message, 'illation', None)
+            
+            # 检查是否有实际答案内容
+            if agent_answer and agent_answer.strip():
+                return agent_answer, agent_price, agent_illation, True
+        else:
+            logger.warning(f"最后一条消息不是AI消息: {type(last_message)}")
+    else:
+        logger.warning("返回结果没有消息列表或消息列表为空")
+    
+    # 如果没有获取到有效回答
+    logger.warning("未能从agent获取有效回答")
+    return "抱歉，我无法为您的问题生成有效答案。请尝试重新表述您的问题。", {"price": 0, "tokens": 0, "status": "error", "time": time.time() - start_time}, None, False
+
+def _error_response(message: str, e: Exception, start_time: float):
+    logger.error(traceback.format_exc())
+    return f"{message}{str(e)[:100]}...", {"price": 0, "tokens": 0, "status": "error", "error": str(e), "time": time.time() - start_time}, None
+
 # 聊天
 @with_retry(max_retries=2, initial_delay=1, backoff_factor=2)
 def chat(query: str, enable_web: bool, enable_illation: bool, thread_id: str = "abc123"):
@@ -145,6 +236,8 @@ def chat(query: str, enable_web: bool, enable_illation: bool, thread_id: str = "
     3. 如果enable_web和enable_illation都为False，则不启用联网和推理
     """
     start_time = time.time()
+    # 本次请求中所有模型调用（对话、OCR、embedding）的实际用量都计入这里
+    usage = begin_usage()
     try:
         # 输入验证
         if not query or not query.strip():
@@ -154,17 +247,7 @@ def chat(query: str, enable_web: bool, enable_illation: bool, thread_id: str = "
         # 查询缓存
         cached_answer, cache_illation = get_content_from_cache(query)
         if cached_answer and not enable_web:
-            logger.info("[缓存命中]")
-            cache_price = cache_tokens_price(query, cached_answer)
-            cache_price["status"] = "completed"
-            cache_price["source"] = "cache"
-            cache_price["time"] = time.time() - start_time
-            
-            # 只有在启用推理的情况下才返回推理过程
-            if enable_illation:
-                return cached_answer, cache_price, cache_illation
-            else:
-                return cached_answer, cache_price, None
+            return _cache_response(cached_answer, cache_illation, usage, start_time, enable_illation)
 
         # 没有命中则调用 agent
         logger.info("缓存未命中，调用 agent")
@@ -176,52 +259,244 @@ def chat(query: str, enable_web: bool, enable_illation: bool, thread_id: str = "
         # 调用 agent
         try:
             res = app.invoke({"messages": [HumanMessage(content=query)]}, config)
-            # 确保获取到最后一条消息
-            if res and "messages" in res and len(res["messages"]) > 0:
-                last_message = res["messages"][-1]
-                
-                if isinstance(last_message, AIMessage):
-                    agent_answer = last_message.content
-                    agent_price = agent_tokens_price(query, agent_answer)
-                    agent_price["status"] = "completed"
-                    agent_price["source"] = "agent"
-                    agent_price["time"] = time.time() - start_time
-                    
-                    # 获取元数据和推理过程
-                    metadata = getattr(last_message, 'additional_kwargs', {}).get('metadata', {})
-                    agent_illation = getattr(last_message, 'illation', None)
-                    
-                    # 检查是否有实际答案内容
-                    if agent_answer and agent_answer.strip():
-                        # 将答案和推理过程（如果有）写入缓存
-                        try:
-                            cache_content(query, agent_answer, agent_price["price"], agent_price["tokens"], agent_illation)
-                        except Exception as cache_err:
-                            logger.error(f"缓存写入失败: {str(cache_err)}")
-                        
-                        # 只有在启用推理的情况下才返回推理过程
-                        if enable_illation:
-                            return agent_answer, agent_price, agent_illation
-                        else:
-                            return agent_answer, agent_price, None
-                else:
-                    logger.warning(f"最后一条消息不是AI消息: {type(last_message)}")
-            else:
-                logger.warning("返回结果没有消息列表或消息列表为空")
-            
-            # 如果没有获取到有效回答
-            logger.warning("未能从agent获取有效回答")
-            return "抱歉，我无法为您的问题生成有效答案。请尝试重新表述您的问题。", {"price": 0, "tokens": 0, "status": "error", "time": time.time() - start_time}, None
+        except Exception as agent_error:
+            logger.error(f"调用agent时出错: {str(agent_error)}")
+            return _error_response("抱歉，处理您的请求时出错: ", agent_error, start_time)
+
+        answer, price, illation, cacheable = _agent_response(res, usage, start_time, enable_illation)
+        if cacheable:
+            # 将答案和推理过程（如果有）写入缓存
+            try:
+                cache_content(query, answer, price["price"], price["tokens"], illation)
+            except Exception as cache_err:
+                logger.error(f"缓存写入失败: {str(cache_err)}")
+        # 只有在启用推理的情况下才返回推理过程
+        return answer, price, illation if enable_illation else None
             
+    except Exception as e:
+        logger.error(f"聊天函数发生未处理的异常: {str(e)}")
+        return _error_response("系统发生错误，请稍后再试。错误信息: ", e, start_time)
+
+# 只有线程还没有历史消息时才参与合并：此时回答只取决于问题本身；有历史的线程回答依赖上下文，各自处理
+async def _can_coalesce(thread_id: str) -> bool:
+    try:
+        state = await app.aget_state({"configurable": {"thread_id": thread_id}})
+    except Exception as e:
+        logger.warning(f"读取线程状态失败，不合并请求: {str(e)}")
+        return False
+    return not state.values.get("messages")
+
+# 跟随者没有运行工作流，把问答补记到它自己的线程中，下一轮对话能看到这轮的历史
+# 领头请求命中缓存时与缓存命中一样不写入历史
+async def _record_coalesced(query: str, result, thread_id: str):
+    answer, leader_price, _ = result
+    if leader_price.get("source") != "agent":
+        return
+    try:
+        await app.aupdate_state({"configurable": {"thread_id": thread_id}},
+                                {"messages": [HumanMessage(content=query), AIMessage(content=answer)]},
+                                as_node="agent")
+    except Exception as e:
+        logger.error(f"合并请求写入线程历史失败: {str(e)}")
+
+# 合并请求中跟随者的返回值：回答和推理过程与领头请求相同，本请求没有模型调用，费用记为0，wait 为等待领头请求的时间
+def _coalesced_response(result, wait: float, start_time: float):
+    answer, leader_price, illation = result
+    logger.info(f"[合并请求] 等待进行中的相同请求 {wait:.2f}秒")
+    price = {
+        "price": 0, "tokens": 0, "prompt_tokens": 0, "completion_tokens": 0, "llm_calls": 0, "models": {},
+        "status": leader_price.get("status", "completed"),
+        "source": "coalesced",
+        "leader_source": leader_price.get("source"),
+        "wait": wait,
+        "time": time.time() - start_time,
+    }
+    return answer, price, illation
+
+# 聊天的异步版本，返回值与 chat 相同
+# 新线程的相同问题（同一联网/推理模式）正在处理时不再重复调用，等待进行中的请求并共用其回答，问答补记到本线程的历史
+async def achat(query: str, enable_web: bool, enable_illation: bool, thread_id: str = "abc123"):
+    start_time = time.time()
+    if not await _can_coalesce(thread_id):
+        return await _achat(query, enable_web, enable_illation, thread_id)
+    result, wait = await chat_flights.run(coalesce_key(query, enable_web, enable_illation),
+                                          lambda: _achat(query, enable_web, enable_illation, thread_id))
+    if wait is None:
+        return result
+    await _record_coalesced(query, result, thread_id)
+    return _coalesced_response(result, wait, start_time)
+
+# 工作流和模型调用走 ainvoke；缓存查询、缓存写入（embedding与FAISS均为同步接口）放到线程池执行，不阻塞事件循环
+@with_retry(max_retries=2, initial_delay=1, backoff_factor=2)
+async def _achat(query: str, enable_web: bool, enable_illation: bool, thread_id: str = "abc123"):
+    start_time = time.time()
+    # asyncio.to_thread 会复制当前上下文，线程池中的调用同样计入本次请求的用量
+    usage = begin_usage()
+    try:
+        if not query or not query.strip():
+            logger.warning("收到空查询")
+            return "请输入您的问题", {"price": 0, "tokens": 0, "status": "completed"}, None
+        
+        cached_answer, cache_illation = await asyncio.to_thread(get_content_from_cache, query)
+        if cached_answer and not enable_web:
+            return _cache_response(cached_answer, cache_illation, usage, start_time, enable_illation)
+
+        logger.info("缓存未命中，调用 agent")
+        logger.info(f"使用线程ID: {thread_id}")
+        config = {"configurable": {"thread_id": thread_id, "web_state": enable_web,"illation_state": enable_illation}}
+
+        try:
+            res = await app.ainvoke({"messages": [HumanMessage(content=query)]}, config)
         except Exception as agent_error:
             logger.error(f"调用agent时出错: {str(agent_error)}")
-            logger.error(traceback.format_exc())
-            return f"抱歉，处理您的请求时出错: {str(agent_error)[:100]}...", {"price": 0, "tokens": 0, "status": "error", "error": str(agent_error), "time": time.time() - start_time}, None
+            return _error_response("抱歉，处理您的请求时出错: ", agent_error, start_time)
+
+        answer, price, illation, cacheable = _agent_response(res, usage, start_time, enable_illation)
+        if cacheable:
+            try:
+                await asyncio.to_thread(cache_content, query, answer, price["price"], price["tokens"], illation)
+            except Exception as cache_err:
+                logger.error(f"缓存写入失败: {str(cache_err)}")
+        return answer, price, illation if enable_illation else None
             
     except Exception as e:
         logger.error(f"聊天函数发生未处理的异常: {str(e)}")
-        logger.error(traceback.format_exc())
-        return f"系统发生错误，请稍后再试。错误信息: {str(e)[:100]}...", {"price": 0, "tokens": 0, "status": "error", "error": str(e), "time": time.time() - start_time}, None
+        return _error_response("系统发生错误，请稍后再试。错误信息: ", e, start_time)
+
+# 流式输出：ReAct 智能体的模型输出为 "Thought: ... Action: ..." 或 "Thought: ... Final Answer: ..."，只有 Final Answer 之后的文本是回答
+FINAL_ANSWER_MARKER = "Final Answer:"
+# 格式错误、未知工具时 AgentExecutor 调用的内部工具，不作为工具调用事件发出
+INTERNAL_TOOLS = ("_Exception", "invalid_tool")
+
+class _AnswerTokens:
+    """按模型调用累积流式片段，只放出 Final Answer: 之后的部分（标记可能跨片段）"""
+
+    def __init__(self):
+        self._runs = {}
+
+    def feed(self, run_id, text: str) -> str:
+        run = self._runs.setdefault(run_id, {"buf": "", "pos": None, "started": False})
+        run["buf"] += text
+        if run["pos"] is None:
+            index = run["buf"].find(FINAL_ANSWER_MARKER)
+            if index < 0:
+                return ""
+            run["pos"] = index + len(FINAL_ANSWER_MARKER)
+        buf, pos = run["buf"], run["pos"]
+        if not run["started"]:
+            # 去掉标记后的空白
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+        piece = buf[pos:]
+        run["pos"] = len(buf)
+        run["started"] = run["started"] or bool(piece)
+        return piece
+
+def _parse_action(output):
+    """从一次模型输出中取出思考（Action 之前的文本）和工具输入（Action Input 之后的文本）"""
+    text = getattr(output, "content", output)
+    if not isinstance(text, str):
+        return "", ""
+    thought = text.split("Action:", 1)[0].replace("Thought:", "").strip()
+    action_input = text.split("Action Input:", 1)[1].strip() if "Action Input:" in text else ""
+    return thought, action_input
+
+# 聊天的流式版本（异步生成器），依次产出 (事件名, 数据)：
+# cache: 缓存命中，一次给出完整回答、价格和推理过程，之后没有其他事件
+# step: 智能体调用工具，推理模式下附带本步的思考
+# observation: 工具返回结果，仅推理模式
+# token: 回答片段
+# done: 最终回答、价格和推理过程，以此为准（重试、兜底回答时与已发出的片段可能不同）；合并到进行中的相同请求时只有这一个事件
+# error: 处理失败
+# 不做整体重试：已发出的事件无法撤回
+async def achat_stream(query: str, enable_web: bool, enable_illation: bool, thread_id: str = "abc123"):
+    start_time = time.time()
+    usage = begin_usage()
+    if not query or not query.strip():
+        logger.warning("收到空查询")
+        yield "done", {"res": "请输入您的问题", "price": {"price": 0, "tokens": 0, "status": "completed"}, "illation": None}
+        return
+
+    # 新线程的相同问题正在处理（流式或非流式）时等待其结果；有历史的线程不参与合并（key 为 None）
+    key = coalesce_key(query, enable_web, enable_illation) if await _can_coalesce(thread_id) else None
+    flight = chat_flights.join(key) if key is not None else None
+    if flight is not None:
+        try:
+            result, wait = await chat_flights.follow(flight)
+            await _record_coalesced(query, result, thread_id)
+            answer, price, illation = _coalesced_response(result, wait, start_time)
+            yield "done", {"res": answer, "price": price, "illation": illation}
+            return
+        except Exception as e:
+            logger.info(f"进行中的相同请求未完成，自行处理: {str(e)}")
+
+    future = chat_flights.lead(key)
+    try:
+        try:
+            cached_answer, cache_illation = await asyncio.to_thread(get_content_from_cache, query)
+            if cached_answer and not enable_web:
+                answer, price, illation = _cache_response(cached_answer, cache_illation, usage, start_time, enable_illation)
+                chat_flights.finish(key, future, (answer, price, illation))
+                yield "cache", {"res": answer, "price": price, "illation": illation}
+                return
+
+            logger.info("缓存未命中，流式调用 agent")
+            logger.info(f"使用线程ID: {thread_id}")
+            config = {"configurable": {"thread_id": thread_id, "web_state": enable_web, "illation_state": enable_illation}}
+
+            tokens = _AnswerTokens()
+            tool_runs = set()
+            thought, action_input = "", ""
+            res = None
+            async for event in app.astream_events({"messages": [HumanMessage(content=query)]}, config, version="v2"):
+                kind = event["event"]
+                # 工具内部的模型调用（如文档总结）不属于回答
+                inside_tool = bool(tool_runs.intersection(event.get("parent_ids", [])))
+                if kind == "on_chat_model_stream" and not inside_tool:
+                    piece = tokens.feed(event["run_id"], getattr(event["data"].get("chunk"), "content", "") or "")
+                    if piece:
+                        yield "token", {"text": piece}
+                elif kind == "on_chat_model_end" and not inside_tool:
+                    thought, action_input = _parse_action(event["data"].get("output"))
+                elif kind == "on_tool_start" and not inside_tool:
+                    tool_runs.add(event["run_id"])
+                    if event["name"] not in INTERNAL_TOOLS:
+                        # 字符串输入的工具在事件中没有结构化输入，取模型输出中的 Action Input
+                        step = {"tool": event["name"], "input": event["data"].get("input") or action_input}
+                        if enable_illation:
+                            step["thought"] = thought
+                        yield "step", step
+                elif kind == "on_tool_end" and event["run_id"] in tool_runs:
+                    tool_runs.discard(event["run_id"])
+                    if enable_illation and event["name"] not in INTERNAL_TOOLS:
+                        yield "observation", {"tool": event["name"],
+                                              "output": format_observation(event["data"].get("output"))}
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # 图的最外层运行结束，输出为最终状态
+                    res = event["data"].get("output")
+
+            answer, price, illation, cacheable = _agent_response(res, usage, start_time, enable_illation)
+            illation = illation if enable_illation else None
+        except Exception as e:
+            logger.error(f"流式聊天发生未处理的异常: {str(e)}")
+            answer, price, illation = _error_response("系统发生错误，请稍后再试。错误信息: ", e, start_time)
+            chat_flights.finish(key, future, (answer, price, illation))
+            yield "error", {"res": answer, "price": price, "illation": None}
+            return
+
+        chat_flights.finish(key, future, (answer, price, illation))
+        try:
+            yield "done", {"res": answer, "price": price, "illation": illation}
+        finally:
+            # 先把回答发给客户端再写缓存，写缓存的耗时不计入用户等待
+            if cacheable:
+                try:
+                    await asyncio.to_thread(cache_content, query, answer, price["price"], price["tokens"], illation)
+                except Exception as cache_err:
+                    logger.error(f"缓存写入失败: {str(cache_err)}")
+    finally:
+        # 客户端断开等原因提前结束时，让等待中的请求自行处理
+        chat_flights.finish(key, future, error=LeaderAborted("流式请求提前结束"))
 
 # 测试
 if __name__ == "__main__":
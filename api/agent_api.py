@@ -3,6 +3,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
+import asyncio
 import uuid
 import re
 import logging
@@ -14,6 +15,8 @@ from _agents.invoice_extractor_agent._agent import run_agent as run_invoice_extr
 from _agents.meeting_notes_agent._agent import run_agent as run_meeting_notes_agent
 from _tools._identify.invoice import identify_invoice
 from _tools._identify.meeting_minutes import identify_meeting_minutes
+from _token._usage import begin_usage
+from _token._ledger import record_request
 
 # 配置日志
 logging.basicConfig(
@@ -50,6 +53,7 @@ class AgentRequest(BaseModel):
 active_requests: Dict[str, Dict[str, Any]] = {}
 
 # 安全调用agent函数的包装器
+# agent 和图片识别是同步的模型调用，async 端点通过 asyncio.to_thread 调用，排队等待调用名额时不阻塞事件循环
 def safe_agent_call(agent_func, query, max_retries=3):
     """安全地调用agent函数，包括重试逻辑"""
     retry_count = 0
@@ -204,6 +208,14 @@ def cleanup_completed_requests():
     
     logger.info(f"清理了 {len(keys_to_remove)} 个已完成的请求，当前活跃请求数: {len(active_requests)}")
 
+def record_agent_usage(request_id: str, usage, success: bool):
+    """把本次agent请求（含图片OCR和agent内部的全部模型调用）的用量写入账本"""
+    info = active_requests.get(request_id, {})
+    agent_type = info.get("type", "agent")
+    latency = info.get("completion_time", time.time()) - info.get("start_time", time.time())
+    record_request(f"/agents/{agent_type}", usage.summary(), latency, request_id=request_id,
+                   source="agent", status="completed" if success else "error")
+
 # 图片邮件Agent
 @router.post("/agents/image_mailer")
 async def image_mailer_endpoint(
@@ -212,6 +224,7 @@ async def image_mailer_endpoint(
     image: Optional[UploadFile] = File(None)
 ):
     request_id = f"image_mailer_{uuid.uuid4().hex}"
+    usage = begin_usage()
     active_requests[request_id] = {
         "type": "image_mailer",
         "start_time": time.time(),
@@ -224,12 +237,13 @@ async def image_mailer_endpoint(
         
         # 调用Agent
         logger.info(f"开始调用image_mailer_agent，请求ID: {request_id}")
-        result = safe_agent_call(run_image_mailer_agent, full_query)
+        result = await asyncio.to_thread(safe_agent_call, run_image_mailer_agent, full_query)
         
         # 更新请求状态
         active_requests[request_id]["completed"] = True
         active_requests[request_id]["completion_time"] = time.time()
         active_requests[request_id]["success"] = True
+        record_agent_usage(request_id, usage, True)
         
         # 清理已完成的请求
         background_tasks.add_task(cleanup_completed_requests)
@@ -248,6 +262,7 @@ async def image_mailer_endpoint(
         active_requests[request_id]["completion_time"] = time.time()
         active_requests[request_id]["success"] = False
         active_requests[request_id]["error"] = str(e)
+        record_agent_usage(request_id, usage, False)
         
         # 清理已完成的请求
         background_tasks.add_task(cleanup_completed_requests)
@@ -265,6 +280,7 @@ async def invoice_extractor_endpoint(
     image: Optional[UploadFile] = File(None)
 ):
     request_id = f"invoice_extractor_{uuid.uuid4().hex}"
+    usage = begin_usage()
     active_requests[request_id] = {
         "type": "invoice_extractor",
         "start_time": time.time(),
@@ -285,7 +301,7 @@ async def invoice_extractor_endpoint(
                 logger.info(f"发票提取 - 图片路径: {absolute_path}")
                 
                 # 预处理图片
-                image_result = preprocess_image("invoice_extractor", absolute_path)
+                image_result = await asyncio.to_thread(preprocess_image, "invoice_extractor", absolute_path)
                 
                 if image_result:
                     logger.info(f"图片预处理成功，识别结果长度: {len(image_result['data'])}")
@@ -297,12 +313,13 @@ async def invoice_extractor_endpoint(
         
         # 调用Agent
         logger.info(f"开始调用invoice_extractor_agent，请求ID: {request_id}")
-        result = safe_agent_call(run_invoice_extractor_agent, full_query)
+        result = await asyncio.to_thread(safe_agent_call, run_invoice_extractor_agent, full_query)
         
         # 更新请求状态
         active_requests[request_id]["completed"] = True
         active_requests[request_id]["completion_time"] = time.time()
         active_requests[request_id]["success"] = True
+        record_agent_usage(request_id, usage, True)
         
         # 清理已完成的请求
         background_tasks.add_task(cleanup_completed_requests)
@@ -322,6 +339,7 @@ async def invoice_extractor_endpoint(
         active_requests[request_id]["completion_time"] = time.time()
         active_requests[request_id]["success"] = False
         active_requests[request_id]["error"] = str(e)
+        record_agent_usage(request_id, usage, False)
         
         # 清理已完成的请求
         background_tasks.add_task(cleanup_completed_requests)
@@ -339,6 +357,7 @@ async def meeting_notes_endpoint(
     image: Optional[UploadFile] = File(None)
 ):
     request_id = f"meeting_notes_{uuid.uuid4().hex}"
+    usage = begin_usage()
     active_requests[request_id] = {
         "type": "meeting_notes",
         "start_time": time.time(),
@@ -359,7 +378,7 @@ async def meeting_notes_endpoint(
                 logger.info(f"会议笔记 - 图片路径: {absolute_path}")
                 
                 # 预处理图片
-                image_result = preprocess_image("meeting_notes", absolute_path)
+                image_result = await asyncio.to_thread(preprocess_image, "meeting_notes", absolute_path)
                 
                 if image_result:
                     logger.info(f"图片预处理成功，识别结果长度: {len(image_result['data'])}")
@@ -371,12 +390,13 @@ async def meeting_notes_endpoint(
         
         # 调用Agent
         logger.info(f"开始调用meeting_notes_agent，请求ID: {request_id}")
-        result = safe_agent_call(run_meeting_notes_agent, full_query)
+        result = await asyncio.to_thread(safe_agent_call, run_meeting_notes_agent, full_query)
         
         # 更新请求状态
         active_requests[request_id]["completed"] = True
         active_requests[request_id]["completion_time"] = time.time()
         active_requests[request_id]["success"] = True
+        record_agent_usage(request_id, usage, True)
         
         # 清理已完成的请求
         background_tasks.add_task(cleanup_completed_requests)
@@ -396,6 +416,7 @@ async def meeting_notes_endpoint(
         active_requests[request_id]["completion_time"] = time.time()
         active_requests[request_id]["success"] = False
         active_requests[request_id]["error"] = str(e)
+        record_agent_usage(request_id, usage, False)
         
         # 清理已完成的请求
         background_tasks.add_task(cleanup_completed_requests)
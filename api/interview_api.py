@@ -1,5 +1,6 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncio
 import uuid
 from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 from fastapi.responses import JSONResponse, FileResponse
@@ -8,7 +9,7 @@ from typing import List, Optional, Dict, Any
 import shutil
 
 # 导入项目模块
-from model._llms import model
+from model._router import get_model
 from _agents.resume_agent._agent import analyze_resume
 from _agents.summary_agent._agent import generate_summary_and_score
 from _tools._pdf.generate import generate_pdf_report
@@ -85,7 +86,7 @@ def should_process_resume(resume_text: str) -> bool:
     {resume_text}
     """
     
-    response = model([HumanMessage(content=prompt)]).content.strip().lower()
+    response = get_model("classify")([HumanMessage(content=prompt)]).content.strip().lower()
     
     # 解析回答，查找表示同意的关键词
     return "是" in response or "yes" in response or "true" in response
@@ -104,12 +105,12 @@ async def upload_resume(file: UploadFile = File(...)):
     with open(resume_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
     
-    # 分析简历
+    # 分析简历（同步的模型调用都放到线程池执行，排队等待调用名额时不阻塞事件循环）
     try:
-        resume_text, questions, standard_answers = analyze_resume(resume_path)
+        resume_text, questions, standard_answers = await asyncio.to_thread(analyze_resume, resume_path)
         
         # 判断是否处理简历
-        if not should_process_resume(resume_text):
+        if not await asyncio.to_thread(should_process_resume, resume_text):
             return JSONResponse(
                 status_code=400,
                 content={"message": "简历内容不符合要求，无法进入面试流程"}
@@ -235,7 +236,7 @@ async def get_ai_answer(request: AiAnswerRequest):
     标准答案: {standard_answer}
     """
     
-    ai_answer = model([HumanMessage(content=prompt)]).content
+    ai_answer = (await asyncio.to_thread(get_model("generate"), [HumanMessage(content=prompt)])).content
     
     return JSONResponse(
         content={
@@ -279,7 +280,8 @@ async def complete_interview(session_id: str):
     
     try:
         # 生成总结和评分
-        summary, scores = generate_summary_and_score(
+        summary, scores = await asyncio.to_thread(
+            generate_summary_and_score,
             session.questions, 
             session.user_answers, 
             session.resume_text, 
@@ -294,7 +296,7 @@ async def complete_interview(session_id: str):
         
         # 生成PDF报告
         report_path = f"reports/{session_id}_interview_report.pdf"
-        generate_pdf_report(summary, scores, report_path)
+        await asyncio.to_thread(generate_pdf_report, summary, scores, report_path)
         
         # 更新会话状态
         session.is_completed = True
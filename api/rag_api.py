@@ -1,7 +1,11 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from fastapi import UploadFile, File, Form
-from _tools._rag._rag_all import read_file, text_splitter, save_vector_store, save_vector_store_hnsw, search_vector_store, batch_search_vector_store, save_file, delete_file_and_vector
+from fastapi import UploadFile, File, Form, HTTPException
+from _tools._rag._rag_all import index_file, search_vector_store, batch_search_vector_store, save_file, delete_file_and_vector, shard_stats, index_status, backend_stats, kb_migration, DEFAULT_SPLITTER, DEFAULT_SPLIT_PARAMS
+from _cache._cache_handle import cache_migration
+from _tools._rag._summarize import summarize_file, is_knowledge_file
+from _tools._rag._query_cache import query_cache_stats
+from model._embeddings import embedding_stats
 from pydantic import BaseModel
 from fastapi import APIRouter
 from typing import Optional, List
@@ -13,19 +17,25 @@ save_file_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(os
 @router.post("/upload")
 def upload_file(
     file: UploadFile = File(...),
-    chunk_size: Optional[int] = Form(100),
-    chunk_overlap: Optional[int] = Form(10),
+    splitter: Optional[str] = Form(None),  # token: 按token数切片（默认）；char: 按字符切片
+    chunk_tokens: Optional[int] = Form(None),
+    chunk_overlap_tokens: Optional[int] = Form(None),
+    chunk_size: Optional[int] = Form(None),
+    chunk_overlap: Optional[int] = Form(None),
     use_hnsw: Optional[bool] = Form(True)  # 默认使用HNSW索引
 ):
+    # 先校验切片方式再保存文件，参数错误时不会留下没有向量的文件
+    splitter = (splitter or DEFAULT_SPLITTER).lower()
+    if splitter not in DEFAULT_SPLIT_PARAMS:
+        raise HTTPException(status_code=400, detail=f"不支持的切片方式: {splitter}，可选: {', '.join(DEFAULT_SPLIT_PARAMS)}")
     file_location = save_file(file)
     if file_location:
-        text = read_file(file_location)
-        texts = text_splitter(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        # 根据参数选择使用普通索引还是HNSW索引
-        if use_hnsw:
-            save_vector_store_hnsw(texts)
+        if splitter == "char":
+            params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
         else:
-            save_vector_store(texts)
+            params = {"chunk_tokens": chunk_tokens, "overlap_tokens": chunk_overlap_tokens}
+        # 根据参数选择使用普通索引还是HNSW索引
+        index_file(file.filename, use_hnsw=use_hnsw, splitter=splitter, **params)
         return {"message": "文件上传成功"}
     return {"message": "文件上传失败"}
 
@@ -45,6 +55,59 @@ def batch_search(search: BatchSearch):
     results = batch_search_vector_store(search.queries)
     return {"results": results}
 
+# embedding微批处理统计
+@router.get("/embedding/stats")
+def embedding_batch_stats():
+    return embedding_stats()
+
+class EmbeddingMigrationRequest(BaseModel):
+    provider: Optional[str] = None  # 默认使用 EMBEDDING_PROVIDER
+    model: Optional[str] = None  # 默认使用 EMBEDDING_MODEL
+
+# 在后台把知识库和问答缓存迁移到新的embedding模型，迁移期间检索不中断
+@router.post("/embedding/migrate")
+def embedding_migrate(req: EmbeddingMigrationRequest):
+    return {
+        "knowledge_base": kb_migration.start(req.provider, req.model),
+        "cache": cache_migration.start(req.provider, req.model),
+    }
+
+# embedding迁移进度、当前生效的模型和双读一致率
+@router.get("/embedding/migration")
+def embedding_migration_status():
+    return {"knowledge_base": kb_migration.status(), "cache": cache_migration.status()}
+
+# 知识库索引的加载状态与版本
+@router.get("/search/index")
+def search_index():
+    return index_status()
+
+# 可插拔向量存储后端（VECTOR_BACKEND）的规模与各操作耗时
+@router.get("/search/backend")
+def search_backend():
+    return backend_stats()
+
+# 分片检索的各分片耗时
+@router.get("/search/shards")
+def search_shards():
+    return shard_stats()
+
+# 查询向量与检索结果缓存的命中统计
+@router.get("/search/cache")
+def search_cache():
+    return query_cache_stats()
+
+class SummarizeRequest(BaseModel):
+    file_name: str
+
+# 总结知识库中的整份文件：分组并发总结后合并，相同内容的文件直接返回缓存
+@router.post("/summarize")
+def summarize(req: SummarizeRequest):
+    # 只接受知识库目录中已有的文件名，不拼接任意路径
+    if not is_knowledge_file(req.file_name):
+        return {"message": "文件不存在"}
+    return summarize_file(req.file_name)
+
 class DeleteRequest(BaseModel):
     file_name: str
 
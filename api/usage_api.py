@@ -0,0 +1,43 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+from _token._ledger import ledger
+from model._router import route_stats
+from model._scheduler import llm_scheduler
+
+router = APIRouter()
+
+# 按天 / 线程 / 接口（以及模型、来源）汇总请求数、token、费用和耗时，按总费用降序，用于找出成本和延迟热点
+@router.get("/usage/by/{group_by}")
+def usage_aggregate(
+    group_by: str,
+    since: Optional[str] = None,  # YYYY-MM-DD
+    until: Optional[str] = None,  # YYYY-MM-DD
+    thread_id: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    limit: int = 100,
+):
+    try:
+        return ledger.aggregate(group_by, since=since, until=until, thread_id=thread_id, endpoint=endpoint, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 最近的请求明细，可按线程过滤
+@router.get("/usage/recent")
+def usage_recent(limit: int = 50, thread_id: Optional[str] = None):
+    return ledger.recent(limit=limit, thread_id=thread_id)
+
+@router.get("/usage/stats")
+def usage_ledger_stats():
+    return ledger.stats()
+
+# 模型路由：各档位对应的模型、任务类型到档位的映射，以及每个路由的调用次数、耗时、token和费用
+@router.get("/usage/routes")
+def usage_routes():
+    return route_stats()
+
+# 模型调用调度：当前并发上限（AIMD调整）、进行中的调用数、限流次数，以及各优先级的排队数、等待时间和调用耗时
+@router.get("/usage/scheduler")
+def usage_scheduler():
+    return llm_scheduler.stats()
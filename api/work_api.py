@@ -1,10 +1,14 @@
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from _workflow._work import chat
+from fastapi.responses import StreamingResponse
+from _workflow._work import achat, achat_stream
+from _workflow._singleflight import chat_flights
 from _workflow._database import Database
+from _token._ledger import record_request
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+import json
 import logging
 import time
 import traceback
@@ -39,12 +43,13 @@ async def chatbot(
         # 处理查询
         full_query = query
         
-        # 调用chat函数获取响应
-        res, price_info, illation = chat(full_query, enable_web, enable_illation, thread_id)
+        # 调用异步chat获取响应，等待模型期间事件循环可以处理其他请求
+        res, price_info, illation = await achat(full_query, enable_web, enable_illation, thread_id)
         
         # 记录处理时间
         processing_time = time.time() - start_time
         logger.info(f"请求 {request_id} 处理完成，耗时: {processing_time:.2f}秒")
+        record_request("/chat", price_info, processing_time, thread_id=thread_id, request_id=request_id)
         
         # 构建响应对象
         response = {
@@ -56,6 +61,11 @@ async def chatbot(
             "tokens": price_info.get("tokens", 0)
         }
         
+        # 合并到进行中的相同请求时，单独返回等待该请求的时间
+        if price_info.get("source") == "coalesced":
+            response["source"] = "coalesced"
+            response["wait"] = price_info.get("wait", 0)
+
         # 只有在启用推理的情况下才返回推理过程
         if enable_illation and illation is not None:
             response["illation"] = illation
@@ -65,6 +75,8 @@ async def chatbot(
     except Exception as e:
         logger.error(f"处理请求 {request_id} 时出错: {str(e)}")
         logger.error(traceback.format_exc())
+        record_request("/chat", {}, time.time() - start_time, thread_id=thread_id, request_id=request_id,
+                       status="error")
         
         # 返回错误响应
         error_response = {
@@ -77,6 +89,58 @@ async def chatbot(
         
         return error_response
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+# 流式聊天（SSE）：智能体运行期间依次推送工具调用、推理步骤和回答片段，缓存命中时只推送一个 cache 事件
+# 事件类型见 achat_stream；cache / done / error 为最后一个事件，附带请求ID、首个片段耗时（ttft）和总耗时
+@router.post("/chat/stream")
+async def chatbot_stream(
+    query: str = Form(...),
+    enable_web: bool = Form(False),
+    enable_illation: bool = Form(False),
+    thread_id: str = Form("1"),
+):
+    start_time = time.time()
+    request_id = f"chat_{int(time.time())}"
+    logger.info(f"接收到流式聊天请求 ID: {request_id}, 线程ID: {thread_id}")
+
+    async def events():
+        ttft = None
+        # 客户端中途断开时没有最后一个事件，记为 cancelled
+        price_info, status = {}, "cancelled"
+        try:
+            async for event, data in achat_stream(query, enable_web, enable_illation, thread_id):
+                # 首个回答内容（片段，或缓存命中/兜底时的完整回答）送出的时间
+                if ttft is None and event in ("token", "cache", "done", "error"):
+                    ttft = time.time() - start_time
+                if event in ("cache", "done", "error"):
+                    price_info = data.get("price") or {}
+                    status = "error" if event == "error" else price_info.get("status", "completed")
+                    data = dict(data, request_id=request_id, ttft=ttft, processing_time=time.time() - start_time)
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error(f"处理流式请求 {request_id} 时出错: {str(e)}")
+            logger.error(traceback.format_exc())
+            status = "error"
+            yield _sse("error", {"res": f"系统处理请求时出错: {str(e)[:100]}...", "request_id": request_id,
+                                 "processing_time": time.time() - start_time, "error": str(e)})
+        finally:
+            processing_time = time.time() - start_time
+            logger.info(f"流式请求 {request_id} 结束，首个片段耗时: "
+                        f"{ttft if ttft is None else round(ttft, 2)}秒，总耗时: {processing_time:.2f}秒")
+            record_request("/chat/stream", price_info, processing_time, thread_id=thread_id, request_id=request_id,
+                           status=status, ttft=ttft)
+
+    # 关闭代理缓冲，片段到达即转发
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 请求合并统计：领头/跟随请求数、进行中的问题数和跟随者的等待时间
+@router.get("/chat/coalescing")
+def chat_coalescing_stats():
+    return chat_flights.stats()
+
 class DeleteThreadRequest(BaseModel):
     thread_id: str
 
@@ -89,6 +153,16 @@ def delete_thread_memory(req: DeleteThreadRequest):
     except Exception as e:
         return {"success": False, "message": f"删除线程ID {req.thread_id} 的记忆数据失败: {str(e)}"}
 
+# 检查点存储统计：完整/增量检查点数、占用空间和后台整理记录
+@router.get("/checkpoint/stats")
+def checkpoint_stats():
+    return Database.memory.storage_stats()
+
+# 立即执行一次保留策略和整理
+@router.post("/checkpoint/compact")
+def checkpoint_compact():
+    return Database.memory.run_maintenance()
+
 # 健康检查端点
 @router.get("/health")
 async def health_check():
@@ -12,6 +12,12 @@ from api.work_api import router as work_router
 from api.rag_api import router as rag_router
 from api.agent_api import router as agent_router, UPLOAD_DIR
 from api.interview_api import router as interview_router
+from api.usage_api import router as usage_router
+from _tools._rag._rag_all import preload_vector_store, kb_migration
+from _cache._cache_handle import cache_migration
+from _token._price import get_tokenizer
+from _workflow._database import Database
+from model._scheduler import set_llm_context, priority_for_path
 
 app = FastAPI()
 
@@ -28,6 +34,15 @@ os.makedirs(STATIC_DIR, exist_ok=True)
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 
+# 按请求路径确定本次请求中模型调用的优先级（/chat 为 interactive，/agents 为 agent，其余为 batch），
+# 租户取 X-Tenant-ID 请求头，没有时为客户端IP；同一优先级内按租户轮流放行
+@app.middleware("http")
+async def llm_request_context(request: Request, call_next):
+    tenant = request.headers.get("X-Tenant-ID") or (request.client.host if request.client else "default")
+    set_llm_context(priority_for_path(request.url.path), tenant)
+    return await call_next(request)
+
+
 # 配置模板
 templates = Jinja2Templates(directory="templates")
 
@@ -36,6 +51,7 @@ app.include_router(work_router)
 app.include_router(rag_router)
 app.include_router(agent_router)
 app.include_router(interview_router)
+app.include_router(usage_router)
 
 # 添加静态文件服务，用于访问上传的图片
 app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
@@ -43,6 +59,17 @@ app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 # 添加静态文件服务，用于下载导出的文件
 app.mount("/exports", StaticFiles(directory=EXPORTS_DIR), name="exports")
 
+# 启动时在后台预加载知识库索引，首个检索请求不必再同步加载；继续上次未完成的embedding迁移
+@app.on_event("startup")
+async def preload_knowledge_base():
+    preload_vector_store()
+    kb_migration.resume()
+    cache_migration.resume()
+    # 后台加载计费用的分词器，首个对话请求不必等待
+    threading.Thread(target=get_tokenizer, name="tokenizer-preload", daemon=True).start()
+    # 后台定期清理过期线程和旧检查点
+    Database.memory.start_maintenance()
+
 # 首页路由
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
@@ -0,0 +1,228 @@
+import os
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import dotenv
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from _token._usage import record_usage
+from _tools._rag._chunker import estimate_tokens
+
+dotenv.load_dotenv()
+
+# embedding提供方：dashscope 调用阿里云接口；local 为确定性的本地哈希embedding，可完全离线运行
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "dashscope").lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-v2")
+# 本地embedding维度，默认与 text-embedding-v2 一致
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "1536"))
+# 跨请求合并embedding调用的时间窗口（毫秒，0表示关闭）和单批最大文本数（DashScope单次最多25条）
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "25"))
+# 同时发往上游的批次数：凑好的批次交给线程池执行，一批在等待上游时下一批可以继续发出
+EMBEDDING_MAX_INFLIGHT = int(os.getenv("EMBEDDING_MAX_INFLIGHT", "4"))
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    确定性的本地embedding：字符1~3元组哈希到固定维度并做L2归一化
+    结果只取决于文本本身，跨进程、跨机器完全一致，适合CI、基准测试和压测
+    """
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM, ngrams=(1, 2, 3)):
+        self.dim = dim
+        self.ngrams = ngrams
+
+    def _embed(self, text: str):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = "".join(text.split()).lower()
+        for n in self.ngrams:
+            for i in range(len(text) - n + 1):
+                digest = hashlib.blake2b(text[i:i + n].encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vector[value % self.dim] += 1.0 if (value >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+    def embed_queries(self, texts):
+        return [self._embed(t) for t in texts]
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    跨请求的embedding微批处理器：
+    在 window_ms 时间窗口内到达的单条请求被合并成一次批量调用（最多 max_batch 条），结果再分发回各个调用方
+    发往上游的每次调用都严格按 max_batch 切分；凑好的批次由最多 max_inflight 个线程并发调用上游
+    查询和文档分开排队，因为 text-embedding-v2 对两者使用不同的 text_type；window_ms 为0时直接调用
+    embedding用量在调用方线程中按估算的token数记到当前请求上（LangChain 的 DashScope 封装不返回用量）
+    """
+
+    def __init__(self, inner: Embeddings, window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+                 max_batch: int = EMBEDDING_MAX_BATCH, model_name: str = "unknown",
+                 max_inflight: int = EMBEDDING_MAX_INFLIGHT):
+        self.inner = inner
+        self.model_name = model_name
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queues = {"query": queue.Queue(), "document": queue.Queue()}
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "texts": 0, "upstream_calls": 0}
+        if self.window > 0:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, max_inflight), thread_name_prefix="embedding-batch")
+            for kind in self._queues:
+                threading.Thread(target=self._dispatch, args=(kind,), name=f"embedding-batcher-{kind}", daemon=True).start()
+
+    def _submit(self, kind: str, texts: list) -> list:
+        record_usage(self.model_name, sum(estimate_tokens(t) for t in texts), kind="embedding")
+        if self.window <= 0:
+            with self._stats_lock:
+                self._stats["requests"] += 1
+                self._stats["texts"] += len(texts)
+            return self._call(kind, texts)
+        future = Future()
+        self._queues[kind].put((texts, future))
+        return future.result()
+
+    def _call(self, kind: str, texts: list) -> list:
+        """按 max_batch 切分后逐批调用上游，调用方传入的列表可以任意长"""
+        vectors = []
+        for start in range(0, len(texts), self.max_batch):
+            with self._stats_lock:
+                self._stats["upstream_calls"] += 1
+            vectors.extend(self._call_upstream(kind, texts[start:start + self.max_batch]))
+        return vectors
+
+    def _call_upstream(self, kind: str, texts: list) -> list:
+        if kind == "document":
+            return self.inner.embed_documents(texts)
+        embed_queries = getattr(self.inner, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(texts)
+        return [self.inner.embed_query(t) for t in texts]
+
+    def _dispatch(self, kind: str):
+        pending = self._queues[kind]
+        carry = None
+        while True:
+            items = [carry if carry is not None else pending.get()]
+            carry = None
+            count = len(items[0][0])
+            deadline = time.monotonic() + self.window
+            # 在时间窗口内继续收集，直到凑满一批；放不下的请求留到下一批开头
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if count + len(item[0]) > self.max_batch:
+                    carry = item
+                    break
+                items.append(item)
+                count += len(item[0])
+            # 调度线程只负责凑批，上游调用在线程池中进行
+            self._executor.submit(self._run_batch, kind, items)
+
+    def _run_batch(self, kind: str, items: list):
+        texts = [t for batch, _ in items for t in batch]
+        with self._stats_lock:
+            self._stats["requests"] += len(items)
+            self._stats["texts"] += len(texts)
+        try:
+            vectors = self._call(kind, texts)
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        offset = 0
+        for batch, future in items:
+            future.set_result(vectors[offset:offset + len(batch)])
+            offset += len(batch)
+
+    def embed_query(self, text):
+        return self._submit("query", [text])[0]
+
+    def embed_queries(self, texts):
+        return self._submit("query", list(texts))
+
+    def embed_documents(self, texts):
+        # 本身已是大批量的调用直接发出，不必排队（仍按 max_batch 切分）
+        if len(texts) >= self.max_batch:
+            record_usage(self.model_name, sum(estimate_tokens(t) for t in texts), kind="embedding")
+            with self._stats_lock:
+                self._stats["requests"] += 1
+                self._stats["texts"] += len(texts)
+            return self._call("document", list(texts))
+        return self._submit("document", list(texts))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["avg_batch_requests"] = stats["requests"] / stats["upstream_calls"] if stats["upstream_calls"] else 0
+        return stats
+
+
+def _dashscope(model_name: str):
+    # 延迟导入，离线使用本地embedding时不需要DashScope配置
+    from langchain_community.embeddings import DashScopeEmbeddings
+    from langchain_community.embeddings.dashscope import embed_with_retry
+
+    class _DashScopeEmbeddings(DashScopeEmbeddings):
+        def embed_queries(self, texts):
+            """一次请求批量计算多个查询向量（text_type=query）"""
+            result = embed_with_retry(self, input=texts, text_type="query", model=self.model)
+            return [item["embedding"] for item in result]
+
+    return _DashScopeEmbeddings(model=model_name, dashscope_api_key=os.getenv("DASHSCOPE_API_KEY"))
+
+
+def _local(model_name: str):
+    return HashingEmbeddings(dim=LOCAL_EMBEDDING_DIM)
+
+
+# 提供方名称 -> 工厂函数(model_name) -> Embeddings
+_PROVIDERS = {
+    "dashscope": _dashscope,
+    "local": _local,
+}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register_embedding_provider(name: str, factory):
+    """注册新的embedding提供方，factory 接收模型名并返回 LangChain Embeddings 对象"""
+    _PROVIDERS[name.lower()] = factory
+
+
+def get_embedding(provider: str = None, model_name: str = None) -> Embeddings:
+    """按配置返回embedding实例，同一 (提供方, 模型) 在进程内只创建一次"""
+    provider = (provider or EMBEDDING_PROVIDER).lower()
+    model_name = model_name or EMBEDDING_MODEL
+    if provider not in _PROVIDERS:
+        raise ValueError(f"未知的embedding提供方: {provider}，可选: {', '.join(_PROVIDERS)}")
+    key = (provider, model_name)
+    with _instances_lock:
+        if key not in _instances:
+            # 统一包装：窗口大于0时合并并发请求，并记录每个请求的embedding用量（非DashScope模型不按DashScope计价）
+            usage_name = model_name if provider == "dashscope" else f"{provider}:{model_name}"
+            _instances[key] = BatchingEmbeddings(_PROVIDERS[provider](model_name), model_name=usage_name)
+        return _instances[key]
+
+
+def embedding_stats() -> dict:
+    """各embedding实例的微批处理统计：upstream_calls 为实际发往上游的请求数"""
+    with _instances_lock:
+        return {
+            f"{provider}/{model_name}": instance.stats()
+            for (provider, model_name), instance in _instances.items()
+            if isinstance(instance, BatchingEmbeddings)
+        }
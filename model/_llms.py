@@ -5,6 +5,8 @@ import time
 from typing import Optional
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import requests
+from _token._usage import usage_callback
+from model._scheduler import llm_scheduler
 
 dotenv.load_dotenv()
 
@@ -21,6 +23,35 @@ class ModelContentError(Exception):
     """当内容被拒绝或不适当时抛出"""
     pass
 
+# 每次调用先向全局调度器申请名额（按请求的优先级和租户排队），结束后按耗时和是否限流调整并发上限
+# ChatOpenAI 在 streaming=True 时由 _generate 转调 _stream，此时名额在 _stream 中申请，避免同一调用占用两个名额
+class ScheduledChatOpenAI(ChatOpenAI):
+
+    def _generate(self, *args, **kwargs):
+        if self.streaming:
+            return super()._generate(*args, **kwargs)
+        with llm_scheduler.slot():
+            return super()._generate(*args, **kwargs)
+
+    async def _agenerate(self, *args, **kwargs):
+        if self.streaming:
+            return await super()._agenerate(*args, **kwargs)
+        async with llm_scheduler.aslot():
+            return await super()._agenerate(*args, **kwargs)
+
+    # 流式调用的总耗时取决于生成长度，调度器只用首个分片的耗时判断上游是否拥塞
+    def _stream(self, *args, **kwargs):
+        with llm_scheduler.slot() as call:
+            for chunk in super()._stream(*args, **kwargs):
+                call.first_chunk()
+                yield chunk
+
+    async def _astream(self, *args, **kwargs):
+        async with llm_scheduler.aslot() as call:
+            async for chunk in super()._astream(*args, **kwargs):
+                call.first_chunk()
+                yield chunk
+
 # 重试装饰器，针对不同类型的异常采用不同的策略
 @retry(
     stop=stop_after_attempt(3),  # 最多尝试3次
@@ -34,7 +65,7 @@ class ModelContentError(Exception):
 def create_model_with_retry(model_name: str, base_url: str, api_key: str, timeout: float) -> ChatOpenAI:
     """创建模型实例，带有重试机制"""
     try:
-        return ChatOpenAI(
+        return ScheduledChatOpenAI(
             model=model_name,
             base_url=base_url,
             api_key=api_key,
@@ -64,7 +95,7 @@ except Exception as e:
     # 创建一个后备模型实例，避免程序崩溃
     # 这里可以使用一个更可靠但可能性能较低的模型作为备用
     try:
-        model = ChatOpenAI(
+        model = ScheduledChatOpenAI(
             model="qwen-max",
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
             api_key=os.getenv("DASHSCOPE_API_KEY"),
@@ -74,3 +105,7 @@ except Exception as e:
         print(f"备用模型也初始化失败: {str(backup_error)}")
         # 在这种情况下，我们仍然需要一个model变量，但会在使用时检查其有效性
         model = None
+
+# 每次调用结束时把模型返回的token用量计入当前请求
+if model is not None:
+    model.callbacks = [usage_callback]
@@ -0,0 +1,147 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json
+import re
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+from model._llms import create_model_with_retry, model as default_model
+from _token._usage import usage_callback, usage_from_result, model_price
+
+# 模型路由：每个调用点声明任务类型，按任务类型选择模型档位
+# fast 为便宜、延迟低的模型，default 为原来统一使用的模型，strong 为推理能力最强的模型
+MODEL_REGISTRY = {
+    "fast": os.getenv("MODEL_FAST", "qwen-turbo"),
+    "default": os.getenv("MODEL_DEFAULT", "qwen-plus"),
+    "strong": os.getenv("MODEL_STRONG", "qwen-max"),
+}
+MODEL_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# 任务类型 → 模型档位
+TASK_ROUTES = {
+    "classify": "fast",      # 是/否判断、简单分类
+    "short_reply": "fast",   # 问候、致谢等简短回复
+    "chat": "default",       # 对话智能体（ReAct，带工具）
+    "agent": "default",      # 发票、会议纪要等工具型智能体
+    "summarize": "default",  # 文档分组总结与合并
+    "history_summary": "fast",  # 对话历史的滚动总结
+    "generate": "default",   # 生成面试题、参考回答等
+    "reasoning": "strong",   # 面试总结评分等长文本推理
+}
+# 可用 MODEL_ROUTES='{"summarize": "fast"}' 覆盖部分路由
+TASK_ROUTES.update(json.loads(os.getenv("MODEL_ROUTES", "{}") or "{}"))
+
+# 只有这样的短句才走 short_reply，其余对话仍交给 chat
+SHORT_REPLY_MAX_CHARS = int(os.getenv("SHORT_REPLY_MAX_CHARS", "12"))
+SHORT_REPLY_PATTERN = re.compile(
+    r"^(你好|您好|哈喽|嗨|hi|hello|hey|谢谢|多谢|感谢|thanks|thank you|再见|拜拜|bye|早上好|中午好|下午好|晚上好|晚安|"
+    r"好的|好|嗯|嗯嗯|ok|okay|收到|明白了?|在吗)[\s!！。.~～,，?？呀啊哦哈]*$",
+    re.IGNORECASE,
+)
+
+
+def classify_chat_task(query: str) -> str:
+    """对话入口的任务分类：问候、致谢等简短寒暄走 short_reply，其余走 chat"""
+    text = (query or "").strip()
+    if len(text) <= SHORT_REPLY_MAX_CHARS and SHORT_REPLY_PATTERN.match(text):
+        return "short_reply"
+    return "chat"
+
+
+class RouteMetrics:
+    """按任务类型累计调用次数、错误数、耗时、token和费用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def add(self, task: str, model_name: str, latency: float, prompt_tokens: int = 0,
+            completion_tokens: int = 0, error: bool = False):
+        with self._lock:
+            entry = self.routes.setdefault(task, {
+                "tier": TASK_ROUTES.get(task, "default"), "model": model_name, "calls": 0, "errors": 0,
+                "total_seconds": 0.0, "max_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "price": 0.0,
+            })
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["total_seconds"] += latency
+            entry["max_seconds"] = max(entry["max_seconds"], latency)
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["price"] += model_price(model_name, prompt_tokens, completion_tokens)
+
+    def summary(self) -> dict:
+        with self._lock:
+            routes = {task: dict(entry) for task, entry in self.routes.items()}
+        for entry in routes.values():
+            calls = entry["calls"] or 1
+            entry["avg_seconds"] = entry["total_seconds"] / calls
+            entry["avg_price"] = entry["price"] / calls
+        return {"registry": dict(MODEL_REGISTRY), "task_routes": dict(TASK_ROUTES), "routes": routes}
+
+
+route_metrics = RouteMetrics()
+
+
+class RouteMetricsHandler(BaseCallbackHandler):
+    """挂在每个任务的模型实例上，记录该路由每次调用的耗时和用量"""
+
+    def __init__(self, task: str, model_name: str):
+        self.task = task
+        self.model_name = model_name
+        self._starts = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def _latency(self, run_id) -> float:
+        start = self._starts.pop(run_id, None)
+        return time.perf_counter() - start if start is not None else 0.0
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        model_name, prompt_tokens, completion_tokens = usage_from_result(response)
+        if model_name == "unknown":
+            model_name = self.model_name
+        route_metrics.add(self.task, model_name, self._latency(run_id), prompt_tokens, completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        route_metrics.add(self.task, self.model_name, self._latency(run_id), error=True)
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_model(task: str):
+    """
+    返回该任务类型使用的模型实例，每个任务类型一个实例（用于区分路由统计），首次使用时创建
+    未知任务类型按 default 处理；创建失败时退回原来的全局模型
+    """
+    if task in _models:
+        return _models[task]
+    with _models_lock:
+        if task not in _models:
+            model_name = MODEL_REGISTRY.get(TASK_ROUTES.get(task, "default"), MODEL_REGISTRY["default"])
+            try:
+                llm = create_model_with_retry(
+                    model_name=model_name,
+                    base_url=MODEL_BASE_URL,
+                    api_key=os.getenv("DASHSCOPE_API_KEY"),
+                    timeout=60.0,
+                )
+                llm.max_retries = 2
+                # 流式调用（/chat/stream）时也让接口在最后一个片段返回用量，否则计费和路由统计拿不到token
+                llm.stream_usage = True
+                llm.callbacks = [usage_callback, RouteMetricsHandler(task, model_name)]
+            except Exception as e:
+                print(f"创建 {task} 路由的模型 {model_name} 失败，使用默认模型: {e}")
+                llm = default_model
+            _models[task] = llm
+    return _models[task]
+
+
+def route_stats() -> dict:
+    return route_metrics.summary()
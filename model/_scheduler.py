@@ -0,0 +1,342 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncio
+import collections
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from _common._latency import LatencyStats
+
+# 全局模型调用调度：所有发往 DashScope 的模型调用（对话、智能体、面试分析评分、OCR、图片生成）先申请名额再发出
+# 1. 优先级：interactive（对话、面试作答）> agent（发票、会议纪要、图片邮件等智能体）> batch（面试出题、文档总结等其余调用）
+#    每个优先级最多占用总名额的一定比例，批量任务占满名额时对话仍有余量
+# 2. 公平：同一优先级内按租户轮流放行，一个租户的大量请求不会让其他租户一直排队
+# 3. 自适应并发（AIMD）：调用成功且耗时正常时名额缓慢增加（每满一轮 +1），
+#    遇到限流（429）减半、耗时超过目标时小幅减少，两次减少之间有冷却时间
+LLM_CONCURRENCY_INITIAL = float(os.getenv("LLM_CONCURRENCY_INITIAL", "8"))
+LLM_CONCURRENCY_MIN = float(os.getenv("LLM_CONCURRENCY_MIN", "2"))
+LLM_CONCURRENCY_MAX = float(os.getenv("LLM_CONCURRENCY_MAX", "32"))
+# 单次调用耗时超过该值（秒）视为上游拥塞；流式调用按首个分片的到达时间计，不按整段生成的时长
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", "20"))
+LLM_AIMD_BACKOFF = float(os.getenv("LLM_AIMD_BACKOFF", "0.5"))
+LLM_AIMD_SLOW_BACKOFF = float(os.getenv("LLM_AIMD_SLOW_BACKOFF", "0.9"))
+LLM_AIMD_COOLDOWN = float(os.getenv("LLM_AIMD_COOLDOWN", "5"))
+# 排队等待上限（秒），超时抛出 LLMQueueTimeout
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "120"))
+# 低优先级请求每排队这么多秒提升一级，避免被一直饿着
+LLM_PRIORITY_AGING = float(os.getenv("LLM_PRIORITY_AGING", "30"))
+
+# 优先级（数字越小越先放行）和各自最多占用的名额比例
+PRIORITY_CLASSES = {
+    "interactive": {"rank": 0, "share": 1.0},
+    "agent": {"rank": 1, "share": 0.8},
+    "batch": {"rank": 2, "share": 0.5},
+}
+# 可用 LLM_PRIORITY_SHARES='{"batch": 0.3}' 调整占用比例
+for _name, _share in json.loads(os.getenv("LLM_PRIORITY_SHARES", "{}") or "{}").items():
+    PRIORITY_CLASSES.setdefault(_name, {"rank": len(PRIORITY_CLASSES), "share": 1.0})["share"] = float(_share)
+DEFAULT_PRIORITY = "batch"
+
+# 请求路径前缀 → 优先级，未匹配的按 DEFAULT_PRIORITY 处理；可用 LLM_PRIORITY_ROUTES 覆盖
+PRIORITY_ROUTES = {
+    "/chat": "interactive",
+    # 面试中提交回答、获取回答建议时用户在页面上同步等待
+    "/interview/answer": "interactive",
+    "/interview/ai-answer": "interactive",
+    "/agents": "agent",
+}
+PRIORITY_ROUTES.update(json.loads(os.getenv("LLM_PRIORITY_ROUTES", "{}") or "{}"))
+
+_current_priority = contextvars.ContextVar("llm_priority", default=DEFAULT_PRIORITY)
+_current_tenant = contextvars.ContextVar("llm_tenant", default="default")
+
+
+class LLMQueueTimeout(TimeoutError):
+    """等待模型调用名额超时"""
+    pass
+
+
+def priority_for_path(path: str) -> str:
+    for prefix, priority in PRIORITY_ROUTES.items():
+        if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+            return priority
+    return DEFAULT_PRIORITY
+
+
+def set_llm_context(priority: str = None, tenant: str = None):
+    """
+    设置当前请求的优先级和租户，之后同一上下文（以及复制了该上下文的线程）中的模型调用都按此排队
+    由 main.py 的中间件按请求路径和 X-Tenant-ID（没有时为客户端IP）设置
+    """
+    if priority is not None:
+        _current_priority.set(priority if priority in PRIORITY_CLASSES else DEFAULT_PRIORITY)
+    if tenant is not None:
+        _current_tenant.set(tenant)
+
+
+def _on_event_loop() -> bool:
+    """当前线程是否正在运行事件循环（async 端点中直接调用同步模型时为真）"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def is_throttled(error: BaseException) -> bool:
+    """判断异常是否为上游限流（HTTP 429 / Throttling）"""
+    if getattr(error, "status_code", None) == 429 or getattr(getattr(error, "response", None), "status_code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "throttl" in message or "rate limit" in message
+
+
+class _Ticket:
+    """一次排队中的调用；同步调用用 Event 等待，异步调用用 future 等待"""
+    __slots__ = ("priority", "tenant", "enqueued", "granted", "event", "future", "loop")
+
+    def __init__(self, priority: str, tenant: str, loop=None):
+        self.priority = priority
+        self.tenant = tenant
+        self.enqueued = time.perf_counter()
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMCall:
+    """
+    slot() 返回的句柄：不抛异常的接口（如返回状态码的SDK）可手动标记限流
+    流式调用收到首个分片时调用 first_chunk()，拥塞判断改用首个分片的耗时
+    """
+    __slots__ = ("ticket", "throttled", "wait", "start", "ttft")
+
+    def __init__(self, ticket: _Ticket, wait: float):
+        self.ticket = ticket
+        self.throttled = False
+        self.wait = wait
+        self.start = time.perf_counter()
+        self.ttft = None
+
+    def first_chunk(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+
+
+class LLMScheduler:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.limit = LLM_CONCURRENCY_INITIAL
+        self.in_flight = 0
+        self._running = collections.Counter()
+        # 优先级 → 租户 → 排队的调用（租户的顺序即轮转顺序）
+        self._queues = {name: collections.OrderedDict() for name in PRIORITY_CLASSES}
+        self._last_decrease = 0.0
+        self.waits = LatencyStats()
+        self.latency = LatencyStats()
+        self.counters = collections.Counter()
+        self.tenants = collections.Counter()
+
+    # ---------- 放行 ----------
+
+    def _class_cap(self, priority: str) -> int:
+        return max(1, int(self.limit * PRIORITY_CLASSES[priority]["share"]))
+
+    def _next_ticket(self):
+        """选出下一个放行的调用：按（优先级 - 排队时间提升）排序，同一优先级内按租户轮转"""
+        now = time.perf_counter()
+        best, best_rank = None, None
+        for priority, tenants in self._queues.items():
+            if not tenants or self._running[priority] >= self._class_cap(priority):
+                continue
+            head = next(iter(tenants.values()))[0]
+            rank = PRIORITY_CLASSES[priority]["rank"]
+            if LLM_PRIORITY_AGING > 0:
+                rank -= (now - head.enqueued) / LLM_PRIORITY_AGING
+            if best_rank is None or rank < best_rank:
+                best, best_rank = priority, rank
+        if best is None:
+            return None
+        tenants = self._queues[best]
+        tenant, waiting = next(iter(tenants.items()))
+        ticket = waiting.popleft()
+        # 放行后该租户排到队尾
+        del tenants[tenant]
+        if waiting:
+            tenants[tenant] = waiting
+        return ticket
+
+    def _dispatch(self):
+        while self.in_flight < max(1, int(self.limit)):
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self._start(ticket)
+            ticket.grant()
+
+    def _start(self, ticket: _Ticket):
+        self.in_flight += 1
+        self._running[ticket.priority] += 1
+        self.tenants[ticket.tenant] += 1
+        # 租户数（客户端IP）不设上限时只保留调用最多的一部分
+        if len(self.tenants) > 1000:
+            self.tenants = collections.Counter(dict(self.tenants.most_common(100)))
+
+    def _enqueue(self, ticket: _Ticket) -> bool:
+        """排队并尝试放行，立即放行时返回 True"""
+        with self._lock:
+            self._queues[ticket.priority].setdefault(ticket.tenant, collections.deque()).append(ticket)
+            self._dispatch()
+            return ticket.granted
+
+    def _abandon(self, ticket: _Ticket) -> bool:
+        """等待超时或被取消时移出队列，返回 True；恰好已被放行时返回 False，名额由调用方使用或归还"""
+        with self._lock:
+            if ticket.granted:
+                return False
+            waiting = self._queues[ticket.priority].get(ticket.tenant)
+            if waiting is not None and ticket in waiting:
+                waiting.remove(ticket)
+                if not waiting:
+                    del self._queues[ticket.priority][ticket.tenant]
+            self.counters[f"{ticket.priority}_abandoned"] += 1
+            return True
+
+    def _finish(self, ticket: _Ticket):
+        self.in_flight -= 1
+        self._running[ticket.priority] -= 1
+        self._dispatch()
+
+    # ---------- AIMD ----------
+
+    def _adjust(self, latency: float, throttled: bool):
+        now = time.monotonic()
+        if throttled or latency > LLM_LATENCY_TARGET:
+            if now - self._last_decrease < LLM_AIMD_COOLDOWN:
+                return
+            factor = LLM_AIMD_BACKOFF if throttled else LLM_AIMD_SLOW_BACKOFF
+            self.limit = max(LLM_CONCURRENCY_MIN, self.limit * factor)
+            self._last_decrease = now
+            self.counters["decreases"] += 1
+        else:
+            # 每个成功调用增加 1/limit，整体上每满一轮并发 +1
+            self.limit = min(LLM_CONCURRENCY_MAX, self.limit + 1 / self.limit)
+
+    def _release(self, call: LLMCall, latency: float, error: BaseException = None):
+        throttled = call.throttled or (error is not None and is_throttled(error))
+        priority = call.ticket.priority
+        self.latency.add(priority, latency)
+        with self._lock:
+            self.counters[f"{priority}_calls"] += 1
+            if throttled:
+                self.counters["throttled"] += 1
+            elif error is not None:
+                self.counters[f"{priority}_errors"] += 1
+            # 与上游无关的错误（参数、内容审核等）不调整并发
+            if throttled or error is None:
+                self._adjust(latency if call.ttft is None else call.ttft, throttled)
+            self._finish(call.ticket)
+
+    # ---------- 申请名额 ----------
+
+    def _ticket(self, loop=None) -> _Ticket:
+        return _Ticket(_current_priority.get(), _current_tenant.get(), loop)
+
+    def _granted(self, ticket: _Ticket) -> LLMCall:
+        wait = time.perf_counter() - ticket.enqueued
+        self.waits.add(ticket.priority, wait)
+        return LLMCall(ticket, wait)
+
+    @contextmanager
+    def slot(self):
+        """
+        同步调用：排队直到放行，退出时归还名额并按耗时和是否限流调整并发
+        在事件循环线程中不排队等待：等待会阻塞整个循环，而 aslot() 持有的名额只能在该循环上归还，
+        只会一直等到超时。此时没有空闲名额直接抛出 RuntimeError，async 代码应使用 aslot() 或 asyncio.to_thread
+        """
+        ticket = self._ticket()
+        if not self._enqueue(ticket):
+            if _on_event_loop():
+                if self._abandon(ticket):
+                    raise RuntimeError("不能在事件循环线程中同步等待模型调用名额，请使用 aslot() 或通过 asyncio.to_thread 调用")
+            elif not ticket.event.wait(LLM_QUEUE_TIMEOUT) and self._abandon(ticket):
+                raise LLMQueueTimeout(f"等待模型调用名额超时（timeout {LLM_QUEUE_TIMEOUT:.0f}s）")
+        call = self._granted(ticket)
+        try:
+            yield call
+        except BaseException as e:
+            self._release(call, time.perf_counter() - call.start, e)
+            raise
+        self._release(call, time.perf_counter() - call.start)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """异步调用：排队期间不阻塞事件循环"""
+        ticket = self._ticket(asyncio.get_running_loop())
+        if not self._enqueue(ticket):
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.future), LLM_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if self._abandon(ticket):
+                    raise LLMQueueTimeout(f"等待模型调用名额超时（timeout {LLM_QUEUE_TIMEOUT:.0f}s）")
+            except asyncio.CancelledError:
+                if not self._abandon(ticket):
+                    with self._lock:
+                        self._finish(ticket)
+                raise
+        call = self._granted(ticket)
+        try:
+            yield call
+        except BaseException as e:
+            self._release(call, time.perf_counter() - call.start, e)
+            raise
+        self._release(call, time.perf_counter() - call.start)
+
+    def stats(self) -> dict:
+        with self._lock:
+            classes = {}
+            for priority, tenants in self._queues.items():
+                classes[priority] = {
+                    "rank": PRIORITY_CLASSES[priority]["rank"],
+                    "cap": self._class_cap(priority),
+                    "running": self._running[priority],
+                    "queued": sum(len(waiting) for waiting in tenants.values()),
+                    "queued_tenants": len(tenants),
+                    "calls": self.counters[f"{priority}_calls"],
+                    "errors": self.counters[f"{priority}_errors"],
+                    "abandoned": self.counters[f"{priority}_abandoned"],
+                }
+            result = {
+                "limit": round(self.limit, 2),
+                "min": LLM_CONCURRENCY_MIN,
+                "max": LLM_CONCURRENCY_MAX,
+                "in_flight": self.in_flight,
+                "throttled": self.counters["throttled"],
+                "decreases": self.counters["decreases"],
+                "tenants": dict(self.tenants.most_common(20)),
+            }
+        waits, latency = self.waits.summary(), self.latency.summary()
+        for priority, entry in classes.items():
+            entry["wait"] = waits.get(priority, {})
+            entry["latency"] = latency.get(priority, {})
+        result["classes"] = classes
+        return result
+
+
+llm_scheduler = LLMScheduler()
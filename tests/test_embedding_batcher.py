@@ -0,0 +1,108 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import threading
+import time
+import pytest
+from model._embeddings import BatchingEmbeddings
+
+
+class RecordingEmbeddings:
+    """记录每次上游调用的批大小和并发数，向量为文本本身，便于核对结果顺序"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _call(self, texts):
+        with self._lock:
+            self.calls.append(len(texts))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("upstream failed")
+            return [[text] for text in texts]
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def embed_documents(self, texts):
+        return self._call(texts)
+
+    def embed_queries(self, texts):
+        return self._call(texts)
+
+    def embed_query(self, text):
+        return self._call([text])[0]
+
+
+def _run_concurrently(target, count):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_multi_text_requests_never_exceed_max_batch():
+    inner = RecordingEmbeddings(delay=0.01)
+    batcher = BatchingEmbeddings(inner, window_ms=20, max_batch=25)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.embed_queries([f"{i}-{k}" for k in range(7)])
+
+    _run_concurrently(worker, 20)
+    assert max(inner.calls) <= 25
+    assert sum(inner.calls) == 140
+    for i in range(20):
+        assert results[i] == [[f"{i}-{k}"] for k in range(7)]
+
+
+def test_long_inputs_are_split_on_exact_boundaries():
+    inner = RecordingEmbeddings()
+    batcher = BatchingEmbeddings(inner, window_ms=5, max_batch=25)
+    documents = [str(i) for i in range(60)]
+    assert batcher.embed_documents(documents) == [[t] for t in documents]
+    assert inner.calls == [25, 25, 10]
+
+    queries = [f"q{i}" for i in range(30)]
+    assert batcher.embed_queries(queries) == [[t] for t in queries]
+    assert inner.calls[3:] == [25, 5]
+
+
+def test_split_without_batching_window():
+    inner = RecordingEmbeddings()
+    batcher = BatchingEmbeddings(inner, window_ms=0, max_batch=10)
+    assert len(batcher.embed_queries([str(i) for i in range(23)])) == 23
+    assert inner.calls == [10, 10, 3]
+    assert batcher.stats()["upstream_calls"] == 3
+
+
+def test_batches_run_concurrently_on_executor():
+    inner = RecordingEmbeddings(delay=0.05)
+    batcher = BatchingEmbeddings(inner, window_ms=1, max_batch=2, max_inflight=4)
+    _run_concurrently(lambda i: batcher.embed_queries([f"{i}-a", f"{i}-b"]), 8)
+    assert inner.peak > 1
+    assert max(inner.calls) <= 2
+
+
+def test_upstream_error_reaches_every_caller():
+    batcher = BatchingEmbeddings(RecordingEmbeddings(fail=True), window_ms=20, max_batch=25)
+    errors = []
+
+    def worker(i):
+        try:
+            batcher.embed_query(str(i))
+        except RuntimeError as e:
+            errors.append(e)
+
+    _run_concurrently(worker, 5)
+    assert len(errors) == 5
+    with pytest.raises(RuntimeError):
+        batcher.embed_documents(["x"] * 30)
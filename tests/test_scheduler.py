@@ -0,0 +1,173 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncio
+import random
+import threading
+import time
+import pytest
+from model import _scheduler
+from model._scheduler import LLMScheduler, LLMQueueTimeout
+
+
+def _scheduler_with_limit(limit: float) -> LLMScheduler:
+    scheduler = LLMScheduler()
+    scheduler.limit = limit
+    return scheduler
+
+
+def _queued(scheduler: LLMScheduler) -> int:
+    return sum(len(waiting) for tenants in scheduler._queues.values() for waiting in tenants.values())
+
+
+def test_abandon_after_grant_keeps_the_slot():
+    scheduler = _scheduler_with_limit(1)
+    holder = scheduler._ticket()
+    assert scheduler._enqueue(holder)
+    waiter = scheduler._ticket()
+    assert not scheduler._enqueue(waiter)
+    # 等待方超时的同时名额被归还并放行给它
+    with scheduler._lock:
+        scheduler._finish(holder)
+    assert waiter.granted
+    assert not scheduler._abandon(waiter)
+    assert scheduler.in_flight == 1
+    with scheduler._lock:
+        scheduler._finish(waiter)
+    assert scheduler.in_flight == 0
+
+
+def test_abandon_before_grant_leaves_queue_empty():
+    scheduler = _scheduler_with_limit(1)
+    holder = scheduler._ticket()
+    scheduler._enqueue(holder)
+    waiter = scheduler._ticket()
+    scheduler._enqueue(waiter)
+    assert scheduler._abandon(waiter)
+    with scheduler._lock:
+        scheduler._finish(holder)
+    # 被放弃的调用不会再被放行
+    assert not waiter.granted
+    assert scheduler.in_flight == 0
+    assert _queued(scheduler) == 0
+
+
+def test_sync_slot_times_out(monkeypatch):
+    monkeypatch.setattr(_scheduler, "LLM_QUEUE_TIMEOUT", 0.05)
+    scheduler = _scheduler_with_limit(1)
+    with scheduler.slot():
+        with pytest.raises(LLMQueueTimeout):
+            with scheduler.slot():
+                pass
+    assert scheduler.in_flight == 0
+    assert _queued(scheduler) == 0
+
+
+def test_async_cancel_racing_with_grant_returns_the_slot():
+    scheduler = _scheduler_with_limit(1)
+
+    async def wait_for_slot():
+        async with scheduler.aslot():
+            await asyncio.sleep(1)
+
+    async def main():
+        holder = scheduler._ticket()
+        scheduler._enqueue(holder)
+        task = asyncio.create_task(wait_for_slot())
+        await asyncio.sleep(0.01)
+        # 放行通过 call_soon_threadsafe 送达，在它送达之前取消等待方
+        with scheduler._lock:
+            scheduler._finish(holder)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert scheduler.in_flight == 0
+    assert _queued(scheduler) == 0
+
+
+def test_concurrent_timeouts_never_leak_slots(monkeypatch):
+    monkeypatch.setattr(_scheduler, "LLM_QUEUE_TIMEOUT", 0.02)
+    scheduler = _scheduler_with_limit(2)
+    outcomes = {"ok": 0, "timeout": 0}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(20):
+            try:
+                with scheduler.slot():
+                    time.sleep(rng.uniform(0, 0.01))
+                key = "ok"
+            except LLMQueueTimeout:
+                key = "timeout"
+            with lock:
+                outcomes[key] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert outcomes["ok"] + outcomes["timeout"] == 160
+    assert scheduler.in_flight == 0
+    assert _queued(scheduler) == 0
+    assert sum(scheduler._running.values()) == 0
+
+
+def test_stream_uses_first_chunk_latency(monkeypatch):
+    monkeypatch.setattr(_scheduler, "LLM_LATENCY_TARGET", 0.05)
+    scheduler = _scheduler_with_limit(8)
+    with scheduler.slot() as call:
+        call.first_chunk()
+        time.sleep(0.1)
+    assert scheduler.counters["decreases"] == 0
+    with scheduler.slot():
+        time.sleep(0.1)
+    assert scheduler.counters["decreases"] == 1
+
+
+def test_sync_slot_on_event_loop_does_not_block_async_holders():
+    scheduler = _scheduler_with_limit(1)
+
+    async def hold(started, release):
+        async with scheduler.aslot():
+            started.set()
+            await release.wait()
+
+    async def main():
+        started, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(started, release))
+        await started.wait()
+        # 名额被 aslot() 占满时在事件循环线程中同步申请，立即失败而不是阻塞循环直到超时
+        begin = time.perf_counter()
+        with pytest.raises(RuntimeError):
+            with scheduler.slot():
+                pass
+        assert time.perf_counter() - begin < 1
+        # 通过线程池调用时正常排队，持有方在循环上归还名额后放行
+        def call_in_thread():
+            with scheduler.slot() as call:
+                return call.wait
+
+        waiter = asyncio.create_task(asyncio.to_thread(call_in_thread))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        release.set()
+        await holder
+        assert await asyncio.wait_for(waiter, 1) > 0
+
+    asyncio.run(main())
+    assert scheduler.in_flight == 0
+    assert _queued(scheduler) == 0
+
+
+def test_sync_slot_on_event_loop_runs_when_a_slot_is_free():
+    scheduler = _scheduler_with_limit(1)
+
+    async def main():
+        with scheduler.slot():
+            assert scheduler.in_flight == 1
+
+    asyncio.run(main())
+    assert scheduler.in_flight == 0
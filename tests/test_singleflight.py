@@ -0,0 +1,108 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asyncio
+import pytest
+from _workflow._singleflight import SingleFlight, LeaderAborted
+
+
+def test_followers_share_leader_result():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*[flights.run("k", work) for _ in range(5)])
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["answer"] * 5
+    assert sum(wait is None for _, wait in results) == 1
+    assert flights.stats()["followers"] == 4
+
+
+def test_followers_run_themselves_when_leader_fails():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        if len(calls) == 1:
+            raise RuntimeError("leader failed")
+        return "retry"
+
+    async def main():
+        leader = asyncio.create_task(flights.run("k", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flights.run("k", work))
+        with pytest.raises(RuntimeError):
+            await leader
+        return await follower
+
+    result, wait = asyncio.run(main())
+    assert result == "retry"
+    assert wait is None
+    assert len(calls) == 2
+    assert flights.stats()["aborted"] == 1
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_follower_falls_back_when_leader_is_cancelled():
+    flights = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(1)
+        return "leader"
+
+    async def fast():
+        return "follower"
+
+    async def main():
+        leader = asyncio.create_task(flights.run("k", slow))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flights.run("k", fast))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    result, wait = asyncio.run(main())
+    assert result == "follower"
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_manual_leader_abort_path():
+    flights = SingleFlight()
+
+    async def main():
+        future = flights.lead("k")
+        flight = flights.join("k")
+        assert flight is future
+        flights.finish("k", future, error=LeaderAborted("stream closed"))
+        with pytest.raises(LeaderAborted):
+            await flights.follow(flight)
+        # 结束后同一个键重新领头
+        assert flights.join("k") is None
+        # 重复 finish 不会覆盖已有的结果
+        flights.finish("k", future, "late")
+        assert isinstance(future.exception(), LeaderAborted)
+
+    asyncio.run(main())
+
+
+def test_lead_without_key_is_not_joinable():
+    flights = SingleFlight()
+
+    async def main():
+        future = flights.lead(None)
+        assert flights.join(None) is None
+        assert flights.stats()["in_flight"] == 0
+        flights.finish(None, future, "done")
+        return future.result()
+
+    assert asyncio.run(main()) == "done"
@@ -0,0 +1,70 @@
+import sys, os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 导入时会创建模型和embedding客户端（不发请求），没有配置密钥时给一个占位值；总结调用在测试中被替换
+os.environ.setdefault("DASHSCOPE_API_KEY", "test")
+import pytest
+from _tools._rag import _summarize
+from _tools._rag._chunker import estimate_tokens
+
+BUDGET = 200
+
+
+@pytest.fixture
+def small_groups(monkeypatch):
+    monkeypatch.setattr(_summarize, "SUMMARY_GROUP_TOKENS", BUDGET)
+    calls = []
+
+    def use(fake):
+        def recorded(system_prompt, text):
+            calls.append(system_prompt)
+            return fake(text)
+        monkeypatch.setattr(_summarize, "_summarize", recorded)
+        return calls
+    return use
+
+
+def _document(parts: int) -> str:
+    return "\n\n".join(f"第{i}段。" + "内容" * 120 for i in range(parts))
+
+
+def test_group_with_min_size_always_merges_pairs():
+    texts = ["字" * 400] * 5
+    groups = _summarize._group(texts, BUDGET, min_size=2)
+    # 每段都超出预算，仍两两合并，最后剩下的单段并入上一组
+    assert [group.count("\n\n") + 1 for group in groups] == [2, 3]
+
+
+def test_group_respects_budget_for_small_texts():
+    texts = ["短文本"] * 10
+    groups = _summarize._group(texts, BUDGET, min_size=2)
+    assert len(groups) == 1
+    assert estimate_tokens(groups[0]) <= BUDGET + len(texts)
+
+
+def test_reduce_terminates_when_partials_do_not_shrink(small_groups):
+    # 每次总结都返回超出预算的长文本，合并永远不会变短
+    calls = small_groups(lambda text: "总结" * BUDGET)
+    result = _summarize.map_reduce_summary(_document(40))
+    reduce_calls = calls.count(_summarize.REDUCE_PROMPT)
+    map_calls = calls.count(_summarize.MAP_PROMPT)
+    assert result["llm_calls"] == len(calls)
+    # 每层组数至少减半，层数不超过上限
+    assert reduce_calls <= map_calls + 1
+    assert result["summary"]
+
+
+def test_reduce_stops_at_max_levels(small_groups, monkeypatch):
+    monkeypatch.setattr(_summarize, "SUMMARY_MAX_LEVELS", 1)
+    calls = small_groups(lambda text: "总结" * BUDGET)
+    _summarize.map_reduce_summary(_document(40))
+    map_calls = calls.count(_summarize.MAP_PROMPT)
+    # 一层合并（组数约为 map 的一半）加最后一次完整合并
+    assert calls.count(_summarize.REDUCE_PROMPT) <= map_calls // 2 + 1
+
+
+def test_reduce_converges_when_partials_are_short(small_groups):
+    calls = small_groups(lambda text: "要点")
+    result = _summarize.map_reduce_summary(_document(20))
+    assert result["summary"] == "要点"
+    # 部分总结足够短时一次合并即可
+    assert calls.count(_summarize.REDUCE_PROMPT) == 1